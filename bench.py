@@ -0,0 +1,181 @@
+# Benchmarks the parser and tools on synthetic files from corpus.py
+# Run as: python bench.py [--scales 100,1000,5000] [--repeat N] [--only parse,dump] [--memory] [--output results.json] [--compare old.json]
+#
+# Every benchmark is run `repeat` times on every scale, the best time is what gets compared.
+# With --compare, benchmarks that got slower than --threshold (relative to the old results) are reported
+# and the exit code is 1, so this can be used to catch regressions.
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import broma
+import corpus
+import diff
+import upgrade2
+
+@dataclass
+class Result:
+    bench: str
+    scale: int # number of classes
+    lines: int
+    best: float # seconds
+    mean: float
+    runs: int
+
+# the inputs of one scale, generated once and shared by all benchmarks
+class Fixture:
+    def __init__(self, scale: int, seed: int) -> None:
+        self.scale = scale
+        self.text = corpus.generate(scale, seed)
+        self.text_v2 = corpus.generate(scale, seed, version=1)
+        self.lines = self.text.count("\n")
+        self.file = broma.Broma(self.text)
+        self.file_v2 = broma.Broma(self.text_v2)
+
+        rng = random.Random(seed)
+        names = [x.name for x in self.file.classes]
+        self.lookups = [rng.choice(names) for _ in range(1000)] + [f"Missing{i}" for i in range(100)]
+
+# benchmarks take the fixture and return the function to time, so their setup isn't measured
+BENCHMARKS = {}
+
+def benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+@benchmark("parse")
+def bench_parse(fx: Fixture):
+    return lambda: broma.Broma(fx.text)
+
+@benchmark("dump")
+def bench_dump(fx: Fixture):
+    return fx.file.dump
+
+@benchmark("sort_everything")
+def bench_sort(fx: Fixture):
+    file = copy.deepcopy(fx.file)
+    return file.sort_everything
+
+@benchmark("find_class")
+def bench_find_class(fx: Fixture):
+    def run():
+        for name in fx.lookups:
+            fx.file.find_class(name)
+
+    return run
+
+@benchmark("diff")
+def bench_diff(fx: Fixture):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            diff.diff(fx.file, fx.file_v2)
+
+    return run
+
+@benchmark("merge")
+def bench_merge(fx: Fixture):
+    # upgrade() modifies the old file
+    old = copy.deepcopy(fx.file)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            upgrade2.upgrade(old, fx.file_v2)
+
+    return run
+
+# bytes kept alive by the source text of the file with every `Broma.source` mode
+def measure_sources(scale: int, seed: int = 0) -> dict[str, int]:
+    text = corpus.generate(scale, seed)
+    return {mode: broma.Broma(text, source=mode).source_size() for mode in broma.SOURCE_MODES}
+
+def run_benchmarks(scales: list[int], names: list[str], repeat: int, seed: int = 0, log=None) -> list[Result]:
+    results = []
+    for scale in scales:
+        fx = Fixture(scale, seed)
+        for name in names:
+            times = []
+            for _ in range(repeat):
+                func = BENCHMARKS[name](fx)
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+
+            result = Result(name, scale, fx.lines, min(times), statistics.mean(times), repeat)
+            results.append(result)
+            if log:
+                log(result)
+
+    return results
+
+# (bench, scale, old best, new best) for every benchmark that got slower by more than `threshold`
+def compare(old: list[dict], new: list[Result], threshold: float) -> list[tuple[str, int, float, float]]:
+    old_best = {(x["bench"], x["scale"]): x["best"] for x in old}
+    out = []
+    for result in new:
+        before = old_best.get((result.bench, result.scale))
+        if before is not None and result.best > before * (1 + threshold):
+            out.append((result.bench, result.scale, before, result.best))
+
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the broma tools on generated files")
+    parser.add_argument("--scales", default="100,1000,5000", help="comma separated class counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="comma separated benchmarks, out of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as json")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run to compare against")
+    parser.add_argument("--memory", action="store_true", help="also measure how much memory each source mode keeps per file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown that counts as a regression (default 10%%)")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    scales = [int(x) for x in args.scales.split(",")]
+
+    def log(result: Result):
+        print(f"{result.bench:<16} {result.scale:>6} classes {result.lines:>8} lines  best {result.best * 1000:9.2f}ms  mean {result.mean * 1000:9.2f}ms")
+
+    results = run_benchmarks(scales, names, args.repeat, args.seed, log)
+
+    memory = []
+    if args.memory:
+        for scale in scales:
+            sizes = measure_sources(scale, args.seed)
+            memory.append({"scale": scale, **sizes})
+            saved = ", ".join(f"{mode} saves {(sizes['lines'] - size) / 1024:.0f}KiB" for mode, size in sizes.items() if mode != "lines")
+            print(f"{'source':<16} {scale:>6} classes  lines keeps {sizes['lines'] / 1024:.0f}KiB, {saved}")
+
+    if args.output:
+        meta = {"python": platform.python_version(), "machine": platform.machine(), "repeat": args.repeat, "seed": args.seed}
+        args.output.write_text(json.dumps({"meta": meta, "results": [asdict(x) for x in results], "memory": memory}, indent=4))
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text())["results"], results, args.threshold)
+        for bench, scale, before, after in regressions:
+            print(f"REGRESSION: {bench} at {scale} classes: {before * 1000:.2f}ms -> {after * 1000:.2f}ms ({after / before - 1:+.0%})")
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
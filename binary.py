@@ -0,0 +1,311 @@
+# Compact binary format for parsed broma files, loads much faster than parsing the text again
+# Use through `broma.save_binary(file, path)` and `broma.load_binary(path)`, or `python cli.py compile <files...>`
+#
+# Layout (all integers are unsigned LEB128 varints):
+#   magic "BROB", format version (1 byte)
+#   string table: count, then (byte length, utf-8 bytes) per string, most used first so their indices take one byte
+#   payload: the tree, where every string is an index into the table
+# In the payload, nullable values are stored as value + 1 with 0 meaning None, and lines (which are -1 when
+# unknown) as line + 1. Classes can also be encoded on their own with `dump_class`/`load_class`, with their
+# own string table.
+
+from __future__ import annotations
+
+import gc
+import re
+from pathlib import Path
+
+import broma
+
+MAGIC = b"BROB"
+VERSION = 1
+
+TAG_FUNCTION = 0
+TAG_MEMBER = 1
+TAG_PAD = 2
+TAG_COMMENT = 3
+TAG_PLATFORM_BLOCK = 4
+
+class Writer:
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        # string references are kept as -(id + 1) until `finish`, which gives the most used strings the smallest ids
+        self.values: list[int] = []
+        self.uint = self.values.append
+
+    def str(self, value: str):
+        idx = self.strings.get(value)
+        if idx is None:
+            idx = self.strings[value] = len(self.strings)
+        self.values.append(-idx - 1)
+
+    def optional_str(self, value: str | None):
+        if value is None:
+            self.uint(0)
+        else:
+            self.uint(1)
+            self.str(value)
+
+    def str_list(self, values: list[str]):
+        self.uint(len(values))
+        for value in values:
+            self.str(value)
+
+    def line(self, line: int):
+        self.uint(line + 1)
+
+    def function(self, func: broma.BromaFunction):
+        self.str(func.name)
+        self.optional_str(func.inlined_body)
+        self.str_list(func.attrs)
+        self.uint(len(func.args))
+        for type, name in func.args:
+            self.str(type)
+            self.str(name)
+        self.str(func.ret_type)
+        self.uint(len(func.binds))
+        for platform, offset in func.binds.items():
+            self.str(platform)
+            self.uint(0 if offset is None else offset + 1)
+        self.str(func.qualifier)
+        self.str_list(func.cpp_attrs)
+        self.str(func.inline_comment)
+        self.line(func.line)
+
+    def part(self, part):
+        if isinstance(part, broma.BromaFunction):
+            self.uint(TAG_FUNCTION)
+            self.function(part)
+        elif isinstance(part, broma.BromaMember):
+            self.uint(TAG_MEMBER)
+            self.str(part.type)
+            self.str(part.name)
+            self.str_list(part.cpp_attributes)
+            self.str(part.inline_comment)
+            self.line(part.line)
+        elif isinstance(part, broma.BromaPad):
+            self.uint(TAG_PAD)
+            self.uint(len(part.platforms))
+            for platform, size in part.platforms.items():
+                self.str(platform)
+                self.uint(size)
+            self.line(part.line)
+        elif isinstance(part, broma.BromaComment):
+            self.uint(TAG_COMMENT)
+            self.optional_str(part.data)
+            self.uint(int(part.force_multiline))
+            self.line(part.line)
+        elif isinstance(part, broma.BromaPlatformBlock):
+            self.uint(TAG_PLATFORM_BLOCK)
+            self.str_list(part.platforms)
+            self.str(part.code)
+            self.line(part.line)
+        else:
+            raise TypeError(f"can't serialize {type(part).__name__}")
+
+    def cls(self, cls: broma.BromaClass):
+        self.str(cls.name)
+        self.str_list(cls.attributes)
+        self.str_list(cls.bases)
+        self.line(cls.start_line)
+        self.line(cls.end_line)
+        self.uint(len(cls.parts))
+        for part in cls.parts:
+            self.part(part)
+
+    def file(self, file: broma.Broma):
+        self.str(file.preamble)
+        self.uint(file.line_count)
+        self.uint(len(file.classes))
+        for cls in file.classes:
+            self.cls(cls)
+        self.uint(len(file.global_functions))
+        for func in file.global_functions:
+            self.function(func)
+
+    # header, string table and payload
+    def finish(self) -> bytes:
+        uses = [0] * len(self.strings)
+        for value in self.values:
+            if value < 0:
+                uses[-value - 1] += 1
+
+        order = sorted(range(len(self.strings)), key=lambda x: -uses[x])
+        new_ids = [0] * len(order)
+        for new_id, old_id in enumerate(order):
+            new_ids[old_id] = new_id
+
+        strings = list(self.strings)
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        _write_uint(out, len(strings))
+        for old_id in order:
+            encoded = strings[old_id].encode("utf-8")
+            _write_uint(out, len(encoded))
+            out += encoded
+
+        for value in self.values:
+            _write_uint(out, new_ids[-value - 1] if value < 0 else value)
+
+        return bytes(out)
+
+def _write_uint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+# splits a buffer of varints around the ones that take more than one byte
+_LONG_VARINTS = re.compile(rb"([\x80-\xff]+[\x00-\x7f])")
+
+# decodes a buffer of varints. Most of them are a single byte, those are copied over as they are
+def decode_uints(data: bytes) -> list[int]:
+    chunks = _LONG_VARINTS.split(data)
+    out = list(chunks[0])
+
+    for idx in range(1, len(chunks), 2):
+        varint = chunks[idx]
+        if len(varint) == 2:
+            out.append((varint[0] & 0x7f) | varint[1] << 7)
+        elif len(varint) == 3:
+            out.append((varint[0] & 0x7f) | (varint[1] & 0x7f) << 7 | varint[2] << 14)
+        else:
+            value = 0
+            for shift, byte in enumerate(varint):
+                value |= (byte & 0x7f) << (shift * 7)
+            out.append(value)
+
+        out += chunks[idx + 1]
+
+    return out
+
+class Reader:
+    def __init__(self, data: bytes) -> None:
+        if data[:4] != MAGIC:
+            raise ValueError("not a binary broma file")
+        if data[4] != VERSION:
+            raise ValueError(f"unsupported binary broma version {data[4]}, expected {VERSION}")
+
+        # the string table has raw bytes in it, so read it first
+        pos = 5
+        count, pos = _read_uint(data, pos)
+        self.strings = []
+        for _ in range(count):
+            length, pos = _read_uint(data, pos)
+            self.strings.append(str(data[pos:pos + length], "utf-8"))
+            pos += length
+
+        # the rest is only varints
+        self.next = iter(decode_uints(data[pos:])).__next__
+
+    def str_list(self) -> list[str]:
+        strings, next = self.strings, self.next
+        return [strings[next()] for _ in range(next())]
+
+    def function(self) -> broma.BromaFunction:
+        strings, next = self.strings, self.next
+
+        name = strings[next()]
+        inlined_body = strings[next()] if next() else None
+        attrs = [strings[next()] for _ in range(next())]
+        args = [(strings[next()], strings[next()]) for _ in range(next())]
+        ret_type = strings[next()]
+        binds = {}
+        for _ in range(next()):
+            platform = strings[next()]
+            offset = next()
+            binds[platform] = offset - 1 if offset else None
+        qualifier = strings[next()]
+        cpp_attrs = [strings[next()] for _ in range(next())]
+        inline_comment = strings[next()]
+
+        func = broma.BromaFunction(name, inlined_body, attrs, args, ret_type, binds, qualifier, cpp_attrs, inline_comment)
+        line = next() - 1
+        if line != -1:
+            func.line = line
+        return func
+
+    def part(self):
+        return self.tagged_part(self.next())
+
+    def tagged_part(self, tag: int):
+        strings, next = self.strings, self.next
+
+        if tag == TAG_FUNCTION:
+            return self.function()
+        if tag == TAG_MEMBER:
+            type, name = strings[next()], strings[next()]
+            return broma.BromaMember(type, name, self.str_list(), strings[next()], next() - 1)
+        if tag == TAG_PAD:
+            platforms = {}
+            for _ in range(next()):
+                platform = strings[next()]
+                platforms[platform] = next()
+            return broma.BromaPad(platforms, next() - 1)
+        if tag == TAG_COMMENT:
+            data = strings[next()] if next() else None
+            return broma.BromaComment(data, bool(next()), next() - 1)
+        if tag == TAG_PLATFORM_BLOCK:
+            platforms = self.str_list()
+            return broma.BromaPlatformBlock(platforms, strings[next()], next() - 1)
+
+        raise ValueError(f"unknown part tag {tag}")
+
+    def cls(self) -> broma.BromaClass:
+        next = self.next
+        name = self.strings[next()]
+        attributes = self.str_list()
+        bases = self.str_list()
+        start_line = next() - 1
+        end_line = next() - 1
+        parts = [self.part() for _ in range(next())]
+        return broma.BromaClass(name, attributes, parts, bases, start_line, end_line)
+
+    def file(self) -> broma.Broma:
+        next = self.next
+        out = broma.Broma("", source="none")
+        out.preamble = self.strings[next()]
+        out.line_count = next()
+        out.classes = [self.cls() for _ in range(next())]
+        out.global_functions = [self.function() for _ in range(next())]
+        return out
+
+def _read_uint(data: bytes, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def dumps(file: broma.Broma) -> bytes:
+    writer = Writer()
+    writer.file(file)
+    return writer.finish()
+
+def loads(data: bytes) -> broma.Broma:
+    # the collector would otherwise run over and over while all these objects are created
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return Reader(data).file()
+    finally:
+        if enabled:
+            gc.enable()
+
+def dump_class(cls: broma.BromaClass) -> bytes:
+    writer = Writer()
+    writer.cls(cls)
+    return writer.finish()
+
+def load_class(data: bytes) -> broma.BromaClass:
+    return Reader(data).cls()
+
+def save(file: broma.Broma, path: Path | str):
+    Path(path).write_bytes(dumps(file))
+
+def load(path: Path | str) -> broma.Broma:
+    return loads(Path(path).read_bytes())
@@ -0,0 +1,140 @@
+# Checks the offsets of all functions at once: duplicates, functions too close together, offsets far away from
+# all others (usually a typo), offsets outside of the binary and misaligned offsets
+# Run as: python cli.py check-binds <files...> [--align m1=4] [--range win=0x1000:0x800000] [--json]
+#
+# The offsets of every platform are put in one sorted column (see offsets.py) and checked with whole-column
+# operations, with NumPy when it's available.
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import broma
+import offsets
+
+np = offsets.np
+
+# functions on these platforms have to start at a multiple of this (arm64 instructions are 4 bytes, thumb ones 2)
+DEFAULT_ALIGNMENT = {"m1": 4, "ios": 4, "android64": 4, "android32": 2}
+
+# two functions closer than this are probably the same function bound twice with a typo
+MIN_DISTANCE = 4
+
+# an offset that's further than this from every other offset is probably a typo
+MAX_GAP = 0x1000000
+
+@dataclass
+class BindIssue:
+    kind: str # "duplicate", "too-close", "outlier", "out-of-range" or "misaligned"
+    platform: str
+    offset: int
+    functions: list[str] # `Class::function`
+    lines: list[int] = field(default_factory=list) # 0-based, -1 if unknown
+    message: str = ""
+
+    def format(self) -> str:
+        return f"{self.platform} {hex(self.offset)}: {self.message} [{self.kind}]"
+
+@dataclass
+class BindReport:
+    issues: list[BindIssue] = field(default_factory=list)
+    checked: int = 0 # number of offsets
+
+    def by_kind(self) -> dict[str, int]:
+        out = {}
+        for issue in self.issues:
+            out[issue.kind] = out.get(issue.kind, 0) + 1
+        return out
+
+# indices into the sorted offsets of each problem, computed on whole columns
+def _find_numpy(offs, start: int | None, end: int | None, align: int, min_distance: int, max_gap: int) -> dict[str, list[int]]:
+    out = {}
+    diff = np.diff(offs)
+
+    # the first entry of every run of equal offsets
+    same = diff == 0
+    out["duplicate"] = np.flatnonzero(same & ~np.concatenate(([False], same[:-1]))).tolist()
+    out["too-close"] = np.flatnonzero((diff > 0) & (diff < min_distance)).tolist()
+
+    if len(offs) > 2:
+        before = np.concatenate(([max_gap + 1], diff))
+        after = np.concatenate((diff, [max_gap + 1]))
+        out["outlier"] = np.flatnonzero((before > max_gap) & (after > max_gap)).tolist()
+
+    outside = np.zeros(len(offs), dtype=bool)
+    if start is not None:
+        outside |= offs < start
+    if end is not None:
+        outside |= offs >= end
+    out["out-of-range"] = np.flatnonzero(outside).tolist()
+
+    if align > 1:
+        out["misaligned"] = np.flatnonzero(offs % align != 0).tolist()
+
+    return out
+
+def _find_python(offs: list[int], start: int | None, end: int | None, align: int, min_distance: int, max_gap: int) -> dict[str, list[int]]:
+    out = {}
+    diff = [b - a for a, b in zip(offs, offs[1:])]
+
+    out["duplicate"] = [i for i, d in enumerate(diff) if d == 0 and (i == 0 or diff[i - 1] != 0)]
+    out["too-close"] = [i for i, d in enumerate(diff) if 0 < d < min_distance]
+
+    if len(offs) > 2:
+        gaps = [max_gap + 1] + diff + [max_gap + 1]
+        out["outlier"] = [i for i in range(len(offs)) if gaps[i] > max_gap and gaps[i + 1] > max_gap]
+
+    out["out-of-range"] = [i for i, x in enumerate(offs) if (start is not None and x < start) or (end is not None and x >= end)]
+
+    if align > 1:
+        out["misaligned"] = [i for i, x in enumerate(offs) if x % align]
+
+    return out
+
+def check_store(store: offsets.OffsetStore, alignment: dict[str, int] | None = None, ranges: dict[str, tuple[int, int]] | None = None,
+                min_distance: int = MIN_DISTANCE, max_gap: int = MAX_GAP) -> BindReport:
+    alignment = DEFAULT_ALIGNMENT if alignment is None else alignment
+    ranges = ranges or {}
+    report = BindReport(checked=store.count())
+
+    for platform in sorted(store.columns):
+        column = store.columns[platform]
+        start, end = ranges.get(platform, (None, None))
+
+        if np is not None:
+            order = np.argsort(column.offsets, kind="stable")
+            offs = column.offsets[order]
+            found = _find_numpy(offs, start, end, alignment.get(platform, 1), min_distance, max_gap)
+            ids, offs = column.ids[order].tolist(), offs.tolist()
+        else:
+            pairs = sorted(zip(column.offsets, column.ids))
+            offs, ids = [x for x, _ in pairs], [x for _, x in pairs]
+            found = _find_python(offs, start, end, alignment.get(platform, 1), min_distance, max_gap)
+
+        def issue(kind: str, idx: list[int], message: str):
+            report.issues.append(BindIssue(
+                kind, platform, offs[idx[0]], [store.names[ids[x]] for x in idx], [store.functions[ids[x]].line for x in idx], message,
+            ))
+
+        for i in found["duplicate"]:
+            run = [i]
+            while run[-1] + 1 < len(offs) and offs[run[-1] + 1] == offs[i]:
+                run.append(run[-1] + 1)
+            issue("duplicate", run, f"{', '.join(store.names[ids[x]] for x in run)} are bound to the same address")
+
+        for i in found["too-close"]:
+            issue("too-close", [i, i + 1], f"{store.names[ids[i]]} and {store.names[ids[i + 1]]} are only {offs[i + 1] - offs[i]} bytes apart")
+
+        for i in found.get("outlier", []):
+            issue("outlier", [i], f"{store.names[ids[i]]} is more than {hex(max_gap)} away from any other function")
+
+        for i in found["out-of-range"]:
+            issue("out-of-range", [i], f"{store.names[ids[i]]} is outside of {hex(start or 0)}..{hex(end) if end is not None else ''}")
+
+        for i in found.get("misaligned", []):
+            issue("misaligned", [i], f"{store.names[ids[i]]} is not aligned to {alignment[platform]} bytes")
+
+    return report
+
+def check_file(file: broma.Broma, **kwargs) -> BindReport:
+    return check_store(offsets.OffsetStore.from_file(file), **kwargs)
@@ -0,0 +1,395 @@
+# Checks that bound offsets point at function starts in a local copy of the game binary
+# Run as: python cli.py verify-binds <files...> --binary win=GeometryDash.exe --binary android64=libcocos2dcpp.so [-j jobs]
+#
+# The binary (PE, ELF or Mach-O, thin or fat) is memory mapped and its section headers are read to map offsets,
+# which are relative to the image base, to file positions. An offset is reported when it isn't inside any section,
+# isn't inside an executable section, or when the code there doesn't look like the start of a function.
+# Offsets the binary itself lists as function starts are always fine: ELF symbols and `.eh_frame` entries, `.pdata`
+# entries of x64 PE files and LC_FUNCTION_STARTS of Mach-O files. Anything else has to start with a common prologue,
+# and on x86 the instruction before it has to end right at the offset (padding, a return or a jump). That part is a
+# heuristic: it misses some bad offsets and can flag unusual real function starts.
+# Every platform is checked in its own worker process.
+
+from __future__ import annotations
+
+import mmap
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import broma
+import offsets
+
+@dataclass
+class Section:
+    name: str
+    start: int # relative to the image base
+    end: int
+    file_offset: int # position of `start` in the file
+    file_size: int # bytes of the section that are in the file
+    executable: bool
+
+@dataclass
+class Image:
+    format: str # "pe", "elf" or "macho"
+    arch: str # "x86", "x86_64", "arm", "arm64"
+    sections: list[Section] = field(default_factory=list)
+    function_starts: set[int] = field(default_factory=set) # offsets the binary says functions start at
+
+    def find_section(self, offset: int) -> Section | None:
+        for section in self.sections:
+            if section.start <= offset < section.end:
+                return section
+        return None
+
+    # where an offset is in the file, None if it isn't in the file
+    def file_position(self, offset: int) -> int | None:
+        section = self.find_section(offset)
+        if section is None or offset - section.start >= section.file_size:
+            return None
+        return section.file_offset + offset - section.start
+
+@dataclass
+class SuspiciousBind:
+    platform: str
+    symbol: str
+    offset: int
+    reason: str
+    line: int = -1
+
+    def format(self) -> str:
+        return f"{self.platform} {hex(self.offset)} {self.symbol}: {self.reason}"
+
+PE_MACHINES = {0x14c: "x86", 0x8664: "x86_64", 0xaa64: "arm64", 0x1c4: "arm"}
+ELF_MACHINES = {3: "x86", 0x3e: "x86_64", 0x28: "arm", 0xb7: "arm64"}
+MACHO_CPUS = {7: "x86", 0x01000007: "x86_64", 12: "arm", 0x0100000c: "arm64"}
+
+# which slice of a fat Mach-O to use for a platform
+PLATFORM_ARCHS = {"imac": "x86_64", "mac": "x86_64", "m1": "arm64", "ios": "arm64", "android32": "arm", "android64": "arm64"}
+
+# LEB128 numbers, as used by DWARF and LC_FUNCTION_STARTS. Returns the value and the position after it
+def _leb(data: mmap.mmap, pos: int, signed: bool = False) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    if signed and byte & 0x40:
+        value -= 1 << shift
+    return value, pos
+
+# a DW_EH_PE_* encoded pointer at `pos`, `delta` turns file positions into addresses for pc relative ones.
+# Returns the value and the position after it
+def _read_eh_pointer(data: mmap.mmap, pos: int, encoding: int, delta: int, endian: str, is_64: bool) -> tuple[int, int]:
+    kind = encoding & 0x0f
+    if kind in (0x1, 0x9): # uleb128, sleb128
+        value, end = _leb(data, pos, kind == 0x9)
+    else:
+        code = {0x0: "Q" if is_64 else "I", 0x2: "H", 0x3: "I", 0x4: "Q", 0xa: "h", 0xb: "i", 0xc: "q"}[kind]
+        value = struct.unpack_from(endian + code, data, pos)[0]
+        end = pos + struct.calcsize(code)
+
+    if encoding & 0x70 == 0x10: # pc relative
+        value += pos + delta
+    return value & (0xffffffffffffffff if is_64 else 0xffffffff), end
+
+# the encoding of the function start pointers in the FDEs of the CIE that starts at `pos` (after its id)
+def _cie_pointer_encoding(data: mmap.mmap, pos: int, endian: str, is_64: bool) -> int:
+    version = data[pos]
+    end = data.find(b"\0", pos + 1)
+    augmentation = data[pos + 1:end]
+    if not augmentation.startswith(b"z"):
+        return 0
+
+    pos = _leb(data, end + 1)[1] # code alignment
+    pos = _leb(data, pos)[1] # data alignment
+    pos = pos + 1 if version == 1 else _leb(data, pos)[1] # return address register
+    pos = _leb(data, pos)[1] # augmentation data length
+    for char in augmentation[1:]:
+        if char == ord("R"):
+            return data[pos]
+        if char == ord("P"):
+            pos = _read_eh_pointer(data, pos + 1, data[pos], 0, endian, is_64)[1]
+        elif char == ord("L"):
+            pos += 1
+    return 0
+
+# where the functions described by an `.eh_frame` section start
+def _eh_frame_starts(data: mmap.mmap, section: Section, endian: str, is_64: bool) -> set[int]:
+    out = set()
+    encodings = {} # position of a CIE -> its pointer encoding
+    pos = section.file_offset
+    end = section.file_offset + section.file_size
+    delta = section.start - section.file_offset
+    while pos + 8 <= end:
+        length, cie = struct.unpack_from(endian + "II", data, pos)
+        # a zero length ends the section, 64-bit lengths aren't used by .eh_frame in practice
+        if length in (0, 0xffffffff):
+            break
+
+        if cie == 0:
+            encodings[pos] = _cie_pointer_encoding(data, pos + 8, endian, is_64)
+        elif (encoding := encodings.get(pos + 4 - cie)) is not None: # the CIE pointer is relative to itself
+            out.add(_read_eh_pointer(data, pos + 8, encoding, delta, endian, is_64)[0])
+        pos += 4 + length
+
+    return out
+
+def _read_pe(data: mmap.mmap) -> Image:
+    pe = struct.unpack_from("<I", data, 0x3c)[0]
+    if data[pe:pe + 4] != b"PE\0\0":
+        raise ValueError("invalid PE signature")
+
+    machine, section_count = struct.unpack_from("<HH", data, pe + 4)
+    optional_size = struct.unpack_from("<H", data, pe + 20)[0]
+    image = Image("pe", PE_MACHINES.get(machine, hex(machine)))
+
+    table = pe + 24 + optional_size
+    for idx in range(section_count):
+        name, virtual_size, address, raw_size, raw_offset = struct.unpack_from("<8sIIII", data, table + idx * 40)
+        flags = struct.unpack_from("<I", data, table + idx * 40 + 36)[0]
+        image.sections.append(Section(
+            name.rstrip(b"\0").decode("latin-1"), address, address + max(virtual_size, raw_size), raw_offset,
+            min(raw_size, virtual_size or raw_size), bool(flags & 0x20000000), # IMAGE_SCN_MEM_EXECUTE
+        ))
+
+    # x64 files list every function that isn't a leaf in the exception directory (.pdata)
+    magic = struct.unpack_from("<H", data, pe + 24)[0]
+    directories = pe + 24 + (112 if magic == 0x20b else 96)
+    if image.arch == "x86_64" and optional_size and struct.unpack_from("<I", data, directories - 4)[0] > 3:
+        address, size = struct.unpack_from("<II", data, directories + 3 * 8)
+        table = image.file_position(address)
+        for idx in range(size // 12 if table is not None else 0):
+            begin, _, unwind = struct.unpack_from("<III", data, table + idx * 12)
+            unwind_pos = image.file_position(unwind)
+            # chained entries are the cold parts of a function, not its start
+            if unwind_pos is not None and not (data[unwind_pos] >> 3) & 0x4: # UNW_FLAG_CHAININFO
+                image.function_starts.add(begin)
+
+    return image
+
+def _read_elf(data: mmap.mmap) -> Image:
+    is_64 = data[4] == 2
+    endian = "<" if data[5] == 1 else ">"
+    machine = struct.unpack_from(endian + "H", data, 0x12)[0]
+    image = Image("elf", ELF_MACHINES.get(machine, hex(machine)))
+
+    if is_64:
+        shoff = struct.unpack_from(endian + "Q", data, 0x28)[0]
+        entsize, count, names = struct.unpack_from(endian + "HHH", data, 0x3a)
+        header = endian + "IIQQQQIIQQ"
+        symbol, symbol_fields = endian + "IBBHQQ", (4, 1) # value, info
+    else:
+        shoff = struct.unpack_from(endian + "I", data, 0x20)[0]
+        entsize, count, names = struct.unpack_from(endian + "HHH", data, 0x2e)
+        header = endian + "IIIIIIIIII"
+        symbol, symbol_fields = endian + "IIIBBH", (1, 3)
+
+    headers = [struct.unpack_from(header, data, shoff + idx * entsize) for idx in range(count)]
+    name_offset = headers[names][4] if names < count else None
+    for idx, (name, kind, flags, address, offset, size, *_, symbol_size) in enumerate(headers):
+        if kind in (2, 11): # SHT_SYMTAB, SHT_DYNSYM
+            for pos in range(offset, offset + size, symbol_size or struct.calcsize(symbol)):
+                fields = struct.unpack_from(symbol, data, pos)
+                value, info = fields[symbol_fields[0]], fields[symbol_fields[1]]
+                if info & 0xf == 2 and value: # STT_FUNC
+                    image.function_starts.add(value & ~1 if image.arch == "arm" else value)
+
+        # only sections that are loaded (SHF_ALLOC) matter, SHT_NOBITS ones have nothing in the file
+        if not flags & 0x2 or not address:
+            continue
+
+        section = Section(f"#{idx}", address, address + size, offset, 0 if kind == 8 else size, bool(flags & 0x4))
+        if name_offset is not None:
+            section.name = data[name_offset + name:data.find(b"\0", name_offset + name)].decode("latin-1")
+        if section.name == ".eh_frame":
+            image.function_starts |= _eh_frame_starts(data, section, endian, is_64)
+        image.sections.append(section)
+
+    return image
+
+def _read_macho_slice(data: mmap.mmap, base: int) -> Image:
+    magic = struct.unpack_from("<I", data, base)[0]
+    if magic not in (0xfeedfacf, 0xfeedface):
+        raise ValueError("only little endian Mach-O files are supported")
+
+    is_64 = magic == 0xfeedfacf
+    cpu, _, _, command_count = struct.unpack_from("<iiII", data, base + 4)
+    image = Image("macho", MACHO_CPUS.get(cpu & 0xffffffff, hex(cpu)))
+
+    pos = base + (32 if is_64 else 28)
+    text_base = 0
+    for _ in range(command_count):
+        command, size = struct.unpack_from("<II", data, pos)
+        if command in (0x19, 0x1): # LC_SEGMENT_64, LC_SEGMENT
+            if is_64:
+                segment, vmaddr, _, _, _, _, _, section_count, _ = struct.unpack_from("<16sQQQQiiII", data, pos + 8)
+                section_pos, section_format, section_size = pos + 72, "<16s16sQQIIIIIIII", 80
+            else:
+                segment, vmaddr, _, _, _, _, _, section_count, _ = struct.unpack_from("<16sIIIIiiII", data, pos + 8)
+                section_pos, section_format, section_size = pos + 56, "<16s16sIIIIIIIIII", 68
+
+            if segment.rstrip(b"\0") == b"__TEXT":
+                text_base = vmaddr
+
+            for idx in range(section_count):
+                name, _, address, length, offset, _, _, _, flags, *_ = struct.unpack_from(section_format, data, section_pos + idx * section_size)
+                zerofill = flags & 0xff in (0x1, 0xc) # S_ZEROFILL, S_GB_ZEROFILL
+                executable = bool(flags & 0x80000400) # S_ATTR_PURE_INSTRUCTIONS | S_ATTR_SOME_INSTRUCTIONS
+                image.sections.append(Section(name.rstrip(b"\0").decode("latin-1"), address, address + length, base + offset, 0 if zerofill else length, executable))
+        elif command == 0x26: # LC_FUNCTION_STARTS, uleb128 distances between starts, from the start of __TEXT
+            data_offset, data_size = struct.unpack_from("<II", data, pos + 8)
+            start = 0
+            item = base + data_offset
+            while item < base + data_offset + data_size:
+                delta, item = _leb(data, item)
+                if not delta:
+                    break
+                start += delta
+                image.function_starts.add(start & ~1 if image.arch == "arm" else start)
+
+        pos += size
+
+    # offsets are relative to the start of __TEXT
+    for section in image.sections:
+        section.start -= text_base
+        section.end -= text_base
+
+    return image
+
+def _read_macho(data: mmap.mmap, arch: str | None) -> Image:
+    if struct.unpack_from(">I", data, 0)[0] != 0xcafebabe:
+        return _read_macho_slice(data, 0)
+
+    slices = {}
+    for idx in range(struct.unpack_from(">I", data, 4)[0]):
+        cpu, _, offset, _, _ = struct.unpack_from(">iiIII", data, 8 + idx * 20)
+        slices[MACHO_CPUS.get(cpu & 0xffffffff, hex(cpu))] = offset
+
+    if arch not in slices:
+        raise ValueError(f"no {arch} slice in the fat binary, it has: {', '.join(slices)}")
+
+    return _read_macho_slice(data, slices[arch])
+
+def read_image(data: mmap.mmap, platform: str = "") -> Image:
+    head = data[:4]
+    if head[:2] == b"MZ":
+        return _read_pe(data)
+    if head == b"\x7fELF":
+        return _read_elf(data)
+    if head in (b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe", b"\xca\xfe\xba\xbe"):
+        return _read_macho(data, PLATFORM_ARCHS.get(platform))
+
+    raise ValueError("unknown executable format")
+
+# first bytes of common function starts: pushes, stack allocations, endbr, and jumps for thunks
+PROLOGUES = {
+    "x86": (
+        b"\x55", b"\x53", b"\x56", b"\x57", b"\x51", b"\x6a\xff", b"\x83\xec", b"\x81\xec", b"\x8b\xff",
+        b"\xf3\x0f\x1e\xfb", b"\xe9", b"\xff\x25",
+    ),
+    "x86_64": (
+        b"\x55", b"\x53", b"\x56", b"\x57", b"\x48\x89\x5c\x24", b"\x48\x89\x4c\x24", b"\x48\x89\x54\x24",
+        b"\x48\x89\x74\x24", b"\x48\x89\x7c\x24", b"\x48\x83\xec", b"\x48\x81\xec", b"\x48\x8b\xc4", b"\x4c\x8b\xdc",
+        b"\x40\x53", b"\x40\x55", b"\x40\x56", b"\x40\x57", b"\x41\x54", b"\x41\x55", b"\x41\x56", b"\x41\x57",
+        b"\xf3\x0f\x1e\xfa", b"\xe9", b"\xff\x25",
+    ),
+}
+
+# instructions that end a function or pad between two: int3, nop, ret, ud2 and the multi-byte nops compilers use
+X86_ENDINGS = (
+    b"\xcc", b"\x90", b"\xc3", b"\x0f\x0b", b"\x0f\x1f\x00", b"\x0f\x1f\x40\x00", b"\x0f\x1f\x44\x00\x00",
+    b"\x66\x0f\x1f\x44\x00\x00", b"\x0f\x1f\x80\x00\x00\x00\x00", b"\x0f\x1f\x84\x00\x00\x00\x00\x00",
+    b"\x66\x2e\x0f\x1f\x84\x00\x00\x00\x00\x00",
+)
+# and the ones with an operand, with their length: ret imm16, jmp rel8, jmp rel32 and jmp [rip + disp32]
+X86_ENDING_OPCODES = ((b"\xc2", 3), (b"\xeb", 2), (b"\xe9", 5), (b"\xff\x25", 6))
+
+# `section_pos` is where the section `pos` is in starts
+def _looks_like_function(data: mmap.mmap, pos: int, arch: str, section_pos: int = 0) -> bool:
+    if arch in ("x86", "x86_64"):
+        if not data[pos:pos + 4].startswith(PROLOGUES[arch]):
+            return False
+        if pos == section_pos:
+            return True
+        # the instruction right before has to end at `pos`: padding or the end of the previous function
+        before = data[max(pos - 10, section_pos):pos]
+        return before.endswith(X86_ENDINGS) or any(before[-size:][:len(opcode)] == opcode for opcode, size in X86_ENDING_OPCODES if len(before) >= size)
+
+    if arch == "arm64":
+        insn = struct.unpack_from("<I", data, pos)[0]
+        return (
+            insn & 0xffc003e0 == 0xa98003e0 # stp xN, xM, [sp, #-n]!
+            or insn & 0xff0003ff == 0xd10003ff # sub sp, sp, #n
+            or insn in (0xd503233f, 0xd503237f, 0xd503201f) # paciasp, pacibsp, nop
+            or insn & 0xfc000000 == 0x14000000 # b (thunks)
+            or insn & 0x9f00001f == 0x90000010 # adrp x16 (stubs)
+        )
+
+    if arch == "arm":
+        half = struct.unpack_from("<H", data, pos)[0]
+        word = struct.unpack_from("<I", data, pos)[0]
+        return (
+            half & 0xff00 in (0xb500, 0xb400) # thumb push {..., lr} / push {...}
+            or half == 0xe92d # thumb push.w
+            or half & 0xff80 == 0xb080 # thumb sub sp
+            or word & 0xffff0000 == 0xe92d0000 # arm push
+            or word & 0xfffff000 == 0xe24dd000 # arm sub sp
+        )
+
+    return True
+
+# checks (symbol, offset, line) binds of one platform against the binary at `path`
+def verify_platform(platform: str, path: Path | str, binds: list[tuple[str, int, int]]) -> list[SuspiciousBind]:
+    out = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        image = read_image(data, platform)
+
+        for symbol, offset, line in binds:
+            address = offset & ~1 if image.arch == "arm" else offset # thumb bit
+            section = image.find_section(address)
+
+            if section is None:
+                reason = "not inside any section"
+            elif not section.executable:
+                reason = f"inside {section.name}, which is not executable"
+            elif address - section.start + 4 > section.file_size:
+                reason = f"inside {section.name}, but not in the file"
+            elif address in image.function_starts:
+                continue
+            elif not _looks_like_function(data, section.file_offset + address - section.start, image.arch, section.file_offset):
+                reason = "doesn't look like the start of a function"
+            else:
+                continue
+
+            out.append(SuspiciousBind(platform, symbol, offset, reason, line))
+
+    return out
+
+def _verify(args: tuple) -> list[SuspiciousBind]:
+    return verify_platform(*args)
+
+# binary paths by platform. Returns the suspicious binds and how many binds were checked per platform
+def verify(files: list[broma.Broma], binaries: dict[str, Path], jobs: int = 0) -> tuple[list[SuspiciousBind], dict[str, int]]:
+    binds: dict[str, list[tuple[str, int, int]]] = {x: [] for x in binaries}
+    for file in files:
+        store = offsets.OffsetStore.from_file(file)
+        for platform, column in store.columns.items():
+            if platform in binds:
+                binds[platform] += [
+                    (store.names[func_id], offset, store.functions[func_id].line)
+                    for func_id, offset in zip(column.ids.tolist(), column.offsets.tolist())
+                ]
+
+    work = [(platform, binaries[platform], binds[platform]) for platform in binaries]
+    if jobs == 1 or len(work) < 2:
+        results = [_verify(x) for x in work]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs or len(work)) as pool:
+            results = list(pool.map(_verify, work))
+
+    return [x for result in results for x in result], {platform: len(x) for platform, x in binds.items()}
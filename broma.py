@@ -2,7 +2,15 @@ from __future__ import annotations
 
 from pathlib import Path
 from dataclasses import dataclass, field
+from typing import Iterable
+import array
+import bisect
+import hashlib
+import mmap
 import re
+import sys
+
+import cpptype
 
 __all__ = [
     "BromaMember"
@@ -11,14 +19,25 @@ __all__ = [
     "BromaClass",
     "Broma",
     "parse",
+    "parse_mapped",
+    "save_binary",
+    "load_binary",
     "strip_line",
     "split_variable",
-    "is_member"
+    "is_member",
+    "BromaSyntaxError",
 ]
 
 def is_line_cpp_attributes(text: str):
     return re.match(r"\[\[(.*)\]\]", text.strip()) is not None
 
+_LEADING_ATTRIBUTES = re.compile(r"(?:\[\[.*?\]\]\s*)*")
+
+# whether a top level line (without its comment) is a global function, and not attributes or the start of a class
+def is_global_function_line(text: str) -> bool:
+    rest = text[_LEADING_ATTRIBUTES.match(text).end():]
+    return bool(rest) and re.match(r"class\b", rest) is None
+
 class CharReader:
     def __init__(self, text: str) -> None:
         self.text = text
@@ -154,6 +173,123 @@ def set_brace_level(old_level: int, line: str, paren: bool = False) -> int:
     chr1, chr2 = ('{', '}') if not paren else ('(', ')')
     return old_level + line.count(chr1) - line.count(chr2)
 
+# returns (number of closing braces the line starts with, brace delta, paren delta, whether the line ends inside
+# a block comment, last code character), ignoring braces in strings, character literals and comments
+def _scan_body_line(line: str, in_comment: bool) -> tuple[int, int, int, bool, str]:
+    leading = 0
+    braces = 0
+    parens = 0
+    last = ""
+    quote = ""
+    started = False
+    idx = 0
+
+    while idx < len(line):
+        char = line[idx]
+        if in_comment:
+            if line.startswith("*/", idx):
+                in_comment = False
+                idx += 1
+        elif quote:
+            if char == "\\":
+                idx += 1
+            elif char == quote:
+                quote = ""
+        elif line.startswith("//", idx):
+            break
+        elif line.startswith("/*", idx):
+            in_comment = True
+            idx += 1
+        elif not char.isspace():
+            if char in "\"'":
+                quote = char
+            elif char == "{":
+                braces += 1
+            elif char == "}":
+                braces -= 1
+                if not started:
+                    leading += 1
+            elif char == "(":
+                parens += 1
+            elif char == ")":
+                parens -= 1
+
+            started = started or char not in "})"
+            last = char
+
+        idx += 1
+
+    return leading, braces, parens, in_comment, last
+
+# Formats an inlined body: tabs become spaces, trailing whitespace is removed and every line is indented by 4 spaces
+# per brace level, plus one level for lines that continue the previous statement and for statements under case labels.
+# Lines inside block comments are kept.
+def format_body(body: str) -> str:
+    out = []
+    depth = 0
+    parens = 0
+    paren_depth = 0 # brace level the open parentheses are at, lines in lambdas inside them aren't continuations
+    in_comment = False
+    previous = ";"
+    cases = [] # (depth, extra indentation) of the case labels we are under
+
+    for line in body.replace("\t", "    ").splitlines():
+        stripped = line.strip()
+        if in_comment:
+            out.append(line.rstrip())
+            _, braces, paren_delta, in_comment, last = _scan_body_line(line, True)
+        elif not stripped:
+            out.append("")
+            continue
+        else:
+            leading, braces, paren_delta, in_comment, last = _scan_body_line(stripped, False)
+            level = depth - leading
+            while cases and cases[-1][0] > level:
+                cases.pop()
+
+            if re.match(r"(case\b|default\s*:)", stripped):
+                if cases and cases[-1][0] == level:
+                    cases.pop()
+                extra = sum(x for _, x in cases)
+                # `case x: {` indents its statements with the brace instead
+                cases.append((level, 0 if braces > 0 else 1))
+            else:
+                extra = sum(x for _, x in cases)
+                if ((parens > 0 and depth == paren_depth) or previous not in ";{}:") and not stripped.startswith(("{", "}", "#")):
+                    extra += 1
+
+            out.append(" " * (4 * max(level + extra, 0)) + stripped)
+
+        if not parens:
+            paren_depth = depth
+        depth += braces
+        parens = max(parens + paren_delta, 0)
+        if stripped.startswith("#"):
+            previous = ";"
+        elif last:
+            previous = last
+
+    return "\n".join(out)
+
+# formatted bodies by hash of the unformatted (and formatted) text, so unchanged bodies are only formatted once
+_formatted_bodies: dict[bytes, str] = {}
+
+# with fewer bodies left to format than this, a worker pool costs more than it saves
+FORMAT_POOL_MIN = 4000
+
+def _body_key(body: str) -> bytes:
+    return hashlib.blake2b(body.encode(), digest_size=16).digest()
+
+def cached_format_body(body: str) -> str:
+    key = _body_key(body)
+    out = _formatted_bodies.get(key)
+    if out is None:
+        out = format_body(body)
+        _formatted_bodies[key] = out
+        _formatted_bodies[_body_key(out)] = out
+
+    return out
+
 def indent_lines(text: str, spaces: int) -> str:
     lines = text.splitlines()
     out = ""
@@ -175,56 +311,73 @@ def fix_cocos_typename(tn: str) -> str:
     return \
         tn.replace('cocos2d::_ccColor', 'cocos2d::ccColor') \
 
-# split a variable like 'void* m_member' into ('void*', 'm_member'), accounting for the positioning of asterisks in pointers
-# this function is a monstrosity
-def split_variable(var: str) -> tuple[str, str]:
-    # if no variable, then just return the input as the type
-    var = var.strip()
-    if var.endswith('*') or var.endswith('&'):
-        return (fix_cocos_typename(var), '')
+# split a variable like 'void* m_member' into ('void*', 'm_member'), or 'uint8_t m_data[4]' into ('uint8_t[4]', 'm_data'),
+# see cpptype.split_declaration. Pointers are written next to the type, `void *x` is ('void*', 'x')
+_IDENTIFIER = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
 
-    if ' ' not in var:
-        return (fix_cocos_typename(var), '')
+# the old word based splitter, for declarations cpptype doesn't understand: the last identifier is the name
+def _split_words(var: str) -> tuple[str, str]:
+    var = var.strip()
+    if var.endswith('*') or var.endswith('&') or ' ' not in var:
+        return var, ''
 
     # insert spaces if asterisk is in the wrong place (dont ask)
-    last_asterisk = -1
-    last_space = -1
-
-    if '*' in var:
-        last_asterisk = var.rindex('*')
-
-    if ' ' in var:
-        last_space = var.rindex(' ')
-
-    if last_asterisk != -1 and last_space != -1 and last_asterisk > last_space:
+    last_asterisk = var.rfind('*')
+    last_space = var.rindex(' ')
+    if last_asterisk > last_space:
         var = var[:last_asterisk] + '* ' + var[last_asterisk + 1:]
 
-    identifier_pattern = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
-
-    parts = var.split()
-
-    var_name = None
+    var_name = ''
     type_parts = []
-
-    for part in reversed(parts):
-        if var_name is None and identifier_pattern.match(part):
+    for part in reversed(var.split()):
+        if not var_name and _IDENTIFIER.match(part):
             var_name = part
         else:
             type_parts.append(part)
 
-    if var_name is None:
-        var_name = ''
-
-    type_string = ' '.join(reversed(type_parts))
-
-    while ' *' in type_string:
-        type_string = type_string.replace(' *', '*')
+    return ' '.join(reversed(type_parts)), var_name
 
-    return fix_cocos_typename(type_string), var_name
+def split_variable(var: str) -> tuple[str, str]:
+    try:
+        type, name = cpptype.split_declaration(var)
+    except cpptype.CppTypeError:
+        type, name = _split_words(var)
+
+    while ' *' in type:
+        type = type.replace(' *', '*')
+
+    return fix_cocos_typename(type), name
+
+# a syntax error at a 0-based line and column (-1 if unknown). `near` is the text the error is about, used to find
+# the column once the line is known. Subclasses AssertionError, which is what syntax errors used to be.
+class BromaSyntaxError(AssertionError):
+    def __init__(self, line: int, message: str, column: int = -1, near: str = "", path: str = "") -> None:
+        super().__init__(message)
+        self.line = line
+        self.message = message
+        self.column = column
+        self.near = near
+        self.path = path
+
+    def __str__(self) -> str:
+        return f"Syntax error on line {self.line + 1}: {self.message}"
+
+    # fills in the line (if unknown) and the column, from the raw text of the line
+    def locate(self, line_idx: int, text: str) -> BromaSyntaxError:
+        if self.line < 0:
+            self.line = line_idx
+        if self.column < 0 and self.line == line_idx:
+            self.column = max(text.find(self.near), 0) if self.near else len(text) - len(text.lstrip())
+        return self
+
+    # `path:line:column: error: message`, the way compilers print them
+    def format(self) -> str:
+        return f"{self.path or '<input>'}:{self.line + 1}:{max(self.column, 0) + 1}: error: {self.message}"
 
 # syntax validation
-def validate(cond, line_idx, message):
-    assert cond, f"Syntax error on line {line_idx+1}: {message}"
+def validate(cond, line_idx, message, near: str = ""):
+    if not cond:
+        raise BromaSyntaxError(line_idx, message, near=near)
 
 global_validate = validate
 
@@ -241,12 +394,13 @@ class BromaMember:
     name: str
     cpp_attributes: list[str] = field(default_factory=list)
     inline_comment: str = ""
+    line: int = field(default = -1, compare = False, repr = False) # 0-based line in the file, -1 if unknown
 
     def dump(self) -> str:
         if self.cpp_attributes:
-            ret = f"[[{', '.join(self.cpp_attributes)}]]\n{self.type} {self.name};"
+            ret = f"[[{', '.join(self.cpp_attributes)}]]\n{cpptype.join_declaration(self.type, self.name)};"
         else:
-            ret = f"{self.type} {self.name};"
+            ret = f"{cpptype.join_declaration(self.type, self.name)};"
 
         if self.inline_comment:
             ret += f" //{self.inline_comment}"
@@ -256,6 +410,7 @@ class BromaMember:
 @dataclass
 class BromaPad:
     platforms: dict[str, int] = field(default_factory=dict)
+    line: int = field(default = -1, compare = False, repr = False)
 
     def dump(self) -> str:
         return f"PAD = {', '.join([f'{plat} {hex(self.platforms[plat])}' for plat in self.platforms])};"
@@ -264,6 +419,7 @@ class BromaPad:
 class BromaComment:
     data: str
     force_multiline: bool = False
+    line: int = field(default = -1, compare = False, repr = False)
 
     def dump(self) -> str:
         if self.data is not None:
@@ -274,10 +430,47 @@ class BromaComment:
         else:
             return None
 
+# a block of parts that only exist on some platforms, like `win, mac { ... }`. The parts are parsed from `code` the
+# first time they're used, so files that never look inside their blocks don't pay for it. The block is still dumped
+# from `code`, changes to its parts are only written back by `update_code`.
 @dataclass
 class BromaPlatformBlock:
     platforms: list[str]
     code: str
+    line: int = field(default = -1, compare = False, repr = False)
+    class_name: str = field(default = "", compare = False, repr = False) # of the class it's in, set by BromaClass
+    _parts: list | None = field(default = None, init = False, compare = False, repr = False)
+
+    # syntax errors in the block raise when its parts are first used, unless the class was parsed with `errors`
+    # (see `BromaClass.parse`), which parses its blocks right away and adds their errors to the class
+    @property
+    def parts(self) -> list[BromaFunction | BromaMember | BromaPad | BromaComment]:
+        if self._parts is None:
+            self.parse_parts()
+        return self._parts
+
+    def parse_parts(self, errors: list[BromaSyntaxError] | None = None):
+        # the braces of the block become the braces of a class, so the parts are parsed exactly like in a class
+        lines = self.code.splitlines()
+        # without the indentation of the block, so bodies are indented like in a class and `update_code` keeps them
+        indent = lines[0][:len(lines[0]) - len(lines[0].lstrip())]
+        lines = [x[len(indent):] if x.startswith(indent) else x for x in lines]
+        text = "\n".join([f"class {self.class_name or 'PlatformBlock'} {{"] + lines[1:-1] + ["}"])
+        first_error = len(errors) if errors is not None else 0
+        try:
+            self._parts = BromaClass.parse(text, max(self.line, 0), errors).parts
+        except BromaSyntaxError as e:
+            e.column += len(indent) if e.column >= 0 else 0
+            raise
+        for error in errors[first_error:] if errors is not None else []:
+            error.column += len(indent) if error.column >= 0 else 0
+
+    # rewrites `code` from the parts, formatted like the parts of a class
+    def update_code(self):
+        lines = self.code.splitlines()
+        indent = lines[0][:len(lines[0]) - len(lines[0].lstrip())]
+        body = BromaClass(self.class_name, parts=self.parts).dump().splitlines()[1:-1]
+        self.code = "\n".join([lines[0], *(indent + x if x else "" for x in body), lines[-1]])
 
     def dump(self) -> str:
         out = ""
@@ -292,9 +485,30 @@ class BromaClass:
     attributes: list[str] = field(default_factory = list)
     parts: list[BromaFunction | BromaMember | BromaPad | BromaComment] = field(default_factory = list)
     bases: list[str] = field(default_factory = list)
+    start_line: int = field(default = 0, compare = False, repr = False) # 0-based line of the class in its file
+    end_line: int = field(default = 0, compare = False, repr = False) # 0-based line of the closing brace
+    # syntax errors that were recovered from, only when parsed with `recover=True`
+    errors: list[BromaSyntaxError] = field(default_factory = list, compare = False, repr = False)
+
+    def __post_init__(self):
+        for part in self.parts:
+            if isinstance(part, BromaPlatformBlock):
+                part.class_name = self.name
 
+    # every part, including the ones in platform blocks: (part, None) for parts of the class itself and
+    # (part, platforms) for the ones in blocks. Blocks are parsed on the way
+    def walk_parts(self):
+        for part in self.parts:
+            if isinstance(part, BromaPlatformBlock):
+                for child in part.parts:
+                    yield child, part.platforms
+            else:
+                yield part, None
+
+    # with `errors`, syntax errors are added to it instead of raised: the part being parsed is dropped, and parsing
+    # goes on from the next line, which is where the next member usually starts
     @classmethod
-    def parse(cls, input: str, start_line: int) -> BromaClass:
+    def parse(cls, input: str, start_line: int, errors: list[BromaSyntaxError] | None = None) -> BromaClass | None:
         class_name = ""
         attributes = []
         parts = []
@@ -313,6 +527,7 @@ class BromaClass:
         inside_func_signature = False
         current_func_signature_text = ""
         current_func_sig_brace_level = 0
+        current_func_signature_line = start_line
 
         inside_ml_attributes = False # multiline attributes
         current_ml_attributes = ""
@@ -323,236 +538,317 @@ class BromaClass:
         next_member_attrs = []
 
         brace_level = 0
+        skipping = False # after an error inside a body, until its braces are closed
+
+        # line where the part that is currently being parsed starts (including its attributes)
+        part_start_line = start_line
+        parts_with_lines = 0
 
         lines = input.splitlines()
         for line_idx_rel, line in enumerate(lines):
             line_idx = start_line + line_idx_rel
 
-            def validate(cond, message):
-                global_validate(cond, line_idx, message)
+            for part in parts[parts_with_lines:]:
+                part.line = part_start_line
+            parts_with_lines = len(parts)
 
-            stripped_line = strip_line(line)
+            if skipping:
+                brace_level = set_brace_level(brace_level, strip_line(line))
+                skipping = brace_level > 1
+                continue
 
-            # continuation of a multiline comment
-            if inside_ml_comment:
-                # if the comment ends here, add it and reset
-                if '*/' in line:
-                    inside_ml_comment = False
-                    current_ml_comment_text += line.partition("*/")[0]
-                    parts.append(BromaComment(current_ml_comment_text, True))
-                    current_ml_comment_text = ""
-                else:
-                    current_ml_comment_text += line.strip("\n") + "\n"
+            if not (inside_ml_comment or inside_inlined_func or inside_ps_block or inside_func_signature
+                    or inside_ml_attributes or inside_inlined_func_signature or next_member_attrs):
+                part_start_line = line_idx
 
-            # start of a multiline comment
-            elif '/*' in stripped_line and not inside_inlined_func:
-                inside_ml_comment = True
-                # if the comment ends on the same line, add it immediately
-                if '*/' in line:
-                    inside_ml_comment = False
-                    text = line.partition("/*")[2].partition("*/")[0]
-                    parts.append(BromaComment(text, True))
-                else:
-                    current_ml_comment_text = line.partition("/*")[2] + "\n"
+            def validate(cond, message, near=""):
+                global_validate(cond, line_idx, message, near)
 
-            # single line comment
-            elif line.strip().startswith("//") and not inside_inlined_func:
-                text = line.partition("//")[2]
-                parts.append(BromaComment(text))
+            try:
+                stripped_line = strip_line(line)
 
-            # empty line
-            elif not line.strip() and not inside_inlined_func:
-                parts.append(BromaComment(None))
+                # a line that ends a part while multiline attributes or a signature are still open: they were never
+                # closed. Report them and parse the line on its own
+                if (inside_ml_attributes and "]]" not in stripped_line or inside_func_signature
+                        and set_brace_level(current_func_sig_brace_level, stripped_line, True) > 0) \
+                        and stripped_line.endswith((";", "{", "}")):
+                    if inside_ml_attributes:
+                        error = BromaSyntaxError(part_start_line, "attributes were never closed", near="[[")
+                        error.locate(part_start_line, lines[part_start_line - start_line])
+                    else:
+                        error = BromaSyntaxError(current_func_signature_line, "function signature was never closed", near="(")
+                        error.locate(current_func_signature_line, lines[current_func_signature_line - start_line])
+                    if errors is None:
+                        raise error
+                    errors.append(error)
 
-            # class name
-            elif match := re.match(r"class[\s]+([a-zA-Z0-9_]+(::[a-zA-Z0-9_]+)*)[\s]*:?[ ]*([a-zA-Z0-9_:, ]*)[\s]*{", stripped_line):
-                validate(brace_level == 0, "nested class")
+                    inside_ml_attributes = inside_func_signature = False
+                    current_ml_attributes = ""
+                    current_func_sig_brace_level = 0
+                    next_member_attrs.clear()
+                    part_start_line = line_idx
+
+                # continuation of a multiline comment
+                if inside_ml_comment:
+                    # if the comment ends here, add it and reset
+                    if '*/' in line:
+                        inside_ml_comment = False
+                        current_ml_comment_text += line.partition("*/")[0]
+                        parts.append(BromaComment(current_ml_comment_text, True))
+                        current_ml_comment_text = ""
+                    else:
+                        current_ml_comment_text += line.strip("\n") + "\n"
+
+                # start of a multiline comment
+                elif '/*' in stripped_line and not inside_inlined_func:
+                    inside_ml_comment = True
+                    # if the comment ends on the same line, add it immediately
+                    if '*/' in line:
+                        inside_ml_comment = False
+                        text = line.partition("/*")[2].partition("*/")[0]
+                        parts.append(BromaComment(text, True))
+                    else:
+                        current_ml_comment_text = line.partition("/*")[2] + "\n"
 
-                class_name = match.group(1)
-                bases_str = match.group(3)
-                if bases_str:
-                    bases = [x.strip() for x in bases_str.split(",")]
+                # single line comment
+                elif line.strip().startswith("//") and not inside_inlined_func:
+                    text = line.partition("//")[2]
+                    parts.append(BromaComment(text))
 
-                brace_level = set_brace_level(brace_level, stripped_line)
+                # empty line
+                elif not line.strip() and not inside_inlined_func:
+                    parts.append(BromaComment(None))
 
-                validate(brace_level == 1, "class did not immediately open its body")
+                # class name
+                elif match := re.match(r"class[\s]+([a-zA-Z0-9_]+(::[a-zA-Z0-9_]+)*)[\s]*:?[ ]*([a-zA-Z0-9_:, ]*)[\s]*{", stripped_line):
+                    validate(brace_level == 0, "nested class")
 
-            # inside multiline attributes
-            elif inside_ml_attributes:
-                current_ml_attributes += stripped_line.strip()
-                if ']]' in stripped_line:
-                    att = [x.strip() for x in current_ml_attributes.strip('[]').split(',')]
+                    class_name = match.group(1)
+                    bases_str = match.group(3)
+                    if bases_str:
+                        bases = [x.strip() for x in bases_str.split(",")]
 
-                    if brace_level == 0:
-                        # class attrs
-                        attributes += att
-                    else:
-                        # member attrs
-                        next_member_attrs += att
+                    brace_level = set_brace_level(brace_level, stripped_line)
 
-                    inside_ml_attributes = False
-                    current_ml_attributes = ""
+                    validate(brace_level == 1, "class did not immediately open its body")
 
-            # inside inlined function
-            elif inside_inlined_func:
-                brace_level = set_brace_level(brace_level, stripped_line)
-                current_inline_text.append(line)
+                # inside multiline attributes
+                elif inside_ml_attributes:
+                    current_ml_attributes += stripped_line.strip()
+                    if ']]' in stripped_line:
+                        att = [x.strip() for x in current_ml_attributes.strip('[]').split(',')]
 
-                # if brace level goes back to 1, the function is over
-                if brace_level == 1:
-                    attrs = list(next_member_attrs)
-                    next_member_attrs.clear()
-                    inside_inlined_func = False
-                    func = BromaFunction.parse_inlined(current_inline_text, class_name, attrs)
-                    parts.append(func)
-
-            # inside platform specific block
-            elif inside_ps_block:
-                brace_level = set_brace_level(brace_level, stripped_line)
-                current_block_text.append(line)
-
-                # if brace level goes back to 1, the block is over
-                if brace_level == 1:
-                    inside_ps_block = False
-                    block = BromaPlatformBlock(current_block_platforms, '\n'.join(current_block_text))
-                    parts.append(block)
-
-            # inside inline definition of a function that has a multi-line function signature
-            elif inside_inlined_func_signature:
-                brace_level = set_brace_level(brace_level, stripped_line)
-                current_inlined_func_signature_text.append(line)
-
-                # if brace level goes back to 1, the function is over
-                if brace_level == 1:
-                    attrs = list(next_member_attrs)
-                    next_member_attrs.clear()
-                    inside_inlined_func_signature = False
-                    func = BromaFunction.parse_multiline_signature_inlined(current_func_signature_text, current_inlined_func_signature_text, class_name, attrs)
-                    parts.append(func)
-
-            # inside function signature
-            elif inside_func_signature:
-                current_func_signature_text += line + "\n"
-                current_func_sig_brace_level = set_brace_level(current_func_sig_brace_level, stripped_line, True)
-
-                if current_func_sig_brace_level == 0:
-                    current_func_signature_text = current_func_signature_text.strip(' \t\n{')
-                    inside_func_signature = False
-
-                    # check if the function has a body
-                    if '{' in stripped_line:
-                        inside_inlined_func_signature = True
-                        brace_level = set_brace_level(brace_level, stripped_line)
-                        # if brace level is back to 1, the function was defined in 1 line.
-                        if brace_level == 1:
-                            attrs = list(next_member_attrs)
-                            next_member_attrs.clear()
-                            inside_inlined_func_signature = False
-                            func = BromaFunction.parse_multiline_signature_inlined(current_func_signature_text, [stripped_line.partition("{")[2].rpartition("}")[0]], class_name, attrs)
-                            parts.append(func)
+                        if brace_level == 0:
+                            # class attrs
+                            attributes += att
                         else:
-                            current_inlined_func_signature_text.clear()
-                            current_inlined_func_signature_text.append(line) # raw line, not stripped
-                    else:
-                        attrs = list(next_member_attrs)
-                        next_member_attrs.clear()
-                        func = BromaFunction.parse_multiline_signature(current_func_signature_text, class_name, attrs)
-                        parts.append(func)
+                            # member attrs
+                            next_member_attrs += att
 
-            # attributes (one-line)
-            elif match := re.match(r"\[\[(.*)\]\]", stripped_line):
-                att = [x.strip() for x in match.group(1).split(",")]
-                if brace_level == 0: # class attributes
-                    attributes += att
-                else: # member attributes
-                    next_member_attrs += att
-
-            # attributes (multi-line)
-            elif stripped_line.startswith("[["):
-                inside_ml_attributes = True
-                current_ml_attributes = stripped_line.partition("[[")[2]
-
-            # member
-            elif brace_level == 1 and is_member(stripped_line):
-                attrs = list(next_member_attrs)
-                next_member_attrs.clear()
+                        inside_ml_attributes = False
+                        current_ml_attributes = ""
 
-                if stripped_line.startswith("PAD"):
-                    # a pad
-                    broma_pad = BromaPad()
-                    if '=' in stripped_line:
-                        platform_pads = [x.strip() for x in stripped_line.partition('=')[2].rpartition(";")[0].strip().split(',')]
-                        for pad in platform_pads:
-                            validate(pad.count(" ") == 1, f"invalid platform pad: {pad}")
-                            platform, offset = pad.split(" ")
-                            offset = int(offset, 16)
-                            broma_pad.platforms[platform] = offset
-
-                    parts.append(broma_pad)
-                else:
-                    # an actual member
-                    type, name = split_variable(stripped_line.rpartition(";")[0])
-                    inline_comment = ''
-                    if '//' in line:
-                        inline_comment = line.partition('//')[2]
-
-                    parts.append(BromaMember(type.strip(), name.strip(), attrs, inline_comment))
-
-            # platform specific block OR function
-            elif brace_level == 1:
-                if stripped_line == '}':
-                    brace_level -= 1
-                    continue
+                # inside inlined function
+                elif inside_inlined_func:
+                    brace_level = set_brace_level(brace_level, stripped_line)
+                    current_inline_text.append(line)
 
-                if not stripped_line:
-                    continue
+                    # if brace level goes back to 1, the function is over
+                    if brace_level == 1:
+                        attrs = list(next_member_attrs)
+                        next_member_attrs.clear()
+                        inside_inlined_func = False
+                        func = BromaFunction.parse_inlined(current_inline_text, class_name, attrs)
+                        parts.append(func)
 
-                is_ps_block = '{' in stripped_line and not '(' in stripped_line
+                # inside platform specific block
+                elif inside_ps_block:
+                    brace_level = set_brace_level(brace_level, stripped_line)
+                    current_block_text.append(line)
 
-                if is_ps_block: # platform specific block
-                    # parse platforms
-                    current_block_platforms = stripped_line.partition('{')[0].strip().split(",")
+                    # if brace level goes back to 1, the block is over
+                    if brace_level == 1:
+                        inside_ps_block = False
+                        block = BromaPlatformBlock(current_block_platforms, '\n'.join(current_block_text))
+                        parts.append(block)
 
-                    # set everything else
-                    current_block_text.clear()
-                    current_block_text.append(line) # raw line, not stripped
-                    inside_ps_block = True
+                # inside inline definition of a function that has a multi-line function signature
+                elif inside_inlined_func_signature:
                     brace_level = set_brace_level(brace_level, stripped_line)
+                    current_inlined_func_signature_text.append(line)
 
-                else: # function
-                    # first determine if it's inlined or not
-                    is_inlined = '{' in stripped_line
-                    is_multiline_signature = stripped_line.count('(') != stripped_line.count(')')
-
-                    if is_multiline_signature: #
-                        inside_func_signature = True
-                        current_func_signature_text = line + "\n"
-                        current_func_sig_brace_level = set_brace_level(current_func_sig_brace_level, stripped_line, True)
-                    elif not is_inlined: # non inlined function
+                    # if brace level goes back to 1, the function is over
+                    if brace_level == 1:
                         attrs = list(next_member_attrs)
                         next_member_attrs.clear()
-                        func = BromaFunction.parse(stripped_line, class_name, attrs)
+                        inside_inlined_func_signature = False
+                        func = BromaFunction.parse_multiline_signature_inlined(current_func_signature_text, current_inlined_func_signature_text, class_name, attrs)
                         parts.append(func)
-                    else: # inlined function
-                        inside_inlined_func = True
+
+                # inside function signature
+                elif inside_func_signature:
+                    current_func_signature_text += line + "\n"
+                    current_func_sig_brace_level = set_brace_level(current_func_sig_brace_level, stripped_line, True)
+
+                    if current_func_sig_brace_level == 0:
+                        current_func_signature_text = current_func_signature_text.strip(' \t\n{')
+                        inside_func_signature = False
+
+                        # check if the function has a body
+                        if '{' in stripped_line:
+                            inside_inlined_func_signature = True
+                            brace_level = set_brace_level(brace_level, stripped_line)
+                            # if brace level is back to 1, the function was defined in 1 line.
+                            if brace_level == 1:
+                                attrs = list(next_member_attrs)
+                                next_member_attrs.clear()
+                                inside_inlined_func_signature = False
+                                func = BromaFunction.parse_multiline_signature_inlined(current_func_signature_text, [stripped_line.partition("{")[2].rpartition("}")[0]], class_name, attrs)
+                                parts.append(func)
+                            else:
+                                current_inlined_func_signature_text.clear()
+                                current_inlined_func_signature_text.append(line) # raw line, not stripped
+                        else:
+                            attrs = list(next_member_attrs)
+                            next_member_attrs.clear()
+                            func = BromaFunction.parse_multiline_signature(current_func_signature_text, class_name, attrs)
+                            parts.append(func)
+
+                # attributes (one-line)
+                elif match := re.match(r"\[\[(.*)\]\]", stripped_line):
+                    att = [x.strip() for x in match.group(1).split(",")]
+                    if brace_level == 0: # class attributes
+                        attributes += att
+                    else: # member attributes
+                        next_member_attrs += att
+
+                # attributes (multi-line)
+                elif stripped_line.startswith("[["):
+                    inside_ml_attributes = True
+                    current_ml_attributes = stripped_line.partition("[[")[2]
+
+                # member
+                elif brace_level == 1 and is_member(stripped_line):
+                    attrs = list(next_member_attrs)
+                    next_member_attrs.clear()
+
+                    if stripped_line.startswith("PAD"):
+                        # a pad
+                        broma_pad = BromaPad()
+                        if '=' in stripped_line:
+                            platform_pads = [x.strip() for x in stripped_line.partition('=')[2].rpartition(";")[0].strip().split(',')]
+                            for pad in platform_pads:
+                                validate(pad.count(" ") == 1, f"invalid platform pad: {pad}", pad)
+                                platform, offset = pad.split(" ")
+                                try:
+                                    broma_pad.platforms[platform] = int(offset, 16)
+                                except ValueError:
+                                    validate(False, f"invalid pad offset: {offset}", pad)
+
+                        parts.append(broma_pad)
+                    else:
+                        # an actual member
+                        type, name = split_variable(stripped_line.rpartition(";")[0])
+                        inline_comment = ''
+                        if '//' in line:
+                            inline_comment = line.partition('//')[2]
+
+                        parts.append(BromaMember(type.strip(), name.strip(), attrs, inline_comment))
+
+                # platform specific block OR function
+                elif brace_level == 1:
+                    if stripped_line == '}':
+                        brace_level -= 1
+                        continue
+
+                    if not stripped_line:
+                        continue
+
+                    is_ps_block = '{' in stripped_line and not '(' in stripped_line
+
+                    if is_ps_block: # platform specific block
+                        # parse platforms
+                        current_block_platforms = [x.strip() for x in stripped_line.partition('{')[0].split(",")]
+
+                        # set everything else
+                        current_block_text.clear()
+                        current_block_text.append(line) # raw line, not stripped
+                        inside_ps_block = True
                         brace_level = set_brace_level(brace_level, stripped_line)
-                        # if brace level is back to 1, the function was defined in 1 line.
-                        if brace_level == 1:
+
+                    else: # function
+                        # first determine if it's inlined or not
+                        is_inlined = '{' in stripped_line
+                        is_multiline_signature = stripped_line.count('(') != stripped_line.count(')')
+
+                        if is_multiline_signature: #
+                            inside_func_signature = True
+                            current_func_signature_line = line_idx
+                            current_func_signature_text = line + "\n"
+                            current_func_sig_brace_level = set_brace_level(current_func_sig_brace_level, stripped_line, True)
+                        elif not is_inlined: # non inlined function
                             attrs = list(next_member_attrs)
                             next_member_attrs.clear()
-                            inside_inlined_func = False
-                            func = BromaFunction.parse_inlined([stripped_line], class_name, attrs)
+                            func = BromaFunction.parse(stripped_line, class_name, attrs)
                             parts.append(func)
-                        else:
-                            current_inline_text.clear()
-                            current_inline_text.append(line) # raw line, not stripped
+                        else: # inlined function
+                            inside_inlined_func = True
+                            brace_level = set_brace_level(brace_level, stripped_line)
+                            # if brace level is back to 1, the function was defined in 1 line.
+                            if brace_level == 1:
+                                attrs = list(next_member_attrs)
+                                next_member_attrs.clear()
+                                inside_inlined_func = False
+                                func = BromaFunction.parse_inlined([stripped_line], class_name, attrs)
+                                parts.append(func)
+                            else:
+                                current_inline_text.clear()
+                                current_inline_text.append(line) # raw line, not stripped
+
+                # something that doesn't start a class before the class
+                elif not class_name:
+                    validate(False, "expected a class")
+
+                # should be unreachable
+                else:
+                    validate(False, f"unexpected state: brace level {brace_level}")
+            except BromaSyntaxError as e:
+                e.locate(part_start_line, lines[part_start_line - start_line])
+                if errors is None:
+                    raise
+
+                errors.append(e)
+                if not class_name:
+                    # there is no class to recover into, the rest of it would only repeat the error
+                    return None
+
+                # the rest of the braces that were open when it failed belong to the broken part
+                skipping = brace_level > 1
+                inside_inlined_func = inside_ml_comment = inside_ps_block = inside_func_signature = False
+                inside_ml_attributes = inside_inlined_func_signature = False
+                current_func_sig_brace_level = 0
+                next_member_attrs.clear()
+                if not skipping:
+                    brace_level = 1
 
-            # should be unreachable
-            else:
-                validate(False, f"unexpected state: brace level {brace_level}")
+        for part in parts[parts_with_lines:]:
+            part.line = part_start_line
+
+        if not class_name:
+            error = BromaSyntaxError(start_line, "class name was empty", 0)
+            if errors is None:
+                raise error
+            errors.append(error)
+            return None
+
+        if errors is not None:
+            # errors in platform blocks are reported with the ones of the class
+            for part in parts:
+                if isinstance(part, BromaPlatformBlock):
+                    part.class_name = class_name
+                    part.parse_parts(errors)
 
-        global_validate(len(class_name) > 0, start_line + len(input.splitlines()), "class name was empty")
-        return BromaClass(class_name, attributes, parts, bases)
+        return BromaClass(class_name, attributes, parts, bases, start_line, start_line + len(lines) - 1, list(errors or []))
 
     @classmethod
     def _parse_v2(cls, input: str, start_line: int) -> BromaClass:
@@ -621,6 +917,24 @@ class BromaClass:
             if inline_comment:
                 parts.append(BromaComment(inline_comment))
 
+    # moves the class (and the lines of all its parts) to start at a different line
+    def move_to(self, start_line: int):
+        delta = start_line - self.start_line
+        if delta == 0:
+            return
+
+        self.start_line += delta
+        self.end_line += delta
+        for part in self.parts:
+            if part.line != -1:
+                part.line += delta
+            if isinstance(part, BromaPlatformBlock) and part._parts is not None:
+                for child in part._parts:
+                    if child.line != -1:
+                        child.line += delta
+        for error in self.errors:
+            error.line += delta
+
     def sort(self):
         # put all functions at the top and sort them alphabetically, then put all members at the bottom and keep their order intact
         # comments are 'glued' to the next member/function
@@ -776,6 +1090,10 @@ class BromaClass:
 
         return count
 
+    # hash of the dumped class, equal for classes that would be written out the same way
+    def content_hash(self) -> bytes:
+        return hashlib.blake2b(self.dump().encode(), digest_size=16).digest()
+
     # Remove any comments, empty lines
     def strip(self):
         self.parts = [x for x in self.parts if isinstance(x, (BromaFunction, BromaMember, BromaPad))]
@@ -790,6 +1108,7 @@ class BromaFunction:
     qualifier: str # such as const, &, &&, const&
     cpp_attrs: list[str] # [[attr]] attributes
     inline_comment: str = ""
+    line: int = -1 # 0-based line in the file, -1 if unknown
 
     KNOWN_ATTRS = ["static", "virtual", "callback", "inline"]
 
@@ -904,13 +1223,14 @@ class BromaFunction:
                 fn_name = fn_name.rpartition("*")[2].strip()
 
         fn_name = fn_name.strip()
+        validate(fn_name, -1, "expected a function name", near=line)
 
         ret_type = line.partition(fn_name)[0].strip()
-        arglist = [split_variable(x.strip()) for x in line.partition(fn_name)[2].partition("(")[2].partition(")")[0].split(",") if x.strip()]
+        args, past_args = cpptype.split_arguments(line.partition(fn_name)[2].partition("(")[2])
+        arglist = [split_variable(x.strip()) for x in args if x.strip()]
 
-        past_args = line.partition(")")[2]
         if '=' in past_args:
-            qualifier, _, ending = line.partition(")")[2].partition("=")
+            qualifier, _, ending = past_args.partition("=")
             ending = ending.partition(";")[0].partition("{")[0]
             binds_list = [x.strip() for x in ending.strip('{;').strip().split(",") if x.strip()]
         else:
@@ -927,17 +1247,16 @@ class BromaFunction:
         binds = {}
 
         for bind in binds_list:
-            assert bind.count(' ') == 1, bind
+            if bind.count(' ') != 1:
+                raise BromaSyntaxError(-1, f"invalid bind: {bind}", near=bind)
             platform, offset = bind.split(' ')
             if offset == 'inline':
                 binds[platform] = None
             elif offset.startswith("0x"):
                 try:
-                    off = int(offset, 16)
-                    binds[platform] = off
-                except Exception as e:
-                    print(f"WARN: failed to parse platform bind line: {e} (offset was {offset})")
-                    print(f"Line: {line}")
+                    binds[platform] = int(offset, 16)
+                except ValueError:
+                    raise BromaSyntaxError(-1, f"invalid offset: {offset}", near=bind)
 
         return cls(
             fn_name, "", attrs, arglist, ret_type, binds, qualifier, cpp_attrs, inline_comment
@@ -946,12 +1265,27 @@ class BromaFunction:
     def get_arg_types(self) -> list[str]:
         return [x[0] for x in self.args]
 
-    def format_inlined_body(self):
-        # this is a very simple formatter that just removes trailing spaces and replaces tabs with spaces
-        lines = self.inlined_body.splitlines()
+    # the declaration without binds, body or comments, e.g. `static void foo(int x) const`
+    def get_signature(self) -> str:
         out = ""
-        for line in lines:
-            out += line.replace("\t", "    ").rstrip() + "\n"
+        if self.attrs:
+            out += f"{' '.join(self.attrs)} "
+
+        if self.ret_type:
+            out += f"{self.ret_type} "
+
+        args = ', '.join([cpptype.join_declaration(type, name) for type, name in self.args])
+        out += f"{self.name}({args})"
+
+        if self.qualifier:
+            out += f" {self.qualifier}"
+
+        return out
+
+    def format_inlined_body(self) -> str | None:
+        if self.inlined_body:
+            self.inlined_body = cached_format_body(self.inlined_body)
+        return self.inlined_body
 
     def dump(self) -> str:
         out = ""
@@ -967,10 +1301,7 @@ class BromaFunction:
         out += self.name
         arg_list = []
         for type, name in self.args:
-            if not name:
-                arg_list.append(type)
-            else:
-                arg_list.append(f'{type} {name}')
+            arg_list.append(cpptype.join_declaration(type, name))
 
         arg_list = ', '.join(arg_list)
         out += f"({arg_list})"
@@ -978,22 +1309,8 @@ class BromaFunction:
         if self.qualifier:
             out += f" {self.qualifier}"
 
-        # indent inlined body
-        inlined_body = ""
-        if self.inlined_body:
-            lines = self.inlined_body.splitlines()
-            indent_level = 0
-
-            out_lines = []
-            for line in lines:
-                new_indent_level = set_brace_level(indent_level, line)
-                if new_indent_level < indent_level:
-                    indent_level = new_indent_level
-
-                out_lines.append(line)
-                indent_level = new_indent_level
-
-            inlined_body = '\n'.join(out_lines)
+        # bodies are dumped as they are, see format_inlined_body
+        inlined_body = '\n'.join(self.inlined_body.splitlines()) if self.inlined_body else ""
 
         if not self.binds:
             if inlined_body:
@@ -1026,122 +1343,456 @@ class BromaFunction:
 
         return out
 
+# what a parsed file keeps of its source text, see `Broma.source`
+SOURCE_MODES = ("lines", "offsets", "none")
+
+# the global functions of a file: a list, with lookups by name and by bound address, and the order they're dumped in
+# (static functions, virtual ones as they are, then the rest, like in `BromaClass.sort`). These are built when first
+# used and kept until the list is modified. Changing a function in place (its name, attributes or binds) isn't
+# noticed, call `invalidate()` after doing that.
+class GlobalFunctions(list):
+    def __init__(self, functions: Iterable[BromaFunction] = ()) -> None:
+        super().__init__(functions)
+        self.invalidate()
+
+    def invalidate(self):
+        self._by_name: dict[str, list[BromaFunction]] | None = None
+        self._by_address: dict[str, dict[int, BromaFunction]] | None = None
+        self._sorted: list[BromaFunction] | None = None
+
+    def find(self, name: str) -> list[BromaFunction]:
+        if self._by_name is None:
+            self._by_name = {}
+            for func in self:
+                self._by_name.setdefault(func.name, []).append(func)
+        return self._by_name.get(name, [])
+
+    # the function bound at exactly `address` on `platform`, the first one if there are several
+    def at(self, platform: str, address: int) -> BromaFunction | None:
+        if self._by_address is None:
+            self._by_address = {}
+            for func in self:
+                for bind, offset in func.binds.items():
+                    if offset is not None:
+                        self._by_address.setdefault(bind, {}).setdefault(offset, func)
+        return self._by_address.get(platform, {}).get(address)
+
+    def sorted(self) -> list[BromaFunction]:
+        if self._sorted is None:
+            statics = sorted((x for x in self if "static" in x.attrs and "virtual" not in x.attrs), key=lambda x: x.name.casefold())
+            virtuals = [x for x in self if "virtual" in x.attrs]
+            rest = sorted((x for x in self if "static" not in x.attrs and "virtual" not in x.attrs), key=lambda x: x.name.casefold())
+            self._sorted = statics + virtuals + rest
+        return self._sorted
+
+    def __reduce_ex__(self, protocol):
+        return (GlobalFunctions, (list(self),))
+
+def _invalidating(method):
+    def wrapper(self, *args, **kwargs):
+        self.invalidate()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+for _name in ("append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse", "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(GlobalFunctions, _name, _invalidating(getattr(list, _name)))
+
 class Broma:
-    raw_lines: list[str] # raw lines as they were in the input
     classes: list[BromaClass]
-    global_functions: list[BromaFunction]
+    # see `global_functions`
+    _global_functions: GlobalFunctions
     preamble: str = ""
+    line_count: int = 0
+    # digest of the source text of each class -> the parsed class, only filled when parsed with incremental=True
+    class_sources: dict[bytes, BromaClass]
+    # with `recover=True`, syntax errors are collected here instead of raised, and the tree is what could be parsed
+    errors: list[BromaSyntaxError]
+    # "lines": the source split into `raw_lines`, "offsets": the source as one string (or bytes for buffers)
+    # plus where every line starts, "none": nothing, the tree is all that's left after parsing
+    source: str
+
+    # `content` is the text of the file, or its utf-8 encoded bytes in anything that supports slicing and find(),
+    # like a mmap (see `parse(path, mapped=True)`). Buffers are scanned in place and only the text of one class
+    # at a time is decoded. `source` defaults to "lines" for text and to "none" for buffers.
+    # With `recover`, a syntax error doesn't stop the parse: it's added to `errors`, the class member (or global item)
+    # it's in is skipped, and parsing goes on, so one parse finds every error.
+    def __init__(self, content: str | bytes | mmap.mmap, incremental: bool = False, reuse: dict[bytes, BromaClass] | None = None,
+                 source: str | None = None, recover: bool = False) -> None:
+        if source is None:
+            source = "lines" if isinstance(content, str) else "none"
+        assert source in SOURCE_MODES, f"source should be one of {', '.join(SOURCE_MODES)}, not '{source}'"
+
+        self.source = source
+        self.class_sources = {}
+        # the digest of each class in `classes`, in the same order. `class_sources` only has one of identical classes
+        self._class_keys = []
+        self.errors = []
+        self._recover = recover
+        self._incremental = incremental or reuse is not None
+        self._is_text = isinstance(content, str)
+        self._reuse = dict(reuse) if reuse else {}
+        self._source = content
+        self.global_functions = GlobalFunctions()
+        self.preamble, start_line, start_offset = self.parse_preamble()
+        # where the items start, and the offsets and lines where one ends with nothing left open, see `reparse`
+        self._items_start = (start_offset, start_line)
+        self._boundaries: list[tuple[int, int]] = []
+        self.classes = self.parse_global_items(start_offset, start_line)
+        self._reuse = {}
+        if recover:
+            self.errors += [error for cls in self.classes for error in cls.errors]
+            self.errors.sort(key=lambda x: (x.line, x.column))
+
+        self._keep_source(content)
+
+    def _keep_source(self, content: str | bytes | mmap.mmap):
+        source = self.source
+        self._raw_lines = None
+        self._text = None
+        self._line_offsets = None
+        if source == "lines":
+            self._raw_lines = self._decode(0, len(content)).splitlines()
+        elif source == "offsets":
+            self._text = content if isinstance(content, (str, bytes)) else bytes(content)
+            self._line_offsets = array.array("Q", (start for start, _ in self._lines(0)))
+
+        self._source = None
+
+    @property
+    def global_functions(self) -> GlobalFunctions:
+        return self._global_functions
+
+    # any list can be assigned, it's wrapped in a GlobalFunctions
+    @global_functions.setter
+    def global_functions(self, functions: list[BromaFunction]):
+        self._global_functions = functions if isinstance(functions, GlobalFunctions) else GlobalFunctions(functions)
+
+    # raw lines as they were in the input, None if the source was not kept
+    @property
+    def raw_lines(self) -> list[str] | None:
+        if self._raw_lines is not None:
+            return self._raw_lines
+
+        if self._line_offsets is not None:
+            return [self.get_line(x) for x in range(len(self._line_offsets))]
 
-    def __init__(self, content: str) -> None:
-        self.raw_lines = content.splitlines()
-        self.preamble, start_of_classes = self.parse_preamble()
-        self.classes = self.parse_global_items(start_of_classes)
+        return None
+
+    # a single line of the source (without its newline), for files parsed with source="lines" or "offsets"
+    def get_line(self, idx: int) -> str:
+        if self._raw_lines is not None:
+            return self._raw_lines[idx]
+
+        assert self._line_offsets is not None, "the source of this file was not kept"
+        start = self._line_offsets[idx]
+        end = self._line_offsets[idx + 1] if idx + 1 < len(self._line_offsets) else len(self._text)
+        line = self._text[start:end]
+        if not isinstance(line, str):
+            line = str(line, "utf-8")
+
+        return line.rstrip("\n").rstrip("\r")
+
+    # approximate number of bytes kept alive by the source of this file
+    def source_size(self) -> int:
+        if self._raw_lines is not None:
+            return sys.getsizeof(self._raw_lines) + sum(sys.getsizeof(x) for x in self._raw_lines)
+
+        if self._line_offsets is not None:
+            return sys.getsizeof(self._text) + sys.getsizeof(self._line_offsets)
+
+        return 0
+
+    # parses new contents of the same file, reusing every class whose text did not change since this parse.
+    # the reused class objects are moved to the new tree, so this object should not be used afterwards.
+    # `changed` is (start, old end, new end) of the only range of the text that changed, as offsets into the old and
+    # the new text. Then only the part of the file from the last class or global function that ends before it, to
+    # the first one after it where nothing is left open, is scanned again, everything else is moved. That needs
+    # both texts to be strings, this parse to be incremental, and the change to be after the first item, since
+    # anything before it could change the preamble.
+    def reparse(self, content: str | bytes | mmap.mmap, changed: tuple[int, int, int] | None = None) -> Broma:
+        if changed is not None and self._incremental and self._is_text and isinstance(content, str):
+            first = bisect.bisect_right(self._boundaries, (changed[0], float("inf")))
+            if first:
+                return self._reparse_range(content, first, *changed)
+
+        return Broma(content, reuse=self.class_sources, source=self.source, recover=self._recover)
+
+    # `first` is the index of the first boundary after the start of the change
+    def _reparse_range(self, content: str, first: int, start: int, old_end: int, new_end: int) -> Broma:
+        delta = new_end - old_end
+        # scan from the last boundary at or before the change, and stop at one at or after it, moved by the change
+        begin = self._boundaries[first - 1]
+        after = bisect.bisect_left(self._boundaries, (old_end, -1))
+        stops = {offset + delta: line for offset, line in self._boundaries[after:]}
+
+        class_errors = {id(error) for cls in self.classes for error in cls.errors}
+        file_errors = [x for x in self.errors if id(x) not in class_errors]
+
+        out = Broma.__new__(Broma)
+        out.source = self.source
+        out.preamble = self.preamble
+        out.class_sources = {}
+        out.errors = [x for x in file_errors if x.line < begin[1]]
+        out._recover = self._recover
+        out._incremental = True
+        out._is_text = True
+        out._reuse = dict(self.class_sources)
+        out._source = content
+        out._items_start = self._items_start
+        out._boundaries = self._boundaries[:first]
+        out.global_functions = [x for x in self.global_functions if x.line < begin[1]]
+        before = [x for x in self.classes if x.start_line < begin[1]]
+        out._class_keys = self._class_keys[:len(before)]
+        for cls, key in zip(before, out._class_keys):
+            out.class_sources[key] = cls
+        # reused classes are moved by the parse, so remember where they were
+        old_lines = [(x, x.start_line, key) for x, key in zip(self.classes, self._class_keys)]
+        classes = out.parse_global_items(*begin, stops)
+        out._reuse = {}
+
+        if out._stop is not None:
+            # everything from where it stopped on is the same as before, only moved
+            offset, line = out._stop
+            old_line = stops[offset]
+            moved = line - old_line
+            for cls, start_line, key in old_lines:
+                if start_line >= old_line:
+                    cls.move_to(cls.start_line + moved)
+                    classes.append(cls)
+                    out._class_keys.append(key)
+                    out.class_sources[key] = cls
+            for func in self.global_functions:
+                if func.line >= old_line:
+                    func.line += moved
+                    out.global_functions.append(func)
+            for error in file_errors:
+                if error.line >= old_line:
+                    error.line += moved
+                    out.errors.append(error)
+            while out._boundaries and out._boundaries[-1][0] >= offset:
+                out._boundaries.pop()
+            out._boundaries += [(x + delta, y + moved) for x, y in self._boundaries[after:] if x + delta >= offset]
+            out.line_count = self.line_count + moved
+
+        out.classes = before + classes
+        if self._recover:
+            out.errors += [error for cls in out.classes for error in cls.errors]
+            out.errors.sort(key=lambda x: (x.line, x.column))
+
+        out._keep_source(content)
+        return out
 
     def preprocess(self, content: str) -> list[str]:
         return [x.strip() for x in content.splitlines()]
 
-    def parse_global_items(self, start_of_classes: int) -> list[BromaClass]:
-        self.global_functions = []
-        classes: list[tuple[str, int]] = [] # (class, first line)
+    # yields (start offset, end offset) of every line of the source from `pos` on, the end includes the newline
+    def _lines(self, pos: int):
+        source = self._source
+        newline = "\n" if isinstance(source, str) else b"\n"
+        size = len(source)
+
+        while pos < size:
+            end = source.find(newline, pos)
+            end = size if end == -1 else end + 1
+            yield pos, end
+            pos = end
+
+    def _decode(self, start: int, end: int) -> str:
+        text = self._source[start:end]
+        return text if isinstance(text, str) else str(text, "utf-8")
+
+    # the text of an item, from its runs of consecutive lines, with normalized line endings
+    def _item_text(self, runs: list[list[int]]) -> str:
+        text = "".join(self._decode(start, end) for start, end, _, _ in runs)
+        if "\r" in text:
+            text = "".join(x + "\n" for x in text.splitlines())
+        elif not text.endswith("\n"):
+            text += "\n"
 
-        current_class_str = ""
-        current_class_start = 0
+        return text
+
+    # `stops` are offsets -> lines in the old text (see `reparse`) where scanning ends, if nothing is left open there.
+    # `_stop` is then the offset and line it stopped at, None if it went on until the end.
+    def parse_global_items(self, start_offset: int, start_line: int, stops: dict[int, int] | None = None) -> list[BromaClass]:
+        source = self._source
+        if isinstance(source, str):
+            comment, open_brace, close_brace, attrs_start, attrs_end, newline = "//", "{", "}", "[[", "]]", "\n"
+        else:
+            comment, open_brace, close_brace, attrs_start, attrs_end, newline = b"//", b"{", b"}", b"[[", b"]]", b"\n"
+
+        # first split the file into items (a class, with the attributes right before it), then call BromaClass.parse() on them all.
+        # items are kept as runs of consecutive lines: [start offset, end offset, first line, line count],
+        # since empty lines and comments between global items are skipped.
+        # global functions are parsed right away, they're all the other lines outside of classes
+        items: list[list[list[int]]] = []
+        runs: list[list[int]] = []
         brace_level = 0
+        in_attrs = False # inside attributes that span several lines
+        line_idx = start_line
+        opening = (0, 0, 0) # line and offsets of the line that opened the current class
+        self._stop = None
 
-        # first parse each class into a separate string, then call BromaClass.parse() on them all
-        for line_idx, raw_line in enumerate(self.raw_lines):
-            # skip preamble
-            if line_idx < start_of_classes:
-                continue
+        for start, end in self._lines(start_offset):
+            if stops is not None and start in stops and brace_level == 0 and not runs and not in_attrs:
+                self._stop = (start, line_idx)
+                break
 
-            stripped_line = strip_line(raw_line)
+            line = source[start:end]
+            comment_start = line.find(comment)
+            if comment_start != -1:
+                line = line[:comment_start]
 
-            # if in global ns and empty line / comment, skip it
-            if brace_level == 0 and not stripped_line:
-                continue
+            if brace_level == 0:
+                stripped = line.strip()
+                # if in global ns and empty line / comment, skip it
+                if not stripped:
+                    line_idx += 1
+                    continue
 
-            was_empty = current_class_str == ""
-            current_class_str += raw_line + "\n"
+                if in_attrs:
+                    in_attrs = attrs_end not in stripped
+                elif stripped.startswith(attrs_start) and attrs_end not in stripped:
+                    in_attrs = True
+                elif line.count(open_brace) == line.count(close_brace) and is_global_function_line(
+                    stripped if isinstance(stripped, str) else str(stripped, "utf-8")
+                ):
+                    # this includes functions with a body that ends on the same line
+                    self.parse_global_function(start, end, line_idx, runs)
+                    runs = []
+                    line_idx += 1
+                    if source[end - 1:end] == newline:
+                        self._boundaries.append((end, line_idx))
+                    continue
 
-            if was_empty and current_class_str:
-                current_class_start = line_idx
+            if runs and runs[-1][1] == start:
+                runs[-1][1] = end
+                runs[-1][3] += 1
+            else:
+                runs.append([start, end, line_idx, 1])
 
             old_brace_level = brace_level
-            brace_level = set_brace_level(brace_level, stripped_line)
-
-            if brace_level < old_brace_level and brace_level == 0:
-                # end of the class
-                classes.append((current_class_str, current_class_start))
-                current_class_str = ""
-
-        if current_class_str:
-            self.parse_and_add_residue(current_class_str)
-
-        out = []
+            brace_level += line.count(open_brace) - line.count(close_brace)
+
+            if brace_level < 0:
+                # a stray closing brace, leave it out so the next class starts from level 0 again
+                self._error(BromaSyntaxError(line_idx, "unmatched closing brace", near="}"), start, end)
+                runs[-1][1] = start
+                runs[-1][3] -= 1
+                if not runs[-1][3]:
+                    runs.pop()
+                brace_level = 0
+                line_idx += 1
+                continue
 
-        # now, parse each class separately
-        for (data, start_line) in classes:
-            residue, data = self.get_potential_residue(data, start_line)
-            extra_residue_lines = 0
+            if old_brace_level == 0 and brace_level > 0:
+                opening = (line_idx, start, end)
 
-            if residue:
-                self.parse_and_add_residue(residue)
-                extra_residue_lines = residue.count("\n") + 1
+            if brace_level == 0 and (old_brace_level > 0 or open_brace in line):
+                # end of the class, or a class on a single line
+                items.append(runs)
+                runs = []
+                if not in_attrs and source[end - 1:end] == newline:
+                    self._boundaries.append((end, line_idx + 1))
 
-            c = BromaClass.parse(data, start_line + extra_residue_lines) # idk if the line calc is right
-            out.append(c)
+            line_idx += 1
 
-        return out
+        self.line_count = line_idx
+        if stops is not None:
+            # only classes that were in the scanned part of the old text can be reused
+            end_line = stops[self._stop[0]] if self._stop is not None else float("inf")
+            self._reuse = {key: cls for key, cls in self._reuse.items() if start_line <= cls.start_line < end_line}
 
-    # this is a very hacky workaround for now, but if a global function is put before the start of another class,
-    # BromaClass.parse will get in the text with that function, so we try to detect this and split them up
-    def get_potential_residue(self, data: str, start_line: int) -> tuple[str, str]:
-        lines = data.splitlines()
+        if runs and brace_level > 0:
+            # the last class was never closed, parse what there is of it
+            self._error(BromaSyntaxError(opening[0], "class is missing its closing brace"), opening[1], opening[2])
+            items.append(runs)
+        elif runs:
+            # attributes at the end of the file, with nothing after them
+            self._error(BromaSyntaxError(runs[0][2], "expected a class or function after attributes"), runs[0][0], runs[0][1])
 
-        class_idx = 0
-        for n, line in enumerate(lines):
-            if line.startswith("class ") and line.endswith("{"):
-                class_idx = n
-                break
-
-        # common case: it's just the attributes on the previous line
-        if class_idx <= 1:
-            if class_idx == 1:
-                assert is_line_cpp_attributes(lines[class_idx - 1].strip()), \
-                    f"Syntax error on line {start_line + class_idx - 1}: expected attributes or blank before class start"
-
-            return None, data
+        out = []
 
-        # otherwise, things before the class and attributes are residue
-        has_attrs = is_line_cpp_attributes(lines[class_idx - 1].strip())
-        start_of_data = class_idx if not has_attrs else (class_idx - 1)
+        # now, parse each class separately
+        for item in items:
+            c = self.parse_class(self._item_text(item), item[0][2])
+            if c is not None:
+                out.append(c)
 
-        residue_lines, data_lines = lines[:start_of_data], lines[start_of_data:]
-        return "\n".join(residue_lines), "\n".join(data_lines)
+        return out
 
-    def parse_and_add_residue(self, data: str):
-        lines = data.splitlines()
+    # parses the global function on the line at `start`:`end`, `attr_runs` are the attributes on the lines before it
+    def parse_global_function(self, start: int, end: int, line_idx: int, attr_runs: list[list[int]]):
+        line = self._decode(start, end).rstrip("\r\n")
+        # attributes can also be on the line itself, before the function
+        prefix = _LEADING_ATTRIBUTES.match(line.lstrip()).end()
+        attr_text = (self._item_text(attr_runs) if attr_runs else "") + line.lstrip()[:prefix]
 
         attrs = []
-        for line in lines:
-            if is_line_cpp_attributes(line):
-                attrs.extend(line.partition("[[")[2].partition("]]")[0].split(","))
-                continue
-
-            # most likely a function?
-            func = BromaFunction.parse(line, "_GLOBAL", attrs)
-            self.global_functions.append(func)
-            attrs = []
+        for match in re.finditer(r"\[\[(.*?)\]\]", attr_text.replace("\n", ""), re.S):
+            attrs.extend(x.strip() for x in match.group(1).split(","))
 
-    # simply iterate over the lines until the first line that is not empty and not a comment is found
-    def parse_preamble(self) -> tuple[str, int]:
+        try:
+            text = line.lstrip()[prefix:]
+            if "{" in text:
+                func = BromaFunction.parse_inlined([text], "_GLOBAL", attrs)
+            else:
+                func = BromaFunction.parse(text, "_GLOBAL", attrs)
+        except BromaSyntaxError as e:
+            e.locate(line_idx, line)
+            if not self._recover:
+                raise
+            self.errors.append(e)
+            return
+
+        func.line = line_idx
+        self.global_functions.append(func)
+
+    # raises the error, or records it when recovering
+    def _error(self, error: BromaSyntaxError, start: int, end: int):
+        error.locate(error.line, self._decode(start, end).rstrip("\r\n"))
+        if not self._recover:
+            raise error
+        self.errors.append(error)
+
+    # None if the class couldn't be parsed at all, which can only happen with `recover`
+    def parse_class(self, data: str, start_line: int) -> BromaClass | None:
+        errors = [] if self._recover else None
+        if not self._incremental:
+            c = BromaClass.parse(data, start_line, errors)
+            if c is None:
+                self.errors += errors
+            return c
+
+        key = hashlib.blake2b(data.encode(), digest_size=16).digest()
+        # pop so that two identical classes in one file don't end up as the same object
+        c = self._reuse.pop(key, None)
+        if c is None:
+            c = BromaClass.parse(data, start_line, errors)
+            if c is None:
+                self.errors += errors
+                return None
+        else:
+            c.move_to(start_line)
+            # reused from a parse that recovered from its errors
+            if c.errors and not self._recover:
+                raise c.errors[0]
+
+        self.class_sources[key] = c
+        self._class_keys.append(key)
+        return c
+
+    # simply iterate over the lines until the first line that is not empty and not a comment is found.
+    # returns the preamble, and the line and offset where the rest of the file starts
+    def parse_preamble(self) -> tuple[str, int, int]:
         pr = ""
 
         inside_ml_comment = False
 
         total_lines = 0
 
-        for line in self.raw_lines:
+        for start, end in self._lines(0):
+            line = self._decode(start, end).rstrip("\n").rstrip("\r")
             stripped = strip_line(line)
 
             if '/*' in stripped:
@@ -1155,14 +1806,14 @@ class Broma:
                     inside_ml_comment = False
                 pr += line + "\n"
             elif stripped: # non empty line that is not a comment
-                return (pr, total_lines)
+                return (pr, total_lines, start)
             else:
                 pr += line + "\n"
 
 
             total_lines += 1
 
-        return ("", 0)
+        return ("", 0, 0)
 
     def find_class(self, name: str) -> BromaClass:
         for class_ in self.classes:
@@ -1189,42 +1840,120 @@ class Broma:
 
         self.classes.sort(key=lambda x: x.name.casefold())
 
-    def dump(self) -> str:
-        out = self.preamble
+    # clears all function offsets, keeps inlines intact. Includes global functions and functions in platform blocks
+    def clear_offsets(self):
+        def clear(func: BromaFunction) -> bool:
+            binds = {bind: func.binds[bind] for bind in func.binds if func.binds[bind] is None}
+            changed = binds != func.binds
+            func.binds = binds
+            return changed
 
         for cls in self.classes:
-            out += cls.dump()
-            out += "\n\n"
+            for part in cls.parts:
+                if isinstance(part, BromaFunction):
+                    clear(part)
+                elif isinstance(part, BromaPlatformBlock):
+                    # blocks are dumped from their code, so only write back the ones that changed
+                    if any([clear(x) for x in part.parts if isinstance(x, BromaFunction)]):
+                        part.update_code()
 
-        # For the purpose of sorting, we create a dummy class with the global functions
-        cls = BromaClass("_GLOBAL", [], self.global_functions, [])
-        cls.sort()
-        dumped_globals = "\n".join([x[4:] for x in cls.dump().splitlines()[1:-1]])
-        out += dumped_globals
+        for func in self.global_functions:
+            clear(func)
+        self.global_functions.invalidate()
 
-        return out
+    def dump(self) -> str:
+        out = [self.preamble]
 
-    def dump_formatted(self) -> str:
-        self.sort_everything()
+        for cls in self.classes:
+            out.append(cls.dump())
+            out.append("\n\n")
+
+        out.append("\n".join(func.dump() for func in self.global_functions.sorted()))
+        return "".join(out)
+
+    # formats every inlined body (see format_body), returns how many weren't cached. With `jobs` other than 1 and
+    # enough uncached bodies, they are formatted by a pool of that many processes (0 = one per cpu).
+    def format_inlined_bodies(self, jobs: int = 1) -> int:
+        functions = [part for cls in self.classes for part, _ in cls.walk_parts() if isinstance(part, BromaFunction) and part.inlined_body]
+        functions += [func for func in self.global_functions if func.inlined_body]
+        # blocks are dumped from their code, it's written again for the ones with a body that changed
+        blocks = {id(func): part for cls in self.classes for part in cls.parts if isinstance(part, BromaPlatformBlock)
+                  for func in part.parts if isinstance(func, BromaFunction) and func.inlined_body}
+
+        keys = [_body_key(func.inlined_body) for func in functions]
+        missing = {}
+        for key, func in zip(keys, functions):
+            if key not in _formatted_bodies:
+                missing[key] = func.inlined_body
+
+        if jobs != 1 and len(missing) >= FORMAT_POOL_MIN:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+                formatted = list(pool.map(format_body, missing.values(), chunksize=512))
+        else:
+            formatted = [format_body(x) for x in missing.values()]
 
-        out = self.preamble
+        for key, out in zip(missing, formatted):
+            _formatted_bodies[key] = out
+            _formatted_bodies[_body_key(out)] = out
 
-        for cls in self.classes:
-            for part in cls.parts:
-                if isinstance(part, BromaFunction):
-                    if part.inlined_body:
-                        part.format_inlined_body()
+        changed_blocks = {}
+        for key, func in zip(keys, functions):
+            if func.inlined_body != _formatted_bodies[key] and id(func) in blocks:
+                changed_blocks[id(blocks[id(func)])] = blocks[id(func)]
+            func.inlined_body = _formatted_bodies[key]
 
-            out += cls.dump()
-            out += "\n\n"
+        for block in changed_blocks.values():
+            block.update_code()
 
-        return out
+        return len(missing)
 
-def parse(path: Path | str) -> Broma:
+    # sorted, with formatted bodies. Global functions are kept, reformat.py used to drop them
+    def dump_formatted(self, jobs: int = 0) -> str:
+        self.sort_everything()
+        self.format_inlined_bodies(jobs)
+        return self.dump()
+
+# with `mapped`, the file is memory mapped instead of read, so it's never fully loaded as a string
+# `source` is what to keep of the text after parsing, see `Broma.source`. Files saved with `save_binary` are loaded directly.
+# with `recover`, syntax errors are collected in `errors` instead of raised (see `Broma`), with `path` set on them
+def parse(path: Path | str, mapped: bool = False, source: str | None = None, recover: bool = False) -> Broma:
     if Path(path).exists():
-        return Broma(Path(path).read_text(encoding='utf-8'))
+        if Path(path).suffix == ".brob":
+            return load_binary(path)
+        if mapped:
+            return parse_mapped(path, source=source, recover=recover)
+        file = Broma(Path(path).read_text(encoding='utf-8'), source=source, recover=recover)
+        for error in file.errors:
+            error.path = str(path)
+        return file
     else:
-        return Broma(path) # assume it's a string
+        return Broma(path, source=source, recover=recover) # assume it's a string
+
+def parse_mapped(path: Path | str, incremental: bool = False, reuse: dict[bytes, BromaClass] | None = None, source: str | None = None,
+                 recover: bool = False) -> Broma:
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            file = Broma(f.read(), incremental, reuse, source, recover)
+        else:
+            with buffer:
+                file = Broma(buffer, incremental, reuse, source, recover)
+
+    for error in file.errors:
+        error.path = str(path)
+    return file
+
+# saves the parsed tree in the binary format from binary.py
+def save_binary(file: Broma, path: Path | str):
+    import binary
+    binary.save(file, path)
+
+def load_binary(path: Path | str) -> Broma:
+    import binary
+    return binary.load(path)
 
 def merge(bromas: list[Broma]) -> Broma:
     out = Broma("")
@@ -1,17 +1,18 @@
 # Clears all offsets in a broma file
-# Run as: python clear-offsets.py <input> <output>
+# Run as: python clear-offsets.py <input> <output> [--check]
 
 import broma
+import profiling
 import sys
-from pathlib import Path
+import writer
+
+profiling.start_from_argv()
+check = writer.check_from_argv()
 
 file = broma.parse(sys.argv[1])
-for class_ in file.classes:
-    for part in class_.parts:
-        if isinstance(part, broma.BromaFunction):
-            # keep inlined defs
-            part.binds = {bind: part.binds[bind] for bind in part.binds if part.binds[bind] is None}
+# keeps inlined defs
+file.clear_offsets()
 
 text = file.dump()
 
-Path(sys.argv[2]).write_text(text)
+writer.finish(sys.argv[2], text, check)
@@ -0,0 +1,738 @@
+# Single entry point for the broma tools, processes any number of files in one process
+# Run as: python cli.py <command> [options] <files...>
+# Files can be paths, directories (all .bro files inside them) or globs, e.g. `bindings/**/*.bro`
+
+# Every command imports the modules it needs when it runs, so starting one doesn't pay for all the others.
+
+from __future__ import annotations
+
+import argparse
+import glob
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import broma
+import profiling
+import writer
+
+# A step runs on an already parsed file. Steps that rewrite the tree cause the file to be dumped and written
+# once all steps are done, steps that don't only report messages.
+@dataclass
+class Step:
+    # gets the parsed file and the names of the classes in all the inputs, for checks that look at other files
+    run: Callable[[broma.Broma, set[str]], list[str] | None]
+    rewrites: bool
+
+def _step_dump(file: broma.Broma, known: set[str]):
+    pass
+
+def _step_reformat(file: broma.Broma, known: set[str]):
+    file.sort_everything()
+    # files are already spread over worker processes
+    file.format_inlined_bodies(jobs=1)
+
+def _step_clear_offsets(file: broma.Broma, known: set[str]):
+    file.clear_offsets()
+
+def _step_warn(file: broma.Broma, known: set[str]) -> list[str]:
+    import warn
+    return warn.collect_warnings(file, known=known)
+
+STEPS: dict[str, Step] = {
+    "dump": Step(_step_dump, True),
+    "reformat": Step(_step_reformat, True),
+    "clear-offsets": Step(_step_clear_offsets, True),
+    "warn": Step(_step_warn, False),
+}
+
+@dataclass
+class FileResult:
+    path: Path
+    messages: list[str] = field(default_factory=list)
+    written: Path | None = None
+    changed: bool = False # whether the output differs from what's on disk (in check mode: would differ)
+
+def expand_inputs(patterns: list[str]) -> list[Path]:
+    out = []
+    seen = set()
+
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(path.glob("*.bro"))
+        elif path.exists():
+            matches = [path]
+        else:
+            matches = sorted(Path(x) for x in glob.glob(pattern, recursive=True))
+            if not matches:
+                raise SystemExit(f"error: no files match '{pattern}'")
+
+        for match in matches:
+            key = match.resolve()
+            if key not in seen:
+                seen.add(key)
+                out.append(match)
+
+    return out
+
+# where to write the output for `path`. With no output given files are rewritten in place,
+# with multiple inputs (or an existing directory) the output is treated as a directory.
+def output_path(path: Path, output: Path | None, many: bool) -> Path:
+    if output is None:
+        return path
+
+    if many or output.is_dir():
+        return output / path.name
+
+    return output
+
+# binary inputs (see binary.py) are written out as text, which must not replace them. Returns whether `paths` can be
+# written to `output`, after printing an error if not
+def check_binary_inputs(paths: list[Path], output: Path | None) -> bool:
+    if output is None:
+        for path in paths:
+            if path.suffix == ".brob":
+                print(f"error: {path} is a binary file and can't be rewritten as text in place, give -o", file=sys.stderr)
+                return False
+    return True
+
+# like output_path, with binary inputs named as text files
+def text_output_path(path: Path, output: Path | None, many: bool) -> Path:
+    return output_path(path.with_suffix(".bro") if path.suffix == ".brob" else path, output, many)
+
+def process_file(path: Path, steps: list[str], output: Path | None = None, many: bool = False, check: bool = False,
+                 known: set[str] | None = None) -> FileResult:
+    result = FileResult(path)
+    file = broma.parse(path, mapped=True)
+
+    rewrites = False
+    for name in steps:
+        step = STEPS[name]
+        result.messages += step.run(file, known or set()) or []
+        rewrites = rewrites or step.rewrites
+
+    if rewrites:
+        dest = text_output_path(path, output, many)
+        result.changed = writer.write_output(dest, file.dump(), check)
+        if result.changed and not check:
+            result.written = dest
+
+    return result
+
+def run_steps(paths: list[Path], steps: list[str], output: Path | None = None, jobs: int = 1, check: bool = False) -> list[FileResult]:
+    many = len(paths) > 1
+    if many and output is not None and not check:
+        output.mkdir(parents=True, exist_ok=True)
+
+    # files are linted one at a time, bases defined in the other inputs aren't unknown
+    known = set()
+    if "warn" in steps:
+        import lint
+        known = lint.class_names(paths)
+
+    if jobs == 1 or len(paths) < 2:
+        return [process_file(path, steps, output, many, check, known) for path in paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+        n = len(paths)
+        return list(pool.map(process_file, paths, [steps] * n, [output] * n, [many] * n, [check] * n, [known] * n))
+
+# saves the parsed file in the binary format (see binary.py), next to the input by default
+def compile_file(path: Path, output: Path | None = None, many: bool = False) -> Path:
+    dest = output_path(path.with_suffix(".brob"), output, many)
+    broma.save_binary(broma.parse(path, mapped=True), dest)
+    return dest
+
+def print_results(results: list[FileResult]):
+    for result in results:
+        if result.messages:
+            if len(results) > 1:
+                print(f"{result.path}:")
+
+            for message in result.messages:
+                print(message)
+
+def parse_steps(text: str) -> list[str]:
+    steps = [x.strip() for x in text.split(",") if x.strip()]
+    for step in steps:
+        if step not in STEPS:
+            raise argparse.ArgumentTypeError(f"unknown step '{step}', expected one of: {', '.join(STEPS)}")
+
+    return steps
+
+def cmd_steps(args: argparse.Namespace) -> int:
+    paths = expand_inputs(args.files)
+    steps = args.steps if args.command == "run" else [args.command]
+
+    if args.command == "warn" and args.merge:
+        import warn
+        merged = broma.merge([broma.parse(path, mapped=True) for path in paths])
+        print_results([FileResult(Path("<merged>"), warn.collect_warnings(merged))])
+        return 0
+
+    if any(STEPS[x].rewrites for x in steps) and not check_binary_inputs(paths, args.output):
+        return 1
+
+    results = run_steps(paths, steps, args.output, args.jobs, args.check)
+    print_results(results)
+
+    if args.check:
+        for result in results:
+            if result.changed:
+                print(f"{result.path} would change")
+        return 1 if any(x.changed for x in results) else 0
+
+    return 0
+
+def cmd_check_syntax(args: argparse.Namespace) -> int:
+    import json
+
+    errors = []
+    for path in expand_inputs(args.files):
+        errors += broma.parse(path, mapped=True, recover=True).errors
+
+    if args.json:
+        print(json.dumps([{"file": x.path, "line": x.line + 1, "column": x.column + 1, "message": x.message} for x in errors], indent=2))
+    else:
+        for error in errors:
+            print(error.format())
+
+    return 1 if errors else 0
+
+def cmd_compile(args: argparse.Namespace) -> int:
+    paths = expand_inputs(args.files)
+    many = len(paths) > 1
+    if many and args.output is not None:
+        args.output.mkdir(parents=True, exist_ok=True)
+
+    if args.jobs == 1 or not many:
+        written = [compile_file(path, args.output, many) for path in paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+            n = len(paths)
+            written = list(pool.map(compile_file, paths, [args.output] * n, [many] * n))
+
+    for dest in written:
+        print(f"Wrote {dest}")
+
+    return 0
+
+def cmd_export_sqlite(args: argparse.Namespace) -> int:
+    import sqlite_export
+
+    for path, stats in sqlite_export.export(expand_inputs(args.files), args.output).items():
+        print(f"{path}: {stats.inserted} classes exported, {stats.kept} unchanged, {stats.removed} removed")
+
+    return 0
+
+def cmd_history(args: argparse.Namespace) -> int:
+    import json
+
+    import history
+    import stats
+    import timeline
+
+    with history.HistoryStore(args.store) as store:
+        if args.action == "add":
+            added = store.add(args.version, broma.parse(args.file, mapped=True), args.position)
+            print(f"{args.version}: {added.classes_added} new classes, {added.classes_reused} stored already, "
+                  f"{added.functions_added} new functions, {added.functions_reused} stored already")
+        elif args.action == "list":
+            for version in store.versions():
+                print(f"{version.name}: {version.classes} classes, {version.line_count} lines")
+            count, size = store.size()
+            print(f"{count} objects, {size} bytes")
+        elif args.action == "checkout":
+            try:
+                text = store.load(args.version).dump()
+            except KeyError as e:
+                print(f"error: {e.args[0]}", file=sys.stderr)
+                return 1
+
+            if args.output is None:
+                print(text, end="")
+            else:
+                writer.write_output(args.output, text)
+        elif args.action == "remove":
+            try:
+                store.remove(args.version)
+            except KeyError as e:
+                print(f"error: {e.args[0]}", file=sys.stderr)
+                return 1
+            print(f"removed {args.version}, deleted {store.collect_garbage()} objects")
+        elif args.action == "stats":
+            cache = stats.StatsCache.load(args.cache) if args.cache else stats.StatsCache()
+            try:
+                results = stats.history_stats(store, args.versions or None, cache)
+            except KeyError as e:
+                print(f"error: {e.args[0]}", file=sys.stderr)
+                return 1
+            if args.cache:
+                cache.save(args.cache)
+
+            if args.json:
+                print(json.dumps({name: x.to_json() for name, x in results.items()}, indent=2))
+            else:
+                previous = None
+                for name, version_stats in results.items():
+                    print(f"{name}:\n{stats.format_table(version_stats, previous)}\n")
+                    previous = version_stats
+        elif args.action == "log":
+            history_timeline = timeline.Timeline(store)
+            history_timeline.update()
+
+            changes = history_timeline.changes(args.symbol, args.field)
+            if not changes:
+                print(f"error: '{args.symbol}' isn't in any version", file=sys.stderr)
+                return 1
+
+            if args.at is None:
+                for change in changes:
+                    print(change.format())
+                return 0
+
+            try:
+                for symbol, field in dict.fromkeys((x.symbol, x.field) for x in changes):
+                    value, since = history_timeline.value_at(symbol, field, args.at)
+                    if value is not None:
+                        print(f"{symbol} {field}: {value} (since {since})")
+            except KeyError as e:
+                print(f"error: {e.args[0]}", file=sys.stderr)
+                return 1
+
+    return 0
+
+def parse_range(text: str) -> tuple[int, int, int]:
+    try:
+        start, end, delta = (int(x, 0) for x in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected start:end:delta, got '{text}'")
+
+    return start, end, delta
+
+def cmd_rebase(args: argparse.Namespace) -> int:
+    import offsets
+
+    if args.shift is None and not args.range:
+        print("error: nothing to do, give --shift or --range", file=sys.stderr)
+        return 1
+
+    paths = expand_inputs(args.files)
+    many = len(paths) > 1
+    if not check_binary_inputs(paths, args.output):
+        return 1
+
+    # every file is rebased before any is written, so an error in one leaves all of them as they were
+    rebased = []
+    for path in paths:
+        file = broma.parse(path, mapped=True)
+        store = offsets.OffsetStore.from_file(file)
+
+        moved = 0
+        try:
+            if args.shift is not None:
+                moved += store.shift(args.platform, args.shift)
+            if args.range:
+                moved += store.rebase(args.platform, args.range)
+        except ValueError as e:
+            print(f"{path}: error: {e}", file=sys.stderr)
+            return 1
+
+        store.write_back()
+        rebased.append((path, file, moved))
+
+    if many and args.output is not None and not args.check:
+        args.output.mkdir(parents=True, exist_ok=True)
+
+    changed = False
+    for path, file, moved in rebased:
+        dest = text_output_path(path, args.output, many)
+        if writer.write_output(dest, file.dump(), args.check):
+            changed = True
+        print(f"{path}: {'would move' if args.check else 'moved'} {moved} offsets")
+
+    return 1 if args.check and changed else 0
+
+def parse_platform_value(text: str) -> tuple[str, str]:
+    platform, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected platform=value, got '{text}'")
+
+    return platform, value
+
+def cmd_check_binds(args: argparse.Namespace) -> int:
+    import dataclasses
+    import json
+
+    import bindcheck
+
+    alignment = dict(bindcheck.DEFAULT_ALIGNMENT)
+    for platform, value in args.align or []:
+        alignment[platform] = int(value, 0)
+
+    ranges = {}
+    for platform, value in args.range or []:
+        start, _, end = value.partition(":")
+        ranges[platform] = (int(start, 0), int(end, 0))
+
+    paths = expand_inputs(args.files)
+    if args.merge:
+        files = {"<merged>": broma.merge([broma.parse(path, mapped=True) for path in paths])}
+    else:
+        files = {str(path): broma.parse(path, mapped=True) for path in paths}
+
+    reports = {name: bindcheck.check_file(file, alignment=alignment, ranges=ranges) for name, file in files.items()}
+
+    if args.json:
+        print(json.dumps({name: [dataclasses.asdict(x) for x in report.issues] for name, report in reports.items()}, indent=4))
+    else:
+        for name, report in reports.items():
+            for issue in report.issues:
+                print(f"{name}: {issue.format()}")
+
+            counts = ", ".join(f"{count} {kind}" for kind, count in report.by_kind().items()) or "no issues"
+            print(f"{name}: checked {report.checked} offsets, {counts}")
+
+    return 1 if any(x.issues for x in reports.values()) else 0
+
+def cmd_verify_binds(args: argparse.Namespace) -> int:
+    import dataclasses
+    import json
+
+    import binverify
+
+    binaries = {platform: Path(path) for platform, path in args.binary}
+    files = [broma.parse(path, mapped=True) for path in expand_inputs(args.files)]
+
+    try:
+        suspicious, checked = binverify.verify(files, binaries, args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps([dataclasses.asdict(x) for x in suspicious], indent=4))
+    else:
+        for bind in suspicious:
+            print(bind.format())
+
+        for platform, count in checked.items():
+            found = sum(1 for x in suspicious if x.platform == platform)
+            print(f"{platform}: checked {count} offsets against {binaries[platform]}, {found} suspicious")
+
+    return 1 if suspicious else 0
+
+def cmd_export_symbols(args: argparse.Namespace) -> int:
+    import symbols
+
+    symbols.export([broma.parse(path, mapped=True) for path in expand_inputs(args.files)], args.output)
+    return 0
+
+def cmd_symbolicate(args: argparse.Namespace) -> int:
+    import re
+
+    import symbols
+
+    with symbols.SymbolMap(args.map) as symbol_map:
+        if args.platform not in symbol_map.platforms():
+            print(f"error: no symbols for {args.platform}, the map has: {', '.join(symbol_map.platforms())}", file=sys.stderr)
+            return 1
+
+        def describe(address: int) -> str:
+            found = symbol_map.lookup(args.platform, address)
+            if found is None:
+                return "?"
+
+            name, _, offset = found
+            return f"{name}+{hex(offset)}" if offset else name
+
+        if args.addresses:
+            for address in args.addresses:
+                print(f"{address}: {describe(int(address, 16))}")
+            return 0
+
+        # annotate every hex address in the input, e.g. a crash log
+        for line in sys.stdin:
+            print(re.sub(r"\b0x[0-9a-fA-F]+\b", lambda m: f"{m.group()} ({describe(int(m.group(), 16))})", line), end="")
+
+    return 0
+
+def cmd_diff(args: argparse.Namespace) -> int:
+    import diff
+
+    diff.diff(broma.parse(args.old, mapped=True), broma.parse(args.new, mapped=True))
+    return 0
+
+def cmd_upgrade(args: argparse.Namespace) -> int:
+    import upgrade2
+
+    merged = upgrade2.upgrade(broma.parse(args.old, mapped=True), broma.parse(args.new, mapped=True))
+    if writer.write_output(args.output, merged.dump(), args.check) and args.check:
+        print(f"{args.output} would change")
+        return 1
+    return 0
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    import server
+
+    server.serve(expand_inputs(args.files), args.socket or server.DEFAULT_SOCKET, args.interval)
+    return 0
+
+def cmd_lsp(args: argparse.Namespace) -> int:
+    import lsp
+
+    lsp.serve_stdio()
+    return 0
+
+def cmd_query(args: argparse.Namespace) -> int:
+    import json
+
+    import query
+
+    try:
+        node = query.parse_query(args.expression)
+    except query.QuerySyntaxError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    index = query.QueryIndex([broma.parse(path, mapped=True) for path in expand_inputs(args.files)])
+
+    if args.explain:
+        print(node.explain(index))
+
+    rows = index.query(node)
+    if args.count:
+        print(len(rows))
+    elif args.json:
+        print(json.dumps([{"class": x.cls.name if x.cls is not None else None, "kind": x.kind, "name": x.part.name, "line": x.part.line + 1, "text": x.describe()} for x in rows], indent=2))
+    else:
+        for row in rows:
+            print(row.describe())
+
+    return 0
+
+def _type_index(args: argparse.Namespace) -> typeindex.TypeIndex:
+    import typeindex
+
+    paths = expand_inputs(args.files)
+    return typeindex.TypeIndex({str(path): broma.parse(path, mapped=True) for path in paths}, args.known)
+
+def _usage_json(usage: typeindex.Usage) -> dict:
+    return {"class": usage.cls, "kind": usage.kind, "name": usage.symbol, "type": usage.type, "line": usage.line + 1, "text": usage.describe()}
+
+def cmd_uses(args: argparse.Namespace) -> int:
+    import json
+
+    usages = _type_index(args).uses(args.type, args.exact)
+    if args.json:
+        print(json.dumps([_usage_json(x) for x in usages], indent=2))
+    else:
+        for usage in usages:
+            print(usage.describe())
+
+    return 0
+
+def cmd_unresolved_types(args: argparse.Namespace) -> int:
+    import json
+
+    unresolved = _type_index(args).unresolved()
+    if args.json:
+        print(json.dumps({name: [_usage_json(x) for x in usages] for name, usages in unresolved.items()}, indent=2))
+    else:
+        for name, usages in unresolved.items():
+            print(f"{name}: {len(usages)} use(s), first in {usages[0].describe()}")
+
+    return 1 if unresolved else 0
+
+def cmd_stats(args: argparse.Namespace) -> int:
+    import json
+
+    import stats
+
+    cache = stats.StatsCache.load(args.cache) if args.cache else stats.StatsCache()
+    current = stats.files_stats([broma.parse(path, mapped=True) for path in expand_inputs(args.files)], cache)
+    old = stats.files_stats([broma.parse(path, mapped=True) for path in expand_inputs(args.against)], cache) if args.against else None
+    if args.cache:
+        cache.save(args.cache)
+
+    if args.json:
+        out = current.to_json()
+        if old is not None:
+            out["delta"] = current.delta(old).to_json()
+        print(json.dumps(out, indent=2))
+    else:
+        print(stats.format_table(current, old))
+
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="broma", description="Tools for parsing and rewriting broma (.bro) files",
+                                     epilog="Any command takes --profile[=options] to print where the time went, see profiling.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    # commands that don't write files don't get -o and --check
+    def add_batch_args(p: argparse.ArgumentParser, output: bool = True, check: bool = True):
+        p.add_argument("files", nargs="+", help="files, directories or globs")
+        p.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (0 = one per cpu)")
+        if output:
+            p.add_argument("-o", "--output", type=Path, help="output file, or directory when given multiple inputs (default: in place)")
+        if check:
+            p.add_argument("--check", action="store_true", help="don't write anything, exit with 1 if any output would change")
+        p.set_defaults(func=cmd_steps, output=None, check=False)
+
+    add_batch_args(sub.add_parser("dump", help="parse and dump with no changes"))
+    add_batch_args(sub.add_parser("reformat", help="sort and reformat"))
+    add_batch_args(sub.add_parser("clear-offsets", help="clear all function offsets, keeps inlines and pads"))
+
+    p = sub.add_parser("warn", help="print suspicious things")
+    add_batch_args(p, output=False, check=False)
+    p.add_argument("--merge", action="store_true", help="check all inputs as one merged file")
+
+    p = sub.add_parser("run", help="run several steps on each file, parsing it only once")
+    add_batch_args(p)
+    p.add_argument("-s", "--steps", type=parse_steps, required=True, help=f"comma separated steps: {', '.join(STEPS)}")
+
+    p = sub.add_parser("check-syntax", help="report every syntax error in the files, not just the first one")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--json", action="store_true", help="print the errors as json")
+    p.set_defaults(func=cmd_check_syntax)
+
+    p = sub.add_parser("compile", help="save files in the binary format, which loads several times faster (see binary.py)")
+    add_batch_args(p, output=False, check=False)
+    p.add_argument("-o", "--output", type=Path, help="output file, or directory when given multiple inputs (default: next to the input)")
+    p.set_defaults(func=cmd_compile)
+
+    p = sub.add_parser("export-sqlite", help="export to a SQLite database, only changed classes are written again (see sqlite_export.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("-o", "--output", type=Path, default=Path("broma.db"), help="database file (default: broma.db)")
+    p.set_defaults(func=cmd_export_sqlite)
+
+    p = sub.add_parser("history", help="store many versions of a file, deduplicated by content (see history.py)")
+    history_sub = p.add_subparsers(dest="action", required=True)
+    h = history_sub.add_parser("add", help="add a version, replacing one with the same name")
+    h.add_argument("store", type=Path)
+    h.add_argument("version")
+    h.add_argument("file")
+    h.add_argument("--position", type=int, help="where the version goes in the history (default: after the others)")
+    h = history_sub.add_parser("list", help="list the versions")
+    h.add_argument("store", type=Path)
+    h = history_sub.add_parser("checkout", help="write out a version")
+    h.add_argument("store", type=Path)
+    h.add_argument("version")
+    h.add_argument("-o", "--output", type=Path, help="output file (default: stdout)")
+    h = history_sub.add_parser("remove", help="remove a version and the objects only it used")
+    h.add_argument("store", type=Path)
+    h.add_argument("version")
+    h = history_sub.add_parser("log", help="when a class, function or member changed (see timeline.py)")
+    h.add_argument("store", type=Path)
+    h.add_argument("symbol", help="Class, Class::function, Class::function(arg types) or Class::m_member")
+    h.add_argument("--field", help="only this field, e.g. a platform, signature or type")
+    h.add_argument("--at", metavar="VERSION", help="print the values at this version and where they were set instead")
+    h = history_sub.add_parser("stats", help="bind coverage and layout stats of each version, with the change from the one before (see stats.py)")
+    h.add_argument("store", type=Path)
+    h.add_argument("versions", nargs="*", help="only these versions (default: all of them)")
+    h.add_argument("--cache", type=Path, help="file to keep per class stats in, classes counted once aren't loaded again")
+    h.add_argument("--json", action="store_true", help="print the stats as json")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser("rebase", help="move offsets, e.g. after a binary update (see offsets.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("-p", "--platform", help="only move offsets of this platform")
+    p.add_argument("--shift", type=lambda x: int(x, 0), help="add this to every offset (negative values as --shift=-0x10)")
+    p.add_argument("--range", type=parse_range, action="append", metavar="START:END:DELTA", help="add DELTA to the offsets in [START, END), can be repeated")
+    p.add_argument("-o", "--output", type=Path, help="output file, or directory when given multiple inputs (default: in place)")
+    p.add_argument("--check", action="store_true", help="don't write anything, exit with 1 if any file would change")
+    p.set_defaults(func=cmd_rebase)
+
+    p = sub.add_parser("check-binds", help="find duplicate, misplaced and misaligned offsets (see bindcheck.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--align", type=parse_platform_value, action="append", metavar="PLATFORM=N", help="required alignment of functions on a platform")
+    p.add_argument("--range", type=parse_platform_value, action="append", metavar="PLATFORM=START:END", help="offsets a platform's binary covers")
+    p.add_argument("--merge", action="store_true", help="check all inputs as one file")
+    p.add_argument("--json", action="store_true", help="print the issues as json")
+    p.set_defaults(func=cmd_check_binds)
+
+    p = sub.add_parser("verify-binds", help="check that offsets point at function starts in local binaries (see binverify.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--binary", type=parse_platform_value, action="append", required=True, metavar="PLATFORM=PATH", help="binary to check a platform's offsets against")
+    p.add_argument("-j", "--jobs", type=int, default=0, help="worker processes (default: one per platform)")
+    p.add_argument("--json", action="store_true", help="print the suspicious binds as json")
+    p.set_defaults(func=cmd_verify_binds)
+
+    p = sub.add_parser("export-symbols", help="write sorted address -> symbol tables per platform (see symbols.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("-o", "--output", type=Path, default=Path("symbols.bsym"), help="symbol map file (default: symbols.bsym)")
+    p.set_defaults(func=cmd_export_symbols)
+
+    p = sub.add_parser("symbolicate", help="look up addresses in a symbol map, or annotate addresses in stdin")
+    p.add_argument("map", type=Path, help="file written by export-symbols")
+    p.add_argument("platform")
+    p.add_argument("addresses", nargs="*", help="hex addresses")
+    p.set_defaults(func=cmd_symbolicate)
+
+    p = sub.add_parser("diff", help="show differences between two files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser("upgrade", help="merge an older community file into a newer clean one")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("output")
+    p.add_argument("--check", action="store_true", help="don't write anything, exit with 1 if the output would change")
+    p.set_defaults(func=cmd_upgrade)
+
+    p = sub.add_parser("serve", help="keep files parsed in memory and answer JSON-RPC queries on a unix socket")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--socket", help="socket path (default: /tmp/broma.sock, see server.py)")
+    p.add_argument("--interval", type=float, default=0.5, help="seconds between checks for changed files")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("query", help="find functions and members matching an expression, see query.py for the syntax")
+    p.add_argument("expression")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--count", action="store_true", help="only print the number of matches")
+    p.add_argument("--json", action="store_true", help="print the matches as json")
+    p.add_argument("--explain", action="store_true", help="print the query plan")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("uses", help="find every argument, return type and member that uses a type (see typeindex.py)")
+    p.add_argument("type", help="e.g. GJGameLevel, qualifiers, pointers and references are ignored unless --exact is given")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--exact", action="store_true", help="only uses of exactly this type, e.g. `GJGameLevel*` but not `GJGameLevel const&`")
+    p.add_argument("--known", action="append", default=[], metavar="NAME", help="a type that's defined outside the files")
+    p.add_argument("--json", action="store_true", help="print the uses as json")
+    p.set_defaults(func=cmd_uses)
+
+    p = sub.add_parser("unresolved-types", help="list types that aren't a class in the files, a builtin or a known type (see typeindex.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--known", action="append", default=[], metavar="NAME", help="a type that's defined outside the files")
+    p.add_argument("--json", action="store_true", help="print the types and their uses as json")
+    p.set_defaults(func=cmd_unresolved_types)
+
+    p = sub.add_parser("stats", help="count bound, inlined and unbound functions per platform and complete class layouts (see stats.py)")
+    p.add_argument("files", nargs="+", help="files, directories or globs")
+    p.add_argument("--against", nargs="+", metavar="FILE", help="older files to show the change from")
+    p.add_argument("--cache", type=Path, help="file to keep per class stats in, only changed classes are counted again")
+    p.add_argument("--json", action="store_true", help="print the stats as json")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("lsp", help="run the language server on stdin/stdout")
+    p.set_defaults(func=cmd_lsp)
+
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(profiling.start_from_argv(argv))
+    if profiling.is_enabled() and getattr(args, "jobs", 1) != 1:
+        # worker processes are not instrumented
+        args.jobs = 1
+
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# Generates synthetic broma files for benchmarks and tests
+# Run as: python corpus.py <classes> <output> [--seed N] [--version N]
+#
+# The output looks like real bindings: classes with bases and attributes, overloads, multi-line signatures,
+# inlined bodies, platform blocks, pads, comments and global functions at the end.
+# Different `version`s of the same seed are like two releases of the game: offsets move,
+# some functions and classes are added or removed, but most of the file stays the same.
+
+from __future__ import annotations
+
+import argparse
+import random
+from pathlib import Path
+
+PLATFORMS = ["win", "imac", "m1", "ios", "android32", "android64"]
+
+TYPES = [
+    "int", "float", "bool", "double", "unsigned int", "char const*", "gd::string", "gd::string const&",
+    "cocos2d::CCPoint", "cocos2d::CCSize const&", "cocos2d::CCNode*", "cocos2d::CCArray*", "cocos2d::CCObject*",
+    "gd::vector<int>", "gd::vector<cocos2d::CCPoint>&", "gd::map<int, bool>", "cocos2d::ccColor3B",
+]
+
+EXTERNAL_BASES = ["cocos2d::CCNode", "cocos2d::CCLayer", "cocos2d::CCObject", "cocos2d::CCSprite", "FLAlertLayerProtocol"]
+
+WORDS = [
+    "level", "player", "object", "layer", "menu", "popup", "cell", "item", "score", "game", "effect", "sprite",
+    "color", "group", "trigger", "editor", "song", "user", "comment", "reward", "chest", "list", "page", "info",
+]
+
+def _camel(rng: random.Random, n: int, upper: bool) -> str:
+    words = [rng.choice(WORDS) for _ in range(n)]
+    out = "".join(x.capitalize() for x in words)
+    return out if upper else out[0].lower() + out[1:]
+
+class _Generator:
+    def __init__(self, seed: int, version: int) -> None:
+        self.rng = random.Random(seed)
+        # changes between versions come from a separate stream, so that every version shares the same skeleton
+        self.vrng = random.Random(seed * 1000003 + version)
+        self.version = version
+        self.addresses = {x: 0x10000 + self.rng.randrange(0x1000) * 0x10 for x in PLATFORMS}
+        self.shift = {x: self.vrng.randrange(0, 0x400) * 0x10 if version else 0 for x in PLATFORMS}
+
+    def binds(self, platforms: list[str]) -> str:
+        out = []
+        for plat in platforms:
+            self.addresses[plat] += self.rng.randrange(0x10, 0x800, 0x10)
+            if self.rng.random() < 0.05:
+                out.append(f"{plat} inline")
+            else:
+                out.append(f"{plat} {hex(self.addresses[plat] + self.shift[plat])}")
+
+        return ", ".join(out)
+
+    def args(self, count: int) -> list[str]:
+        return [f"{self.rng.choice(TYPES)} p{i}" for i in range(count)]
+
+    def body(self, indent: str) -> list[str]:
+        lines = [f"{indent}    auto x = this->m_field;"]
+        if self.rng.random() < 0.5:
+            lines += [f"{indent}    if (x) {{", f"{indent}        return;", f"{indent}    }}"]
+
+        return lines
+
+    def function(self, class_name: str, name: str, platforms: list[str], virtual: bool = False) -> list[str]:
+        rng = self.rng
+        attrs = "virtual " if virtual else ("static " if rng.random() < 0.1 else "")
+        ret = rng.choice(["void", "bool", "int", "cocos2d::CCNode*", f"{class_name}*", "gd::string"])
+        args = self.args(rng.randrange(0, 5))
+        qualifier = " const" if rng.random() < 0.1 else ""
+
+        out = []
+        if rng.random() < 0.05:
+            out.append("    [[since(\"2.2\")]]")
+
+        roll = rng.random()
+        if roll < 0.1 and args:
+            # multi-line signature
+            out.append(f"    {attrs}{ret} {name}(")
+            out += [f"        {x}," for x in args[:-1]] + [f"        {args[-1]}"]
+            out.append(f"    ){qualifier} = {self.binds(platforms)};")
+        elif roll < 0.2:
+            # inlined body
+            binds = f" = {', '.join(f'{x} inline' for x in platforms[:2])}" if rng.random() < 0.5 else ""
+            out.append(f"    {attrs}{ret} {name}({', '.join(args)}){qualifier}{binds} {{")
+            out += self.body("    ")
+            out.append("    }")
+        else:
+            comment = f" // {rng.choice(WORDS)}" if rng.random() < 0.05 else ""
+            out.append(f"    {attrs}{ret} {name}({', '.join(args)}){qualifier} = {self.binds(platforms)};{comment}")
+
+        return out
+
+    def members(self) -> list[str]:
+        rng = self.rng
+        out = []
+        for _ in range(rng.randrange(0, 12)):
+            roll = rng.random()
+            if roll < 0.2:
+                out.append(f"    PAD = {', '.join(f'{x} {hex(rng.randrange(1, 0x40) * 4)}' for x in rng.sample(PLATFORMS, 2))};")
+            elif roll < 0.25:
+                out.append(f"    // {rng.choice(WORDS)} {rng.choice(WORDS)}")
+            else:
+                out.append(f"    {rng.choice(TYPES).rstrip('&')} m_{_camel(rng, 2, False)};")
+
+        return out
+
+    def cls(self, idx: int, names: list[str]) -> list[str]:
+        rng = self.rng
+        name = names[idx]
+        out = []
+
+        if rng.random() < 0.2:
+            out.append(f"[[link({rng.choice(['android', 'win', 'mac'])})]]")
+
+        bases = []
+        if idx and rng.random() < 0.6:
+            bases.append(names[rng.randrange(idx)])
+        if rng.random() < 0.5:
+            bases.append(rng.choice(EXTERNAL_BASES))
+
+        out.append(f"class {name} " + (f": {', '.join(bases)} " if bases else "") + "{")
+
+        platforms = sorted(rng.sample(PLATFORMS, rng.randrange(2, len(PLATFORMS) + 1)), key=PLATFORMS.index)
+        out += self.function(name, "create", platforms, False)
+        out += self.function(name, "init", platforms, True)
+
+        for _ in range(rng.randrange(1, 12)):
+            fname = _camel(rng, rng.randrange(1, 4), False)
+            lines = self.function(name, fname, platforms, rng.random() < 0.3)
+            if rng.random() < 0.1:
+                # an overload
+                lines += self.function(name, fname, platforms, rng.random() < 0.3)
+
+            # versions drop some functions and add new ones
+            if self.version and self.vrng.random() < 0.02:
+                continue
+            out += lines
+            if self.version and self.vrng.random() < 0.02:
+                out += self.function(name, _camel(self.vrng, 2, False) + f"V{self.version}", platforms)
+
+        if rng.random() < 0.3:
+            out.append("")
+            out.append("    /* some notes")
+            out.append("       about this class */")
+
+        out.append("")
+        out += self.members()
+
+        if rng.random() < 0.1:
+            out.append("")
+            out.append(f"    {', '.join(rng.sample(PLATFORMS[:3], 2))} {{")
+            out.append(f"        bool m_{_camel(rng, 1, False)}Platform;")
+            out.append("    }")
+
+        out.append("}")
+        return out
+
+def generate(classes: int, seed: int = 0, version: int = 0, global_functions: int | None = None) -> str:
+    gen = _Generator(seed, version)
+    rng = gen.rng
+
+    names = []
+    used = set()
+    while len(names) < classes:
+        name = _camel(rng, rng.randrange(2, 4), True)
+        if rng.random() < 0.05:
+            name = f"{rng.choice(['geode', 'gd', 'fmod'])}::{name}"
+        if name not in used:
+            used.add(name)
+            names.append(name)
+
+    out = [
+        "// clang-format off",
+        "// generated by corpus.py, do not edit",
+        "",
+    ]
+
+    for idx in range(classes):
+        lines = gen.cls(idx, names)
+        if version and gen.vrng.random() < 0.01:
+            continue
+
+        out += lines
+        out.append("")
+
+    if version:
+        for i in range(max(1, classes // 100)):
+            out += [f"class NewClass{version}x{i} : cocos2d::CCNode {{"] + gen.function(f"NewClass{version}x{i}", "create", PLATFORMS[:4]) + ["}", ""]
+
+    for _ in range(global_functions if global_functions is not None else max(1, classes // 20)):
+        out.append(f"{rng.choice(['void', 'int', 'bool'])} {_camel(rng, 2, False)}({', '.join(gen.args(rng.randrange(0, 3)))}) = {gen.binds(PLATFORMS[:2])};")
+
+    return "\n".join(out) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic broma file")
+    parser.add_argument("classes", type=int)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version", type=int, default=0, help="generate a later version of the same file")
+    args = parser.parse_args()
+
+    args.output.write_text(generate(args.classes, args.seed, args.version))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+# Parser for the C++ types used in broma: argument, return and member types
+#
+# `parse_type("gd::map<int, GJGameLevel*> const&")` gives a CppType with the qualified name, template arguments,
+# cv qualifiers, pointer and reference declarators, array sizes and, for function pointers, the return and parameter
+# types. `parse_declaration("uint8_t m_data[4]")` also splits off the declared name.
+# The same few hundred type strings show up thousands of times in a file, so every distinct string is parsed once and
+# the (immutable) result is kept in a memo table shared by all callers.
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, replace
+from typing import Iterator
+
+# words that are only part of a builtin type
+BUILTINS = {
+    "void", "bool", "char", "wchar_t", "char8_t", "char16_t", "char32_t", "short", "int", "long", "float", "double",
+    "signed", "unsigned", "auto", "nullptr_t",
+}
+CV = {"const", "volatile"}
+# keywords before a type that don't change it
+ELABORATIONS = {"struct", "class", "enum", "union", "typename"}
+
+class CppTypeError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class CppType:
+    name: str # qualified name like "gd::vector", builtin words like "unsigned int", "" for function types
+    template_args: tuple[CppType | str, ...] = () # types, or the text of non-type arguments like "4"
+    const: bool = False
+    volatile: bool = False
+    # pointers and references from the inside out, "*" (optionally followed by " const"/" volatile"), "&" or "&&".
+    # `char const* const*` is ("* const", "*")
+    declarators: tuple[str, ...] = ()
+    arrays: tuple[str, ...] = () # sizes, "" for `[]`
+    # pointers and references to the whole array: `int(&)[4]` is CppType("int", arrays=("4",), array_declarators=("&",))
+    array_declarators: tuple[str, ...] = ()
+    # for names inside a template, like `gd::vector<int>::iterator`: the template (`gd::vector<int>`), and `name`
+    # is what comes after it ("iterator")
+    scope: CppType | None = None
+    # function types: `void(*)(int)` is CppType("", returns=void, params=(int,), declarators=("*",))
+    returns: CppType | None = None
+    params: tuple[CppType, ...] = ()
+
+    @property
+    def is_function(self) -> bool:
+        return self.returns is not None
+
+    @property
+    def is_builtin(self) -> bool:
+        return bool(self.name) and all(x in BUILTINS for x in self.name.split(" "))
+
+    @property
+    def is_pointer(self) -> bool:
+        declarators = self.array_declarators or self.declarators
+        return bool(declarators) and declarators[-1].startswith("*")
+
+    @property
+    def is_reference(self) -> bool:
+        declarators = self.array_declarators or self.declarators
+        return bool(declarators) and declarators[-1].startswith("&")
+
+    @property
+    def namespace(self) -> str:
+        if self.scope is not None:
+            return self.scope.format()
+        return "" if self.is_builtin else self.name.rpartition("::")[0]
+
+    @property
+    def unqualified(self) -> str:
+        return self.name if self.is_builtin else self.name.rpartition("::")[2]
+
+    # the type without its pointers, references, arrays and cv qualifiers: `gd::string const&` -> `gd::string`
+    @property
+    def base(self) -> CppType:
+        if self.is_function:
+            return self
+        return CppType(self.name, self.template_args, scope=self.scope)
+
+    # every name the type uses, outermost first: `gd::map<int, Foo*>` -> "gd::map", "int", "Foo". Names inside a
+    # template are part of it, `gd::vector<Foo>::iterator` -> "gd::vector", "Foo"
+    def names(self) -> Iterator[str]:
+        if self.returns is not None:
+            yield from self.returns.names()
+        if self.scope is not None:
+            yield from self.scope.names()
+        elif self.name:
+            yield self.name
+        for arg in self.template_args:
+            if isinstance(arg, CppType):
+                yield from arg.names()
+        for param in self.params:
+            yield from param.names()
+
+    # the type in broma's usual spelling, cv qualifiers after what they apply to: `gd::vector<int> const&`
+    def format(self) -> str:
+        if self.is_function:
+            inner = "".join(self.declarators) + "".join(f"[{x}]" for x in self.arrays)
+            return f"{self.returns.format()}{f'({inner})' if inner else ''}({', '.join(x.format() for x in self.params)})"
+
+        out = f"{self.scope.format()}::{self.name}" if self.scope is not None else self.name
+        if self.template_args:
+            out += f"<{', '.join(x.format() if isinstance(x, CppType) else x for x in self.template_args)}>"
+        if self.const:
+            out += " const"
+        if self.volatile:
+            out += " volatile"
+        out += "".join(self.declarators)
+        if self.array_declarators:
+            out += f"({''.join(self.array_declarators)})"
+        return out + "".join(f"[{x}]" for x in self.arrays)
+
+    def __str__(self) -> str:
+        return self.format()
+
+_TOKEN = re.compile(r"\s*(?:([A-Za-z_]\w*(?:\s*::\s*[A-Za-z_~]\w*)*)|(&&|::|[<>,*&()\[\]])|(\S))")
+
+@dataclass
+class _Token:
+    text: str
+    start: int
+    end: int
+    word: bool
+
+def _tokenize(text: str) -> list[_Token]:
+    out = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        word, punct, other = match.groups()
+        if word is not None:
+            out.append(_Token("".join(word.split()), match.start(1), match.end(1), True))
+        else:
+            value = punct if punct is not None else other
+            group = 2 if punct is not None else 3
+            out.append(_Token(value, match.start(group), match.end(group), False))
+        pos = match.end()
+    return out
+
+class _Parser:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.idx = 0
+        # where the declared name was, for declarations
+        self.name: _Token | None = None
+
+    def peek(self, offset: int = 0) -> _Token | None:
+        idx = self.idx + offset
+        return self.tokens[idx] if idx < len(self.tokens) else None
+
+    def at(self, text: str) -> bool:
+        token = self.peek()
+        return token is not None and token.text == text
+
+    def expect(self, text: str) -> _Token:
+        token = self.peek()
+        if token is None or token.text != text:
+            found = "the end" if token is None else f"'{token.text}'"
+            raise CppTypeError(f"expected '{text}' but found {found} in '{self.text}'")
+        self.idx += 1
+        return token
+
+    def error(self, message: str) -> CppTypeError:
+        return CppTypeError(f"{message} in '{self.text}'")
+
+    # the raw text of a non-type template argument or an array size, up to a `,`/`>`/`]` at the same depth
+    def raw_until(self, ends: str) -> str:
+        depth = 0
+        start = self.peek()
+        end = None
+        while (token := self.peek()) is not None:
+            if depth == 0 and token.text in ends:
+                break
+            if token.text in "(<[":
+                depth += 1
+            elif token.text in ")>]":
+                depth -= 1
+            end = token
+            self.idx += 1
+
+        if end is None:
+            return ""
+        return self.text[start.start:end.end]
+
+    def cv(self) -> tuple[bool, bool]:
+        const = volatile = False
+        while (token := self.peek()) is not None and token.text in CV:
+            const |= token.text == "const"
+            volatile |= token.text == "volatile"
+            self.idx += 1
+        return const, volatile
+
+    def declarators(self) -> list[str]:
+        out = []
+        while (token := self.peek()) is not None and token.text in ("*", "&", "&&"):
+            self.idx += 1
+            if token.text == "*":
+                const, volatile = self.cv()
+                out.append("*" + " const" * const + " volatile" * volatile)
+            else:
+                out.append(token.text)
+        return out
+
+    def arrays(self) -> list[str]:
+        out = []
+        while self.at("["):
+            self.idx += 1
+            out.append(self.raw_until("]"))
+            self.expect("]")
+        return out
+
+    def template_args(self) -> list[CppType | str]:
+        self.expect("<")
+        out = []
+        while not self.at(">"):
+            token = self.peek()
+            if token is None:
+                raise self.error("unterminated template argument list")
+
+            start = self.idx
+            try:
+                arg = self.type(allow_name=False)
+                if not self.at(",") and not self.at(">"):
+                    raise self.error("not a type")
+            except CppTypeError:
+                self.idx = start
+                arg = self.raw_until(",>")
+            out.append(arg)
+
+            if not self.at(">"):
+                self.expect(",")
+        self.expect(">")
+        return out
+
+    def params(self) -> list[CppType]:
+        self.expect("(")
+        out = []
+        while not self.at(")"):
+            param = self.type(allow_name=True, nested=True)
+            if not (param.name == "void" and not param.declarators and not out and self.at(")")):
+                out.append(param)
+            if not self.at(")"):
+                self.expect(",")
+        self.expect(")")
+        return out
+
+    # a type, and its declared name after it when `allow_name` is set
+    def type(self, allow_name: bool, nested: bool = False) -> CppType:
+        const, volatile = self.cv()
+        while (token := self.peek()) is not None and token.text in ELABORATIONS:
+            self.idx += 1
+
+        token = self.peek()
+        if token is None or not token.word:
+            raise self.error("expected a type name")
+
+        template_args: list[CppType | str] = []
+        scope = None
+        if token.text in BUILTINS:
+            words = []
+            while (token := self.peek()) is not None and (token.text in BUILTINS or token.text in CV):
+                if token.text in CV:
+                    const |= token.text == "const"
+                    volatile |= token.text == "volatile"
+                else:
+                    words.append(token.text)
+                self.idx += 1
+            name = " ".join(words)
+        else:
+            name = token.text
+            self.idx += 1
+            if self.at("<"):
+                template_args = self.template_args()
+            # members of a template, like `Foo<int>::Bar`
+            while template_args and self.at("::"):
+                self.idx += 1
+                token = self.peek()
+                if token is None or not token.word:
+                    raise self.error("expected a name after '::'")
+                scope = CppType(name, tuple(template_args), scope=scope)
+                name = token.text
+                self.idx += 1
+                template_args = self.template_args() if self.at("<") else []
+
+        post_const, post_volatile = self.cv()
+        const |= post_const
+        volatile |= post_volatile
+
+        result = CppType(name, tuple(template_args), const, volatile, tuple(self.declarators()), scope=scope)
+
+        # function pointers and references, `void(*)(int)` or `void(*callback)(int)`, and pointers and references
+        # to arrays, `int(&)[4]` or `int(&values)[4]`
+        if self.at("(") and (self.peek(1) is not None and self.peek(1).text in ("*", "&", "&&")):
+            self.idx += 1
+            declarators = self.declarators()
+            if allow_name and (token := self.peek()) is not None and token.word:
+                if not nested:
+                    self.name = token
+                self.idx += 1
+            arrays = self.arrays()
+            self.expect(")")
+            if not arrays and self.at("["):
+                return replace(result, arrays=tuple(self.arrays()), array_declarators=tuple(declarators))
+            params = self.params()
+            return CppType("", declarators=tuple(declarators), arrays=tuple(arrays), returns=result, params=tuple(params))
+
+        # plain function types, only in template arguments like `std::function<void(int)>`
+        if not allow_name and self.at("("):
+            return CppType("", returns=result, params=tuple(self.params()))
+
+        if allow_name and (token := self.peek()) is not None and token.word and token.text not in CV:
+            if not nested:
+                self.name = token
+            self.idx += 1
+
+        arrays = self.arrays()
+        if arrays:
+            result = replace(result, arrays=tuple(arrays))
+        return result
+
+    def finish(self):
+        token = self.peek()
+        if token is not None:
+            raise self.error(f"unexpected '{token.text}'")
+
+_parsed_types: dict[str, CppType | CppTypeError] = {}
+_parsed_declarations: dict[str, tuple[CppType, str, int, int] | CppTypeError] = {}
+_split_declarations: dict[str, tuple[str, str]] = {}
+_joined_declarations: dict[tuple[str, str], str] = {}
+
+def _memoized(memo: dict, text: str, parse):
+    result = memo.get(text)
+    if result is None:
+        try:
+            result = parse(text)
+        except CppTypeError as e:
+            result = e
+        memo[text] = result
+
+    if isinstance(result, CppTypeError):
+        raise result
+    return result
+
+def _parse_type(text: str) -> CppType:
+    parser = _Parser(text)
+    out = parser.type(allow_name=False)
+    parser.finish()
+    return out
+
+def _parse_declaration(text: str) -> tuple[CppType, str, int, int]:
+    parser = _Parser(text)
+    out = parser.type(allow_name=True)
+    parser.finish()
+    if parser.name is None:
+        return out, "", -1, -1
+    return out, parser.name.text, parser.name.start, parser.name.end
+
+# the type in `text`, raises CppTypeError if it isn't one
+def parse_type(text: str) -> CppType:
+    return _memoized(_parsed_types, text, _parse_type)
+
+# the type and name in a declaration like `gd::string const& name` or `int values[4]`, the name is "" if there is none
+def parse_declaration(text: str) -> tuple[CppType, str]:
+    type, name, _, _ = _memoized(_parsed_declarations, text, _parse_declaration)
+    return type, name
+
+# `Type name`, `ns::Type* name` and the like, which is most declarations and doesn't need the parser
+_SIMPLE_DECLARATION = re.compile(r"\s*([A-Za-z_]\w*(?:::[A-Za-z_]\w*)*)(?:\s+|[\s*&]*[*&][\s*&]*)([A-Za-z_]\w*)\s*")
+
+# splits a declaration into the text of its type and its name, `uint8_t m_data[4]` -> ("uint8_t[4]", "m_data").
+# The type keeps its spelling, only the name is taken out of it
+def split_declaration(text: str) -> tuple[str, str]:
+    result = _split_declarations.get(text)
+    if result is None:
+        result = _split_declarations[text] = _split_declaration(text)
+    return result
+
+def _split_declaration(text: str) -> tuple[str, str]:
+    match = _SIMPLE_DECLARATION.fullmatch(text)
+    if match is not None:
+        first, name = match.groups()
+        if first not in CV and first not in ELABORATIONS and name not in BUILTINS and name not in CV and name not in ELABORATIONS:
+            return text[:match.start(2)].strip(), name
+
+    _, name, start, end = _memoized(_parsed_declarations, text, _parse_declaration)
+    if not name:
+        return text.strip(), ""
+
+    before, after = text[:start].strip(), text[end:].strip()
+    if after.startswith(")") and before.endswith(("*", "&")):
+        return f"{before}{after}", name
+    return f"{before}{after}" if after.startswith("[") else f"{before} {after}".strip(), name
+
+# the inverse of split_declaration, puts the name back where it goes: after the type, before its array sizes, or
+# inside the parentheses of a function pointer
+def join_declaration(type: str, name: str) -> str:
+    if not name:
+        return type
+    if "[" not in type and "(" not in type:
+        return f"{type} {name}"
+
+    result = _joined_declarations.get((type, name))
+    if result is None:
+        result = _joined_declarations[type, name] = _join_declaration(type, name)
+    return result
+
+def _join_declaration(type: str, name: str) -> str:
+    depth = 0
+    for idx, char in enumerate(type):
+        if char in "<(":
+            if char == "(" and depth == 0 and type[idx + 1:idx + 2] in ("*", "&"):
+                close = type.index(")", idx)
+                inner = type[idx + 1:close]
+                split = len(inner.rstrip("]").partition("[")[0]) if "[" in inner else len(inner)
+                return f"{type[:idx + 1]}{inner[:split]}{name}{inner[split:]}{type[close:]}"
+            depth += 1
+        elif char in ">)":
+            depth -= 1
+        elif char == "[" and depth == 0:
+            return f"{type[:idx]} {name}{type[idx:]}"
+
+    return f"{type} {name}"
+
+# splits the text after the opening parenthesis of an argument list into the arguments and what comes after the
+# closing one, with commas and parentheses inside template arguments and function pointer types left alone
+def split_arguments(text: str) -> tuple[list[str], str]:
+    end = text.find(")")
+    head = text if end == -1 else text[:end]
+    if "<" not in head and "(" not in head:
+        return head.split(","), "" if end == -1 else text[end + 1:]
+
+    out = []
+    depth = 0
+    start = 0
+    for idx, char in enumerate(text):
+        if char in "<([":
+            depth += 1
+        elif char in ">]" or (char == ")" and depth > 0):
+            depth -= 1
+        elif char == ")":
+            out.append(text[start:idx])
+            return out, text[idx + 1:]
+        elif char == "," and depth == 0:
+            out.append(text[start:idx])
+            start = idx + 1
+
+    out.append(text[start:])
+    return out, ""
+
+def cache_size() -> int:
+    return len(_parsed_types) + len(_parsed_declarations) + len(_split_declarations) + len(_joined_declarations)
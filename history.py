@@ -0,0 +1,383 @@
+# Content addressed store of many versions of a bindings file
+# Run as: python cli.py history add <store> <version> <file>
+#         python cli.py history list <store>
+#         python cli.py history checkout <store> <version> [-o output]
+#
+# Every function and every class is stored once per distinct content, keyed by its hash, in a SQLite database.
+# A version is the ordered list of its class keys (plus where each class starts in the file) and its global functions,
+# so adding a version where most classes didn't change only stores the ones that did.
+#
+# Objects are encoded like the payload of the binary format (see binary.py), with strings as ids into one string table
+# shared by the whole store, so a function takes a few bytes. Lines are stored relative to the start of their class,
+# so moving a class around doesn't change it. Functions are objects of their own: a class object only marks where
+# they go, the keys of its functions are listed in `class_functions` (and are part of the class key). So a class where
+# one function changed shares all the others with the previous version.
+# Loading a version joins all its class objects and all its function objects into two buffers and decodes each in one go.
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+import binary
+import broma
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS objects (
+    key BLOB PRIMARY KEY,
+    kind INTEGER NOT NULL, -- 0: text, 1: class, 2: function
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    preamble BLOB NOT NULL REFERENCES objects(key),
+    line_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS version_classes (
+    version_id INTEGER NOT NULL REFERENCES versions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    class_key BLOB NOT NULL REFERENCES objects(key),
+    start_line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    PRIMARY KEY (version_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS version_globals (
+    version_id INTEGER NOT NULL REFERENCES versions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    function_key BLOB NOT NULL REFERENCES objects(key),
+    line INTEGER NOT NULL,
+    PRIMARY KEY (version_id, position)
+) WITHOUT ROWID;
+-- which functions a class object refers to
+CREATE TABLE IF NOT EXISTS class_functions (
+    class_key BLOB NOT NULL,
+    position INTEGER NOT NULL,
+    function_key BLOB NOT NULL,
+    PRIMARY KEY (class_key, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS version_classes_name ON version_classes(name);
+"""
+
+KIND_TEXT = 0
+KIND_CLASS = 1
+KIND_FUNCTION = 2
+
+# in class objects, where a function goes
+TAG_FUNCTION_REF = 100
+
+def object_key(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+# writes strings as ids into `strings` (adding new ones) and lines relative to `base`, unknown lines
+# (and ones before `base`) as 0
+class _Writer(binary.Writer):
+    def __init__(self, strings: dict[str, int], base: int) -> None:
+        super().__init__()
+        self.strings = strings
+        self.base = base
+        # (key, data) of the functions of a class, in order
+        self.functions: list[tuple[bytes, bytes]] = []
+
+    def str(self, value: str):
+        idx = self.strings.get(value)
+        if idx is None:
+            idx = self.strings[value] = len(self.strings)
+        self.uint(idx)
+
+    def line(self, line: int):
+        self.uint(line - self.base + 1 if line >= self.base else 0)
+
+    def part(self, part):
+        if isinstance(part, broma.BromaFunction):
+            data = encode_function(part, self.strings)
+            self.functions.append((object_key(data), data))
+            self.uint(TAG_FUNCTION_REF)
+            self.line(part.line)
+        else:
+            super().part(part)
+
+    def finish(self) -> bytes:
+        out = bytearray()
+        for value in self.values:
+            binary._write_uint(out, value)
+        return bytes(out)
+
+class _Reader(binary.Reader):
+    # `functions` reads the functions that class objects refer to
+    def __init__(self, data: bytes, strings: list[str], functions: _Reader | None = None) -> None:
+        self.strings = strings
+        self.next = iter(binary.decode_uints(data)).__next__
+        self.functions = functions
+
+    def tagged_part(self, tag: int):
+        if tag != TAG_FUNCTION_REF:
+            return super().tagged_part(tag)
+
+        func = self.functions.function()
+        func.line = self.next() - 1
+        return func
+
+    def cls_at(self, start_line: int, end_line: int) -> broma.BromaClass:
+        next = self.next
+        name = self.strings[next()]
+        attributes = self.str_list()
+        bases = self.str_list()
+        parts = [self.part() for _ in range(next())]
+
+        for part in parts:
+            if part.line != -1:
+                part.line += start_line
+        return broma.BromaClass(name, attributes, parts, bases, start_line, end_line)
+
+# functions are stored without their line, it's kept by whatever refers to them
+def encode_function(func: broma.BromaFunction, strings: dict[str, int]) -> bytes:
+    writer = _Writer(strings, base=1 << 62)
+    writer.function(func)
+    return writer.finish()
+
+# the class object (with lines relative to the class start), its key and the (key, data) of its functions
+def encode_class(cls: broma.BromaClass, strings: dict[str, int]) -> tuple[bytes, bytes, list[tuple[bytes, bytes]]]:
+    writer = _Writer(strings, base=cls.start_line)
+    writer.str(cls.name)
+    writer.str_list(cls.attributes)
+    writer.str_list(cls.bases)
+    writer.uint(len(cls.parts))
+    for part in cls.parts:
+        writer.part(part)
+
+    data = writer.finish()
+    # a class object covers its functions too
+    return data, object_key(data + b"".join(key for key, _ in writer.functions)), writer.functions
+
+@dataclass
+class AddStats:
+    classes_added: int = 0
+    classes_reused: int = 0
+    functions_added: int = 0
+    functions_reused: int = 0
+
+@dataclass
+class Version:
+    name: str
+    position: int
+    classes: int
+    line_count: int
+
+class HistoryStore:
+    def __init__(self, path: Path | str) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if version is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        elif int(version[0]) != SCHEMA_VERSION:
+            self.conn.close()
+            raise ValueError(f"{path} has schema version {version[0]}, expected {SCHEMA_VERSION}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> HistoryStore:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _insert_objects(self, kind: int, objects: list[tuple[bytes, bytes]]) -> int:
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO objects VALUES (?, ?, ?)", ((key, kind, data) for key, data in objects))
+        return self.conn.total_changes - before
+
+    # stores `file` as version `name`, after all other versions unless `position` is given. Adding a version
+    # with an existing name replaces it, in its place unless `position` is given.
+    def add(self, name: str, file: broma.Broma, position: int | None = None) -> AddStats:
+        stats = AddStats()
+        strings = {value: idx for idx, value in enumerate(self._strings())}
+        known_strings = len(strings)
+        class_objects = {}
+        function_objects = {}
+        class_functions = []
+        rows = []
+
+        for idx, cls in enumerate(file.classes):
+            data, key, functions = encode_class(cls, strings)
+            if key not in class_objects:
+                class_objects[key] = data
+                class_functions += [(key, pos, func_key) for pos, (func_key, _) in enumerate(functions)]
+            function_objects.update(functions)
+            rows.append((idx, cls.name, key, cls.start_line, cls.end_line))
+
+        global_rows = []
+        for idx, func in enumerate(file.global_functions):
+            data = encode_function(func, strings)
+            key = object_key(data)
+            function_objects[key] = data
+            global_rows.append((idx, key, func.line))
+
+        preamble = file.preamble.encode("utf-8")
+        preamble_key = object_key(preamble)
+
+        with self.conn:
+            if position is None:
+                row = self.conn.execute("SELECT position FROM versions WHERE name = ?", (name,)).fetchone()
+                position = row[0] if row else self.conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM versions").fetchone()[0]
+            self.conn.execute("DELETE FROM versions WHERE name = ?", (name,))
+            self.conn.executemany("INSERT INTO strings VALUES (?, ?)", ((idx, value) for value, idx in strings.items() if idx >= known_strings))
+
+            self._insert_objects(KIND_TEXT, [(preamble_key, preamble)])
+            stats.classes_added = self._insert_objects(KIND_CLASS, list(class_objects.items()))
+            stats.functions_added = self._insert_objects(KIND_FUNCTION, list(function_objects.items()))
+            stats.classes_reused = len(class_objects) - stats.classes_added
+            stats.functions_reused = len(function_objects) - stats.functions_added
+            self.conn.executemany("INSERT OR IGNORE INTO class_functions VALUES (?, ?, ?)", class_functions)
+
+            version_id = self.conn.execute(
+                "INSERT INTO versions (name, position, preamble, line_count) VALUES (?, ?, ?, ?)",
+                (name, position, preamble_key, file.line_count),
+            ).lastrowid
+            self.conn.executemany("INSERT INTO version_classes VALUES (?, ?, ?, ?, ?, ?)", ((version_id, *x) for x in rows))
+            self.conn.executemany("INSERT INTO version_globals VALUES (?, ?, ?, ?)", ((version_id, *x) for x in global_rows))
+
+        return stats
+
+    def _strings(self) -> list[str]:
+        return [x for x, in self.conn.execute("SELECT value FROM strings ORDER BY id")]
+
+    def versions(self) -> list[Version]:
+        return [Version(*row) for row in self.conn.execute(
+            "SELECT name, position, (SELECT COUNT(*) FROM version_classes WHERE version_id = id), line_count FROM versions ORDER BY position, id"
+        )]
+
+    def _version_id(self, name: str) -> int:
+        row = self.conn.execute("SELECT id FROM versions WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"no version named '{name}'")
+        return row[0]
+
+    def remove(self, name: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM versions WHERE id = ?", (self._version_id(name),))
+
+    # objects no version refers to anymore, e.g. after `remove`. Returns how many were deleted.
+    def collect_garbage(self) -> int:
+        with self.conn:
+            self.conn.execute("""
+                DELETE FROM class_functions WHERE class_key NOT IN (SELECT class_key FROM version_classes)
+            """)
+            before = self.conn.total_changes
+            self.conn.execute("""
+                DELETE FROM objects WHERE key NOT IN (SELECT class_key FROM version_classes)
+                AND key NOT IN (SELECT function_key FROM class_functions)
+                AND key NOT IN (SELECT function_key FROM version_globals)
+                AND key NOT IN (SELECT preamble FROM versions)
+            """)
+            return self.conn.total_changes - before
+
+    def _objects(self, query: str, args: tuple) -> dict[bytes, bytes]:
+        return dict(self.conn.execute(f"SELECT key, data FROM objects WHERE key IN ({query})", args))
+
+    # rebuilds the tree of a version
+    def load(self, name: str) -> broma.Broma:
+        version_id = self._version_id(name)
+        preamble_key, line_count = self.conn.execute("SELECT preamble, line_count FROM versions WHERE id = ?", (version_id,)).fetchone()
+        strings = self._strings()
+
+        rows = self.conn.execute(
+            "SELECT class_key, start_line, end_line FROM version_classes WHERE version_id = ? ORDER BY position", (version_id,)
+        ).fetchall()
+        global_rows = self.conn.execute(
+            "SELECT function_key, line FROM version_globals WHERE version_id = ? ORDER BY position", (version_id,)
+        ).fetchall()
+
+        classes = self._objects("SELECT class_key FROM version_classes WHERE version_id = ?", (version_id,))
+        functions = self._objects(
+            "SELECT function_key FROM class_functions WHERE class_key IN (SELECT class_key FROM version_classes WHERE version_id = ?)"
+            " UNION SELECT function_key FROM version_globals WHERE version_id = ?",
+            (version_id, version_id),
+        )
+        class_functions: dict[bytes, list[bytes]] = {}
+        for key, function_key in self.conn.execute(
+            "SELECT class_key, function_key FROM class_functions WHERE class_key IN (SELECT class_key FROM version_classes WHERE version_id = ?)"
+            " ORDER BY class_key, position",
+            (version_id,),
+        ):
+            class_functions.setdefault(key, []).append(function_key)
+
+        # the functions in the order the classes refer to them
+        function_reader = _Reader(b"".join(functions[x] for key, _, _ in rows for x in class_functions.get(key, [])), strings)
+        reader = _Reader(b"".join(classes[key] for key, _, _ in rows), strings, function_reader)
+
+        out = broma.Broma("", source="none")
+        out.preamble = str(self._objects("?", (preamble_key,))[preamble_key], "utf-8")
+        out.line_count = line_count
+        out.classes = [reader.cls_at(start, end) for _, start, end in rows]
+
+        global_reader = _Reader(b"".join(functions[key] for key, _ in global_rows), strings)
+        out.global_functions = []
+        for _, line in global_rows:
+            func = global_reader.function()
+            func.line = line
+            out.global_functions.append(func)
+
+        return out
+
+    def _objects_by_key(self, keys: list[bytes]) -> dict[bytes, bytes]:
+        out = {}
+        for idx in range(0, len(keys), 500):
+            chunk = keys[idx:idx + 500]
+            out.update(self._objects(", ".join("?" * len(chunk)), tuple(chunk)))
+        return out
+
+    # (class name, class key) of the classes of a version, in order
+    def class_keys(self, name: str) -> list[tuple[str, bytes]]:
+        return self.conn.execute(
+            "SELECT name, class_key FROM version_classes WHERE version_id = ? ORDER BY position", (self._version_id(name),)
+        ).fetchall()
+
+    def global_keys(self, name: str) -> list[bytes]:
+        return [x for x, in self.conn.execute(
+            "SELECT function_key FROM version_globals WHERE version_id = ? ORDER BY position", (self._version_id(name),)
+        )]
+
+    # decodes single classes, with lines relative to the start of the class
+    def load_classes(self, keys: list[bytes]) -> dict[bytes, broma.BromaClass]:
+        keys = list(dict.fromkeys(keys))
+        classes = self._objects_by_key(keys)
+        class_functions: dict[bytes, list[bytes]] = {key: [] for key in keys}
+        for idx in range(0, len(keys), 500):
+            chunk = keys[idx:idx + 500]
+            for key, function_key in self.conn.execute(
+                f"SELECT class_key, function_key FROM class_functions WHERE class_key IN ({', '.join('?' * len(chunk))}) ORDER BY class_key, position",
+                chunk,
+            ):
+                class_functions[key].append(function_key)
+
+        functions = self._objects_by_key(list({x for keys in class_functions.values() for x in keys}))
+        strings = self._strings()
+        out = {}
+        for key in keys:
+            reader = _Reader(classes[key], strings, _Reader(b"".join(functions[x] for x in class_functions[key]), strings))
+            out[key] = reader.cls_at(0, 0)
+        return out
+
+    def load_functions(self, keys: list[bytes]) -> list[broma.BromaFunction]:
+        functions = self._objects_by_key(list(set(keys)))
+        reader = _Reader(b"".join(functions[key] for key in keys), self._strings())
+        return [reader.function() for _ in keys]
+
+    # number of stored objects and their total size in bytes
+    def size(self) -> tuple[int, int]:
+        return self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM objects").fetchone()
@@ -0,0 +1,360 @@
+# Lint engine for broma files, used by warn.py
+#
+# Rules subclass `Rule`, get registered with `@rule` and implement any of the visit_* methods.
+# A file is walked once, and every node is handed to all rules that care about it.
+# Results are cached per class by content hash, so linting again after an edit only runs the rules on the classes
+# that changed. Rules should only look at other classes through `LintContext.has_class` and `LintContext.overloads`,
+# the cache key covers exactly what those return.
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import broma
+
+# bases from these namespaces are defined outside of the bindings (or in other files), don't report them as unknown
+EXTERNAL_NAMESPACES = ("cocos2d::", "std::", "gd::", "fmod::", "FMOD::")
+
+# pads bigger than this are probably a typo
+MAX_PAD_SIZE = 0x2000
+
+@dataclass
+class Diagnostic:
+    rule: str
+    message: str
+    class_name: str
+    line: int = -1 # 0-based line in the file, -1 if unknown
+    severity: str = "warning" # "warning" or "note"
+
+    def format(self) -> str:
+        location = f"line {self.line + 1}: " if self.line != -1 else ""
+        return f"{location}{self.message} [{self.rule}]"
+
+# `known` are names of classes defined in other files, for linting files one at a time without reporting bases from
+# the others as unknown
+class LintContext:
+    def __init__(self, file: broma.Broma, known: Iterable[str] = ()) -> None:
+        self.file = file
+        self.known = set(known)
+        self.known_unqualified = {x.rpartition("::")[2] for x in self.known}
+        self.classes = {}
+        for cls in file.classes:
+            self.classes.setdefault(cls.name, cls)
+
+        # unqualified name -> class, for bases written without their namespace
+        self.unqualified = {}
+        for cls in file.classes:
+            self.unqualified.setdefault(cls.name.rpartition("::")[2], cls)
+
+        # by id(class), merged files can have several classes with the same name
+        self._ancestors: dict[int, list[broma.BromaClass]] = {}
+        self._overloads: dict[int, dict[str, list[broma.BromaFunction]]] = {}
+
+    def find_class(self, name: str) -> broma.BromaClass | None:
+        return self.classes.get(name) or self.unqualified.get(name.rpartition("::")[2])
+
+    def has_class(self, name: str) -> bool:
+        return self.find_class(name) is not None or name in self.known or name.rpartition("::")[2] in self.known_unqualified
+
+    # all classes that `cls` inherits from, nearest first. Cycles are cut off.
+    def ancestors(self, cls: broma.BromaClass) -> list[broma.BromaClass]:
+        if id(cls) in self._ancestors:
+            return self._ancestors[id(cls)]
+
+        out = []
+        seen = {cls.name}
+        stack = list(reversed(cls.bases))
+
+        while stack:
+            base = self.find_class(stack.pop())
+            if base is None or base.name in seen:
+                continue
+
+            seen.add(base.name)
+            out.append(base)
+            stack.extend(reversed(base.bases))
+
+        self._ancestors[id(cls)] = out
+        return out
+
+    # function name -> all functions with that name in the class and everything it inherits from
+    def overloads(self, cls: broma.BromaClass) -> dict[str, list[broma.BromaFunction]]:
+        if id(cls) in self._overloads:
+            return self._overloads[id(cls)]
+
+        overloads = {}
+        for c in [cls] + self.ancestors(cls):
+            for part, _ in c.walk_parts():
+                if isinstance(part, broma.BromaFunction):
+                    overloads.setdefault(part.name, []).append(part)
+
+        self._overloads[id(cls)] = overloads
+        return overloads
+
+class Rule:
+    name = ""
+
+    def __init__(self, ctx: LintContext, report) -> None:
+        self.ctx = ctx
+        self._report = report
+
+    def report(self, cls: broma.BromaClass, message: str, line: int = -1, severity: str = "warning"):
+        self._report(Diagnostic(self.name, message, cls.name, line if line != -1 else cls.start_line, severity))
+
+    # called before the parts of the class are visited
+    def visit_class(self, cls: broma.BromaClass):
+        pass
+
+    def visit_function(self, cls: broma.BromaClass, func: broma.BromaFunction):
+        pass
+
+    def visit_member(self, cls: broma.BromaClass, member: broma.BromaMember):
+        pass
+
+    def visit_pad(self, cls: broma.BromaClass, pad: broma.BromaPad):
+        pass
+
+    # called after all parts of the class were visited
+    def end_class(self, cls: broma.BromaClass):
+        pass
+
+RULES: list[type[Rule]] = []
+
+def rule(cls: type[Rule]) -> type[Rule]:
+    RULES.append(cls)
+    return cls
+
+@rule
+class MixedVirtualOverloads(Rule):
+    name = "mixed-virtual-overloads"
+
+    def visit_class(self, cls: broma.BromaClass):
+        for name, funcs in self.ctx.overloads(cls).items():
+            if len(funcs) < 2:
+                continue
+
+            # the functions of the class itself come first, only report the classes that declare one of the overloads
+            if not any(x is funcs[0] for x, _ in cls.walk_parts()):
+                continue
+
+            virtual = ['virtual' in x.attrs for x in funcs]
+            if any(virtual) and not all(virtual):
+                self.report(cls, f"{cls.name}::{name} has both virtual and non-virtual overloads, "
+                                 "this can cause incorrect vtable generation, check the vtable manually", funcs[0].line)
+
+@rule
+class DuplicateBinds(Rule):
+    name = "duplicate-binds"
+
+    def visit_class(self, cls: broma.BromaClass):
+        self.seen: dict[tuple[str, int], broma.BromaFunction] = {}
+
+    def visit_function(self, cls: broma.BromaClass, func: broma.BromaFunction):
+        for platform, offset in func.binds.items():
+            if offset is None:
+                continue
+
+            other = self.seen.setdefault((platform, offset), func)
+            if other is not func:
+                self.report(cls, f"{cls.name}::{func.name} has the same {platform} bind ({hex(offset)}) as {cls.name}::{other.name}", func.line)
+
+@rule
+class MissingPlatforms(Rule):
+    name = "missing-platforms"
+
+    def visit_class(self, cls: broma.BromaClass):
+        self.platforms = set()
+        for part, _ in cls.walk_parts():
+            if isinstance(part, broma.BromaFunction):
+                self.platforms.update(part.binds)
+
+    def visit_function(self, cls: broma.BromaClass, func: broma.BromaFunction):
+        # functions with no binds at all are inlined helpers or not bound yet
+        if not func.binds:
+            return
+
+        missing = sorted(self.platforms - set(func.binds))
+        if missing:
+            self.report(cls, f"{cls.name}::{func.name} is not bound on {', '.join(missing)}", func.line, "note")
+
+@rule
+class SuspiciousPad(Rule):
+    name = "suspicious-pad"
+
+    def visit_pad(self, cls: broma.BromaClass, pad: broma.BromaPad):
+        for platform, size in pad.platforms.items():
+            if size == 0:
+                self.report(cls, f"{cls.name} has an empty {platform} pad", pad.line)
+            elif size > MAX_PAD_SIZE:
+                self.report(cls, f"{cls.name} has a {platform} pad of {hex(size)}, which is unusually big", pad.line)
+
+        if pad.platforms.get("android32", 0) > pad.platforms.get("android64", 1 << 64):
+            self.report(cls, f"{cls.name} has a pad that is bigger on android32 than on android64", pad.line)
+
+@rule
+class UnknownBase(Rule):
+    name = "unknown-base"
+
+    def visit_class(self, cls: broma.BromaClass):
+        for base in cls.bases:
+            if base.startswith(EXTERNAL_NAMESPACES):
+                continue
+
+            if not self.ctx.has_class(base):
+                self.report(cls, f"{cls.name} inherits from unknown class {base}")
+
+# Diagnostics of already linted classes, by cache key. Lines are stored relative to the start of the class.
+@dataclass
+class LintCache:
+    entries: dict[str, list[tuple[str, str, int, str]]] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> LintCache:
+        try:
+            return cls({k: [tuple(x) for x in v] for k, v in json.loads(path.read_text()).items()})
+        except (FileNotFoundError, ValueError):
+            return cls()
+
+    def save(self, path: Path):
+        path.write_text(json.dumps(self.entries))
+
+class Linter:
+    def __init__(self, file: broma.Broma, cache: LintCache | None = None, digests: dict[int, bytes] | None = None,
+                 known: Iterable[str] = ()) -> None:
+        self.ctx = LintContext(file, known)
+        self.cache = cache if cache is not None else LintCache()
+        # id(class) -> content hash, for callers that already know them (e.g. from an incremental parse)
+        self.digests = digests or {}
+        # by id(class), like the caches of LintContext
+        self._hashes: dict[int, bytes] = {}
+        self._interface_hashes: dict[int, bytes] = {}
+
+        self._diagnostics: list[Diagnostic] = []
+        self.rules = [x(self.ctx, self._diagnostics.append) for x in RULES]
+
+        # only dispatch to rules that override a visit method
+        def overriding(method: str) -> list:
+            return [getattr(x, method) for x in self.rules if getattr(type(x), method) is not getattr(Rule, method)]
+
+        self._class_visitors = overriding("visit_class")
+        self._function_visitors = overriding("visit_function")
+        self._member_visitors = overriding("visit_member")
+        self._pad_visitors = overriding("visit_pad")
+        self._end_visitors = overriding("end_class")
+
+    def _hash(self, cls: broma.BromaClass) -> bytes:
+        if id(cls) not in self._hashes:
+            self._hashes[id(cls)] = self.digests.get(id(cls)) or cls.content_hash()
+
+        return self._hashes[id(cls)]
+
+    # what other classes can see of a class through `LintContext.overloads`, so that editing
+    # a function body or a member of a base class doesn't invalidate all of its subclasses
+    def _interface_hash(self, cls: broma.BromaClass) -> bytes:
+        if id(cls) not in self._interface_hashes:
+            funcs = [f"{x.name} {' '.join(x.attrs)}" for x, _ in cls.walk_parts() if isinstance(x, broma.BromaFunction)]
+            self._interface_hashes[id(cls)] = hashlib.blake2b("\n".join([cls.name] + funcs).encode(), digest_size=16).digest()
+
+        return self._interface_hashes[id(cls)]
+
+    # the result of a class depends on the class itself, what it inherits and which of its bases exist
+    def cache_key(self, cls: broma.BromaClass) -> str:
+        key = hashlib.blake2b(self._hash(cls), digest_size=16)
+        for base in self.ctx.ancestors(cls):
+            key.update(self._interface_hash(base))
+
+        for base in cls.bases:
+            key.update(b"+" if self.ctx.has_class(base) else b"-")
+
+        return key.hexdigest()
+
+    def _run_rules(self, cls: broma.BromaClass) -> list[Diagnostic]:
+        self._diagnostics.clear()
+
+        for visit in self._class_visitors:
+            visit(cls)
+
+        for part, _ in cls.walk_parts():
+            if isinstance(part, broma.BromaFunction):
+                visitors = self._function_visitors
+            elif isinstance(part, broma.BromaMember):
+                visitors = self._member_visitors
+            elif isinstance(part, broma.BromaPad):
+                visitors = self._pad_visitors
+            else:
+                continue
+
+            for visit in visitors:
+                visit(cls, part)
+
+        for visit in self._end_visitors:
+            visit(cls)
+
+        return list(self._diagnostics)
+
+    def lint_class(self, cls: broma.BromaClass) -> list[Diagnostic]:
+        key = self.cache_key(cls)
+        cached = self.cache.entries.get(key)
+
+        if cached is None:
+            self.cache.misses += 1
+            diagnostics = self._run_rules(cls)
+            self.cache.entries[key] = [(x.rule, x.message, x.line - cls.start_line, x.severity) for x in diagnostics]
+            return diagnostics
+
+        self.cache.hits += 1
+        return [Diagnostic(rule, message, cls.name, cls.start_line + line, severity) for rule, message, line, severity in cached]
+
+    def lint(self) -> list[Diagnostic]:
+        out = []
+        for cls in self.ctx.file.classes:
+            out += self.lint_class(cls)
+
+        return out
+
+def lint_file(file: broma.Broma, cache: LintCache | None = None, known: Iterable[str] = ()) -> list[Diagnostic]:
+    return Linter(file, cache, known=known).lint()
+
+_CLASS_LINE = re.compile(rb"^[ \t]*(?:\[\[.*?\]\][ \t]*)?class[ \t]+([A-Za-z_][\w:]*)", re.M)
+
+# names of the classes defined in the files, found without parsing them
+def class_names(paths: list[Path]) -> set[str]:
+    return {str(x.group(1), "utf-8") for path in paths for x in _CLASS_LINE.finditer(path.read_bytes())}
+
+_worker_cache: LintCache | None = None
+_worker_known: set[str] = set()
+
+def _init_worker(entries: dict, known: set[str]):
+    global _worker_cache, _worker_known
+    _worker_cache = LintCache(entries)
+    _worker_known = known
+
+def _lint_path(path: Path) -> tuple[list[Diagnostic], dict]:
+    before = set(_worker_cache.entries)
+    diagnostics = lint_file(broma.parse(path, mapped=True), _worker_cache, _worker_known)
+    return diagnostics, {k: v for k, v in _worker_cache.entries.items() if k not in before}
+
+# lints every file on its own, in parallel when jobs != 1 (0 = one worker per cpu). New results are added to the cache.
+# Bases are looked up in all the files, so a base defined in another one isn't unknown.
+def lint_paths(paths: list[Path], cache: LintCache | None = None, jobs: int = 1) -> dict[Path, list[Diagnostic]]:
+    cache = cache if cache is not None else LintCache()
+    known = class_names(paths)
+
+    if jobs == 1 or len(paths) < 2:
+        return {path: lint_file(broma.parse(path, mapped=True), cache, known) for path in paths}
+
+    out = {}
+    with ProcessPoolExecutor(max_workers=jobs or None, initializer=_init_worker, initargs=(cache.entries, known)) as pool:
+        for path, (diagnostics, new_entries) in zip(paths, pool.map(_lint_path, paths)):
+            out[path] = diagnostics
+            cache.entries.update(new_entries)
+
+    return out
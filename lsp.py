@@ -0,0 +1,434 @@
+# Language server for broma files, speaks LSP over stdin/stdout
+# Run as: python cli.py lsp
+#
+# Supports incremental document sync, diagnostics (every syntax error, and the checks from lint.py),
+# go to definition for classes (bases and types) and document symbols.
+# After an edit only the part of the file around the changed range is scanned and parsed again, see `Broma.reparse`,
+# and only the classes that changed (and the ones inheriting from them) are linted again.
+
+from __future__ import annotations
+
+import bisect
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+from urllib.parse import unquote, urlparse
+
+import broma
+import lint
+
+# LSP enums
+SYNC_INCREMENTAL = 2
+SEVERITY_ERROR = 1
+SEVERITY_WARNING = 2
+SEVERITY_INFORMATION = 3
+SYMBOL_CLASS = 5
+SYMBOL_METHOD = 6
+SYMBOL_FIELD = 8
+MESSAGE_ERROR = 1
+
+IDENTIFIER_CHARS = re.compile(r"[A-Za-z0-9_:~]")
+
+def uri_to_path(uri: str) -> Path:
+    return Path(unquote(urlparse(uri).path))
+
+def path_to_uri(path: Path) -> str:
+    return path.resolve().as_uri()
+
+# LSP positions count utf-16 code units, python strings count code points
+def utf16_to_index(line: str, character: int) -> int:
+    units = 0
+    for idx, char in enumerate(line):
+        if units >= character:
+            return idx
+        units += 2 if ord(char) > 0xffff else 1
+
+    return len(line)
+
+def index_to_utf16(line: str, index: int) -> int:
+    return sum(2 if ord(char) > 0xffff else 1 for char in line[:index])
+
+def _range(start_line: int, start_char: int, end_line: int, end_char: int) -> dict:
+    return {"start": {"line": start_line, "character": start_char}, "end": {"line": end_line, "character": end_char}}
+
+def _lint_diagnostic(diagnostic: lint.Diagnostic) -> dict:
+    severity = SEVERITY_WARNING if diagnostic.severity == "warning" else SEVERITY_INFORMATION
+    line = max(diagnostic.line, 0)
+    return {"range": _range(line, 0, line, 1 << 16), "severity": severity, "source": "broma", "code": diagnostic.rule, "message": diagnostic.message}
+
+def _moved(diagnostic: dict, lines: int) -> dict:
+    line = diagnostic["range"]["start"]["line"] + lines
+    return {**diagnostic, "range": _range(line, 0, line, 1 << 16)}
+
+@dataclass
+class Document:
+    uri: str
+    text: str
+    file: broma.Broma | None = None
+    syntax_errors: list[dict] = field(default_factory=list)
+    lint_cache: lint.LintCache = field(default_factory=lint.LintCache)
+    published: list[dict] | None = None
+    # (start, old end, new end) of the text that changed since the last parse, None if nothing did, see `Broma.reparse`
+    changed: tuple[int, int, int] | None = None
+    # the whole text has to be parsed again, e.g. after it was replaced
+    full_parse: bool = True
+    # id(class) -> the class, its start line and its lint diagnostics, from the last time it was linted
+    _linted: dict[int, tuple[broma.BromaClass, int, list[dict]]] = field(default_factory=dict)
+    _line_starts: list[int] | None = None
+
+    def line_starts(self) -> list[int]:
+        if self._line_starts is None:
+            self._line_starts = [0] + [x.end() for x in re.finditer("\n", self.text)]
+        return self._line_starts
+
+    def line_offset(self, line: int) -> int:
+        starts = self.line_starts()
+        return starts[line] if line < len(starts) else len(self.text)
+
+    def position_to_offset(self, position: dict) -> int:
+        start = self.line_offset(position["line"])
+        end = self.text.find("\n", start)
+        if end == -1:
+            end = len(self.text)
+
+        return start + utf16_to_index(self.text[start:end], position["character"])
+
+    def apply_change(self, change: dict):
+        if "range" not in change:
+            self.text = change["text"]
+            self.full_parse = True
+            self._line_starts = None
+            return
+
+        start = self.position_to_offset(change["range"]["start"])
+        end = self.position_to_offset(change["range"]["end"])
+        text = change["text"]
+        self.text = self.text[:start] + text + self.text[end:]
+
+        # one range covering this change and the ones before it, in the text of the last parse
+        if self.changed is None:
+            self.changed = (start, end, start + len(text))
+        else:
+            old_start, old_end, new_end = self.changed
+            end_now = max(new_end, end)
+            self.changed = (min(old_start, start), old_end + end_now - new_end, end_now + len(text) - (end - start))
+
+        starts = self.line_starts()
+        first = bisect.bisect_right(starts, start)
+        last = bisect.bisect_left(starts, end + 1)
+        delta = len(text) - (end - start)
+        starts[first:] = [start + x.end() for x in re.finditer("\n", text)] + [x + delta for x in starts[last:]]
+
+    # parses the current text, recovering from syntax errors so everything around them still has a tree.
+    # keeps the last tree if the parser fails in some other way, the next parse is then a full one
+    def reparse(self):
+        if not self.full_parse and self.changed is None:
+            return
+
+        try:
+            if self.file is None:
+                # the document keeps the text itself
+                self.file = broma.Broma(self.text, incremental=True, source="none", recover=True)
+            else:
+                self.file = self.file.reparse(self.text, None if self.full_parse else self.changed)
+        except Exception as e:
+            self.syntax_errors = [self._error_diagnostic(0, 0, str(e) or type(e).__name__)]
+            self.full_parse = True
+            return
+        finally:
+            self.changed = None
+
+        self.full_parse = False
+
+        self.syntax_errors = [self._error_diagnostic(x.line, x.column, x.message) for x in self.file.errors]
+
+    def _error_diagnostic(self, line: int, column: int, message: str) -> dict:
+        start = self.line_offset(line)
+        end = self.text.find("\n", start)
+        character = index_to_utf16(self.text[start:end if end != -1 else len(self.text)], max(column, 0))
+        return {"range": _range(line, character, line, 1 << 16), "severity": SEVERITY_ERROR, "source": "broma", "message": message}
+
+    def diagnostics(self) -> list[dict]:
+        out = list(self.syntax_errors)
+
+        if self.file is None:
+            return out
+
+        classes = self.file.classes
+        current = {id(cls) for cls in classes}
+        changed = [cls for cls in classes if self._linted.get(id(cls), (None,))[0] is not cls]
+        removed = [entry[0] for key, entry in self._linted.items() if key not in current]
+        for key in [key for key in self._linted if key not in current]:
+            del self._linted[key]
+
+        if changed or removed:
+            # the result of a class also depends on what it inherits (see `Linter.cache_key`), so everything that
+            # inherits from a changed class is linted again too. Bases are matched by their last component, like
+            # `LintContext.find_class` does for bases without their namespace.
+            subclasses: dict[str, list[broma.BromaClass]] = {}
+            for cls in classes:
+                for base in cls.bases:
+                    subclasses.setdefault(base.rpartition("::")[2], []).append(cls)
+
+            todo = {id(cls): cls for cls in changed}
+            names = [cls.name.rpartition("::")[2] for cls in changed + removed]
+            seen = set(names)
+            while names:
+                for cls in subclasses.get(names.pop(), []):
+                    todo[id(cls)] = cls
+                    name = cls.name.rpartition("::")[2]
+                    if name not in seen:
+                        seen.add(name)
+                        names.append(name)
+
+            # the incremental parse already hashed the text of every class, no need to dump them again
+            digests = {id(cls): key for key, cls in self.file.class_sources.items()}
+            linter = lint.Linter(self.file, self.lint_cache, digests)
+            for cls in todo.values():
+                self._linted[id(cls)] = (cls, cls.start_line, [_lint_diagnostic(x) for x in linter.lint_class(cls)])
+
+        for cls in classes:
+            _, start_line, diagnostics = self._linted[id(cls)]
+            if start_line != cls.start_line:
+                # moved by an edit above it
+                diagnostics = [_moved(x, cls.start_line - start_line) for x in diagnostics]
+                self._linted[id(cls)] = (cls, cls.start_line, diagnostics)
+            out += diagnostics
+
+        return out
+
+    # the (possibly qualified) identifier under the cursor
+    def word_at(self, position: dict) -> str:
+        line_start = self.line_offset(position["line"])
+        line_end = self.text.find("\n", line_start)
+        if line_end == -1:
+            line_end = len(self.text)
+
+        start = end = self.position_to_offset(position)
+        while start > line_start and IDENTIFIER_CHARS.match(self.text[start - 1]):
+            start -= 1
+
+        while end < line_end and IDENTIFIER_CHARS.match(self.text[end]):
+            end += 1
+
+        return self.text[start:end].strip(":")
+
+    def symbols(self) -> list[dict]:
+        if self.file is None:
+            return []
+
+        lines = self.text.splitlines()
+
+        def line_len(line: int) -> int:
+            return index_to_utf16(lines[line], len(lines[line])) if 0 <= line < len(lines) else 0
+
+        out = []
+        for cls in self.file.classes:
+            children = []
+            for part, _ in cls.walk_parts():
+                if part.line == -1:
+                    continue
+
+                if isinstance(part, broma.BromaFunction):
+                    name, kind, detail = part.name, SYMBOL_METHOD, part.get_signature()
+                elif isinstance(part, broma.BromaMember):
+                    name, kind, detail = part.name, SYMBOL_FIELD, part.type
+                else:
+                    continue
+
+                rng = _range(part.line, 0, part.line, line_len(part.line))
+                children.append({"name": name or "<unnamed>", "detail": detail, "kind": kind, "range": rng, "selectionRange": rng})
+
+            rng = _range(cls.start_line, 0, cls.end_line, line_len(cls.end_line))
+            out.append({
+                "name": cls.name,
+                "detail": ", ".join(cls.bases),
+                "kind": SYMBOL_CLASS,
+                "range": rng,
+                "selectionRange": rng,
+                "children": children,
+            })
+
+        return out
+
+class LanguageServer:
+    def __init__(self, input: BinaryIO, output: BinaryIO) -> None:
+        self.input = input
+        self.output = output
+        self.documents: dict[str, Document] = {}
+        self.root: Path | None = None
+        # class definitions of .bro files in the workspace that are not open, loaded on first use
+        self.workspace_classes: dict[str, tuple[str, broma.BromaClass]] | None = None
+        self.running = True
+
+    def read_message(self) -> dict | None:
+        length = None
+        while True:
+            header = self.input.readline()
+            if not header:
+                return None
+
+            header = header.decode("ascii").strip()
+            if not header:
+                break
+
+            name, _, value = header.partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+
+        if length is None:
+            return None
+
+        return json.loads(self.input.read(length).decode("utf-8"))
+
+    def send(self, message: dict):
+        body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self.output.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        self.output.flush()
+
+    def notify(self, method: str, params: dict):
+        self.send({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def publish_diagnostics(self, doc: Document):
+        diagnostics = doc.diagnostics()
+        # most edits don't change anything, and big files can have thousands of notes
+        if diagnostics == doc.published:
+            return
+
+        doc.published = diagnostics
+        self.notify("textDocument/publishDiagnostics", {"uri": doc.uri, "diagnostics": diagnostics})
+
+    def serve(self):
+        while self.running:
+            message = self.read_message()
+            if message is None:
+                break
+
+            self.handle(message)
+
+    def handle(self, message: dict):
+        method = message.get("method")
+        params = message.get("params") or {}
+        handler = getattr(self, "on_" + (method or "").replace("/", "_").replace("$", "_"), None)
+
+        if "id" not in message:
+            # notifications have no response to carry an error, so log it instead of letting it stop the server
+            if handler is not None:
+                try:
+                    handler(params)
+                except Exception as e:
+                    self.notify("window/logMessage", {"type": MESSAGE_ERROR, "message": f"{method} failed: {type(e).__name__}: {e}"})
+            return
+
+        if handler is None:
+            self.send({"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": f"method not found: {method}"}})
+            return
+
+        try:
+            result = handler(params)
+        except Exception as e:
+            self.send({"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32603, "message": f"{type(e).__name__}: {e}"}})
+        else:
+            self.send({"jsonrpc": "2.0", "id": message["id"], "result": result})
+
+    def on_initialize(self, params: dict) -> dict:
+        if params.get("rootUri"):
+            self.root = uri_to_path(params["rootUri"])
+
+        return {
+            "capabilities": {
+                "textDocumentSync": {"openClose": True, "change": SYNC_INCREMENTAL},
+                "definitionProvider": True,
+                "documentSymbolProvider": True,
+            },
+            "serverInfo": {"name": "broma-lsp"},
+        }
+
+    def on_initialized(self, params: dict):
+        pass
+
+    def on_shutdown(self, params: dict):
+        return None
+
+    def on_exit(self, params: dict):
+        self.running = False
+
+    def on_textDocument_didOpen(self, params: dict):
+        item = params["textDocument"]
+        doc = Document(item["uri"], item["text"])
+        doc.reparse()
+        self.documents[doc.uri] = doc
+        self.publish_diagnostics(doc)
+
+    def on_textDocument_didChange(self, params: dict):
+        doc = self.documents.get(params["textDocument"]["uri"])
+        if doc is None:
+            return
+
+        for change in params["contentChanges"]:
+            doc.apply_change(change)
+
+        doc.reparse()
+        self.publish_diagnostics(doc)
+
+    def on_textDocument_didClose(self, params: dict):
+        uri = params["textDocument"]["uri"]
+        self.documents.pop(uri, None)
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": []})
+
+    def on_textDocument_documentSymbol(self, params: dict) -> list[dict]:
+        doc = self.documents.get(params["textDocument"]["uri"])
+        return doc.symbols() if doc else []
+
+    def _load_workspace_classes(self) -> dict[str, tuple[str, broma.BromaClass]]:
+        if self.workspace_classes is None:
+            self.workspace_classes = {}
+            if self.root is not None:
+                for path in sorted(self.root.rglob("*.bro")):
+                    try:
+                        file = broma.parse(path, mapped=True)
+                    except Exception:
+                        continue
+
+                    for cls in file.classes:
+                        self.workspace_classes.setdefault(cls.name, (path_to_uri(path), cls))
+
+        return self.workspace_classes
+
+    def find_class(self, name: str) -> tuple[str, broma.BromaClass] | None:
+        for doc in self.documents.values():
+            if doc.file is not None and (cls := doc.file.find_class(name)) is not None:
+                return doc.uri, cls
+
+        classes = self._load_workspace_classes()
+        if name in classes:
+            return classes[name]
+
+        unqualified = name.rpartition("::")[2]
+        for cname, found in classes.items():
+            if cname.rpartition("::")[2] == unqualified:
+                return found
+
+        return None
+
+    def on_textDocument_definition(self, params: dict) -> list[dict]:
+        doc = self.documents.get(params["textDocument"]["uri"])
+        if doc is None:
+            return []
+
+        word = doc.word_at(params["position"])
+        if not word:
+            return []
+
+        found = self.find_class(word)
+        if found is None:
+            return []
+
+        uri, cls = found
+        return [{"uri": uri, "range": _range(cls.start_line, 0, cls.start_line, 0)}]
+
+def serve_stdio():
+    LanguageServer(sys.stdin.buffer, sys.stdout.buffer).serve()
@@ -0,0 +1,218 @@
+# Columnar view of the function offsets of a parsed file, for bulk operations on them
+# Run as: python cli.py rebase <files...> -p win --shift 0x1000 [--range=0x100000:0x200000:-0x40 ...]
+#
+# Offsets live in per-function `binds` dicts, which are slow to go through one at a time. An `OffsetStore` copies them
+# into one (function id, offset) column pair per platform, NumPy arrays when NumPy is installed and `array`s otherwise,
+# operates on whole columns and writes the result back to the functions with `write_back`.
+# Inline binds are not offsets and are never touched.
+
+from __future__ import annotations
+
+from array import array
+
+import broma
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _column(values, typecode: str):
+    if np is not None:
+        return np.fromiter(values, dtype=np.int64 if typecode == "q" else np.uint32)
+    return array(typecode, values)
+
+class Column:
+    ids: object # function ids (indices into OffsetStore.functions)
+    offsets: object
+
+    def __init__(self, ids, offsets) -> None:
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # mask of the entries with start <= offset < end, as a numpy array or a list of bools
+    def in_range(self, start: int | None, end: int | None):
+        offsets = self.offsets
+        if np is not None:
+            mask = np.ones(len(offsets), dtype=bool)
+            if start is not None:
+                mask &= offsets >= start
+            if end is not None:
+                mask &= offsets < end
+            return mask
+
+        return [(start is None or x >= start) and (end is None or x < end) for x in offsets]
+
+    @staticmethod
+    def count(mask) -> int:
+        return int(mask.sum()) if np is not None else sum(mask)
+
+    # the smallest offset of the masked entries, None if there are none
+    def min(self, mask) -> int | None:
+        if np is not None:
+            return int(self.offsets[mask].min()) if mask.any() else None
+        return min((x for x, m in zip(self.offsets, mask) if m), default=None)
+
+    def keep(self, mask):
+        if np is not None:
+            self.ids = self.ids[mask]
+            self.offsets = self.offsets[mask]
+        else:
+            self.ids = array("I", (x for x, keep in zip(self.ids, mask) if keep))
+            self.offsets = array("q", (x for x, keep in zip(self.offsets, mask) if keep))
+
+    def add(self, mask, delta: int):
+        if np is not None:
+            self.offsets[mask] += delta
+        else:
+            self.offsets = array("q", (x + delta if moved else x for x, moved in zip(self.offsets, mask)))
+
+class OffsetStore:
+    functions: list[broma.BromaFunction]
+    # `Class::function` for every function, for reports
+    names: list[str]
+    columns: dict[str, Column]
+    # of the file, when made with from_file. Its address index is dropped by write_back
+    global_functions: broma.GlobalFunctions | None = None
+    # function id -> the platform block it's in, for the functions in one. Set by from_file
+    blocks: dict[int, broma.BromaPlatformBlock]
+
+    def __init__(self, functions: list[broma.BromaFunction], names: list[str] | None = None) -> None:
+        self.functions = functions
+        self.names = names if names is not None else [x.name for x in functions]
+        self.blocks = {}
+
+        pairs: dict[str, tuple[list[int], list[int]]] = {}
+        for func_id, func in enumerate(functions):
+            for platform, offset in func.binds.items():
+                if offset is not None:
+                    ids, offsets = pairs.setdefault(platform, ([], []))
+                    ids.append(func_id)
+                    offsets.append(offset)
+
+        self.columns = {platform: Column(_column(ids, "I"), _column(offsets, "q")) for platform, (ids, offsets) in pairs.items()}
+        # what was there before, so that write_back knows which binds were removed
+        self._original_ids = {platform: set(ids) for platform, (ids, _) in pairs.items()}
+
+    @classmethod
+    def from_file(cls, file: broma.Broma) -> OffsetStore:
+        pairs = []
+        blocks = {}
+        for c in file.classes:
+            for part in c.parts:
+                if isinstance(part, broma.BromaFunction):
+                    pairs.append((part, f"{c.name}::{part.name}"))
+                elif isinstance(part, broma.BromaPlatformBlock):
+                    for child in part.parts:
+                        if isinstance(child, broma.BromaFunction):
+                            blocks[len(pairs)] = part
+                            pairs.append((child, f"{c.name}::{child.name}"))
+
+        pairs += [(func, func.name) for func in file.global_functions]
+        store = cls([x for x, _ in pairs], [x for _, x in pairs])
+        store.global_functions = file.global_functions
+        store.blocks = blocks
+        return store
+
+    def _columns(self, platform: str | None) -> list[Column]:
+        if platform is None:
+            return list(self.columns.values())
+        return [self.columns[platform]] if platform in self.columns else []
+
+    def count(self, platform: str | None = None) -> int:
+        return sum(len(x) for x in self._columns(platform))
+
+    # removes the offsets in [start, end) (everything by default), returns how many were removed
+    def clear(self, platform: str | None = None, start: int | None = None, end: int | None = None) -> int:
+        removed = 0
+        for column in self._columns(platform):
+            before = len(column)
+            mask = column.in_range(start, end)
+            column.keep(~mask if np is not None else [not x for x in mask])
+            removed += before - len(column)
+
+        return removed
+
+    # adds `delta` to the offsets in [start, end), returns how many were moved
+    def shift(self, platform: str | None, delta: int, start: int | None = None, end: int | None = None) -> int:
+        moved = 0
+        for column in self._columns(platform):
+            mask = column.in_range(start, end)
+            count = column.count(mask)
+            if not count:
+                continue
+
+            lowest = column.min(mask)
+            if lowest + delta < 0:
+                raise ValueError(f"shifting by {hex(delta)} would make the offset {hex(lowest)} negative")
+
+            column.add(mask, delta)
+            moved += count
+
+        return moved
+
+    # moves several ranges at once, given as (start, end, delta). Ranges are matched against the offsets
+    # from before the rebase, so moving one range into another doesn't move it twice. Overlapping ranges would
+    # give the offsets they share two deltas, so they are rejected.
+    def rebase(self, platform: str | None, ranges: list[tuple[int, int, int]]) -> int:
+        bounds = sorted((start, end) for start, end, _ in ranges if start < end)
+        for (start, end), (next_start, next_end) in zip(bounds, bounds[1:]):
+            if next_start < end:
+                raise ValueError(f"the ranges {hex(start)}:{hex(end)} and {hex(next_start)}:{hex(next_end)} overlap")
+
+        moved = 0
+        for column in self._columns(platform):
+            masks = [(column.in_range(start, end), delta) for start, end, delta in ranges]
+            for mask, delta in masks:
+                lowest = column.min(mask)
+                if lowest is not None and lowest + delta < 0:
+                    raise ValueError(f"rebasing by {hex(delta)} would make the offset {hex(lowest)} negative")
+
+            for mask, delta in masks:
+                column.add(mask, delta)
+                moved += column.count(mask)
+
+        return moved
+
+    # the functions with an offset in [start, end) on `platform`, as (offset, function) sorted by offset
+    def select(self, platform: str, start: int | None = None, end: int | None = None) -> list[tuple[int, broma.BromaFunction]]:
+        column = self.columns.get(platform)
+        if column is None:
+            return []
+
+        mask = column.in_range(start, end)
+        if np is not None:
+            ids, offsets = column.ids[mask].tolist(), column.offsets[mask].tolist()
+        else:
+            ids = [x for x, m in zip(column.ids, mask) if m]
+            offsets = [x for x, m in zip(column.offsets, mask) if m]
+
+        return sorted(((offset, self.functions[func_id]) for func_id, offset in zip(ids, offsets)), key=lambda x: x[0])
+
+    # writes the offsets back into the binds of the functions. Removed offsets are removed from the binds.
+    def write_back(self):
+        changed = set()
+        for platform, column in self.columns.items():
+            ids = column.ids.tolist()
+            offsets = column.offsets.tolist()
+            functions = self.functions
+
+            for func_id, offset in zip(ids, offsets):
+                if functions[func_id].binds.get(platform) != offset:
+                    functions[func_id].binds[platform] = offset
+                    changed.add(func_id)
+
+            for func_id in self._original_ids.get(platform, set()).difference(ids):
+                del functions[func_id].binds[platform]
+                changed.add(func_id)
+
+        # platform blocks are dumped from their code
+        for block in {id(self.blocks[x]): self.blocks[x] for x in changed if x in self.blocks}.values():
+            block.update_code()
+
+        self._original_ids = {platform: set(column.ids.tolist()) for platform, column in self.columns.items()}
+        if self.global_functions is not None:
+            self.global_functions.invalidate()
@@ -1,12 +1,16 @@
 # Parses a broma file and dumps with no changes
-# Run as: python parse-and-dump.py <input> <output>
+# Run as: python parse-and-dump.py <input> <output> [--check]
 
 import broma
+import profiling
 import sys
-from pathlib import Path
+import writer
+
+profiling.start_from_argv()
+check = writer.check_from_argv()
 
 file = broma.parse(sys.argv[1])
 
 text = file.dump()
 
-Path(sys.argv[2]).write_text(text)
+writer.finish(sys.argv[2], text, check)
@@ -0,0 +1,334 @@
+# Phase timers and counters for the broma tools
+# Run any tool with `--profile` to get a summary on stderr, e.g. `python cli.py reformat --profile GeometryDash.bro`
+#
+# `--profile` takes an optional comma separated list of:
+#   table (default)  summary table
+#   json             the same numbers as json
+#   <path>.json      write the json to a file
+#   cprofile         also run cProfile and print the 30 most expensive functions
+#   memory           also trace allocations and print the peak
+#
+# From python:
+#   with profiling.profile() as prof:
+#       broma.parse("GeometryDash.bro").dump()
+#   print(prof.report())
+#
+# Nothing in broma.py knows about this: enabling wraps the functions listed in PHASES (and counts regex calls by
+# swapping the `re` module seen by broma.py), disabling puts the originals back. So when profiling is off
+# there is no cost at all. Timings cover the current process only, worker processes are not instrumented.
+
+from __future__ import annotations
+
+import atexit
+import json
+import re
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+import broma
+
+@dataclass
+class PhaseStats:
+    calls: int = 0
+    total: float = 0.0 # seconds, including nested phases (recursive calls are only counted once)
+    self: float = 0.0 # seconds, excluding nested phases
+
+class Profiler:
+    def __init__(self) -> None:
+        self.phases: dict[str, PhaseStats] = {}
+        self.counters: dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.peak_memory: int | None = None
+        self.cprofile_stats: str | None = None
+        self._cprofile = None
+        # [phase name, start, time spent in nested phases]
+        self._stack: list[list] = []
+        self._active: dict[str, int] = {}
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+        self._active[name] = self._active.get(name, 0) + 1
+
+    def exit(self):
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self._active[name] -= 1
+
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+
+        stats.calls += 1
+        stats.self += elapsed - nested
+        if not self._active[name]:
+            stats.total += elapsed
+
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "wall": self.wall,
+            "phases": {k: asdict(v) for k, v in self.phases.items()},
+            "counters": dict(self.counters),
+            "peak_memory": self.peak_memory,
+        }
+
+    def report(self) -> str:
+        lines = [f"{'phase':<28} {'calls':>9} {'total ms':>11} {'self ms':>11} {'self %':>7}"]
+        for name, stats in sorted(self.phases.items(), key=lambda x: -x[1].self):
+            share = stats.self / self.wall * 100 if self.wall else 0.0
+            lines.append(f"{name:<28} {stats.calls:>9} {stats.total * 1000:>11.2f} {stats.self * 1000:>11.2f} {share:>6.1f}%")
+
+        lines.append(f"{'wall':<28} {'':>9} {self.wall * 1000:>11.2f}")
+        lines.append("")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<28} {value:>9}")
+
+        if self.peak_memory is not None:
+            lines.append(f"{'peak memory (KiB)':<28} {self.peak_memory // 1024:>9}")
+
+        if self.cprofile_stats:
+            lines += ["", self.cprofile_stats]
+
+        return "\n".join(lines)
+
+# (owner, attribute, phase name). Nested phases are subtracted from the self time of the outer ones,
+# so the self time of parse_global_items is the time spent splitting the file into classes.
+PHASES = [
+    (broma.Broma, "__init__", "parse"),
+    (broma.Broma, "parse_preamble", "parse_preamble"),
+    (broma.Broma, "parse_global_items", "parse_global_items"),
+    (broma.Broma, "parse_global_function", "parse_globals"),
+    (broma.BromaClass, "parse", "BromaClass.parse"),
+    (broma.BromaFunction, "_parse_basic", "BromaFunction.parse"),
+    (broma, "split_variable", "split_variable"),
+    (broma.Broma, "sort_everything", "sort_everything"),
+    (broma.BromaClass, "sort", "BromaClass.sort"),
+    (broma.Broma, "format_inlined_bodies", "format_inlined_bodies"),
+    (broma.Broma, "dump", "dump"),
+    (broma.BromaClass, "dump", "BromaClass.dump"),
+    (broma.BromaFunction, "dump", "BromaFunction.dump"),
+]
+
+# counters derived from the calls of a wrapped function: phase name -> function(profiler, args, result)
+def _count_parse(prof: Profiler, args: tuple, result):
+    prof.count("lines", args[0].line_count)
+
+def _count_class(prof: Profiler, args: tuple, result):
+    prof.count("classes parsed")
+
+def _count_function(prof: Profiler, args: tuple, result):
+    prof.count("functions parsed")
+
+COUNTERS = {
+    "parse": _count_parse,
+    "BromaClass.parse": _count_class,
+    "BromaFunction.parse": _count_function,
+}
+
+# stands in for the `re` module in broma.py while profiling
+class _CountingRe:
+    def __getattr__(self, name: str):
+        value = getattr(re, name)
+        if not callable(value) or isinstance(value, type):
+            return value
+
+        def counted(*args, **kwargs):
+            _current.count("regex calls")
+            return value(*args, **kwargs)
+
+        return counted
+
+_current: Profiler | None = None
+_originals: list[tuple[object, str, object]] = []
+
+def current() -> Profiler | None:
+    return _current
+
+def _wrap(func, name: str):
+    counter = COUNTERS.get(name)
+
+    def wrapper(*args, **kwargs):
+        prof = _current
+        prof.enter(name)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            prof.exit()
+
+        if counter is not None:
+            counter(prof, args, result)
+        return result
+
+    wrapper.__name__ = getattr(func, "__name__", name)
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+def _instrument():
+    # only imported when profiling, so that the tools that don't lint don't pay for it
+    import lint
+
+    for owner, attr, name in PHASES + [(lint.Linter, "lint_class", "lint_class")]:
+        raw = vars(owner)[attr]
+        _originals.append((owner, attr, raw))
+
+        if isinstance(raw, classmethod):
+            setattr(owner, attr, classmethod(_wrap(raw.__func__, name)))
+        elif isinstance(raw, staticmethod):
+            setattr(owner, attr, staticmethod(_wrap(raw.__func__, name)))
+        else:
+            setattr(owner, attr, _wrap(raw, name))
+
+    _originals.append((broma, "re", broma.re))
+    broma.re = _CountingRe()
+
+    # incremental reparses and the lint cache count their own hits
+    def move_to(self, start_line: int):
+        _current.count("classes reused")
+        return original_move_to(self, start_line)
+
+    original_move_to = vars(broma.BromaClass)["move_to"]
+    _originals.append((broma.BromaClass, "move_to", original_move_to))
+    broma.BromaClass.move_to = move_to
+
+    def lint_class(self, cls):
+        hits = self.cache.hits
+        result = original_lint_class(self, cls)
+        _current.count("lint cache hits" if self.cache.hits != hits else "lint cache misses")
+        return result
+
+    original_lint_class = lint.Linter.lint_class
+    _originals.append((lint.Linter, "lint_class", vars(lint.Linter)["lint_class"]))
+    lint.Linter.lint_class = lint_class
+
+def _uninstrument():
+    while _originals:
+        owner, attr, value = _originals.pop()
+        setattr(owner, attr, value)
+
+def enable(cprofile: bool = False, memory: bool = False) -> Profiler:
+    global _current
+    if _current is not None:
+        return _current
+
+    _current = Profiler()
+    _instrument()
+
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    if cprofile:
+        import cProfile
+        _current._cprofile = cProfile.Profile()
+        _current._cprofile.enable()
+
+    return _current
+
+def disable() -> Profiler | None:
+    global _current
+    prof = _current
+    if prof is None:
+        return None
+
+    prof.wall = time.perf_counter() - prof.started
+
+    if prof._cprofile is not None:
+        import io
+        import pstats
+        prof._cprofile.disable()
+        out = io.StringIO()
+        pstats.Stats(prof._cprofile, stream=out).sort_stats("cumulative").print_stats(30)
+        prof.cprofile_stats = out.getvalue().strip()
+
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        prof.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    _uninstrument()
+    _current = None
+    return prof
+
+@contextmanager
+def profile(cprofile: bool = False, memory: bool = False):
+    prof = enable(cprofile, memory)
+    try:
+        yield prof
+    finally:
+        disable()
+
+# times a block of code as its own phase, does nothing when profiling is off
+@contextmanager
+def phase(name: str):
+    prof = _current
+    if prof is None:
+        yield
+        return
+
+    prof.enter(name)
+    try:
+        yield
+    finally:
+        prof.exit()
+
+OPTIONS = ("table", "json", "cprofile", "memory")
+
+# enables profiling for a tool run with `--profile[=options]`, the report is printed when the process exits
+def start(options: str | None):
+    if options is None:
+        return
+
+    options = [x for x in options.split(",") if x] or ["table"]
+    for option in options:
+        if option not in OPTIONS and not option.endswith(".json"):
+            raise ValueError(f"unknown profile option '{option}', expected a .json path or one of: {', '.join(OPTIONS)}")
+
+    enable("cprofile" in options, "memory" in options)
+
+    def report():
+        prof = disable()
+        if prof is None:
+            return
+
+        for option in options:
+            if option.endswith(".json"):
+                with open(option, "w") as f:
+                    json.dump(prof.to_dict(), f, indent=4)
+
+        if "json" in options:
+            print(json.dumps(prof.to_dict(), indent=4), file=sys.stderr)
+        elif "table" in options or not any(x.endswith(".json") for x in options):
+            print(prof.report(), file=sys.stderr)
+
+    atexit.register(report)
+
+# removes `--profile[=options]` from the arguments (sys.argv by default) and starts profiling if it was there.
+# Returns the remaining arguments, without the program name. Unknown options exit with a usage error, like argparse.
+def start_from_argv(argv: list[str] | None = None) -> list[str]:
+    args = list(sys.argv[1:] if argv is None else argv)
+    options = None
+    for arg in list(args):
+        if arg == "--profile" or arg.startswith("--profile="):
+            args.remove(arg)
+            options = arg.partition("=")[2] or "table"
+
+    if argv is None:
+        sys.argv[1:] = args
+
+    try:
+        start(options)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        raise SystemExit(2)
+    return args
+
+def is_enabled() -> bool:
+    return _current is not None
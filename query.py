@@ -0,0 +1,364 @@
+# Query language over the functions (global ones included) and members of parsed broma files
+# Run as: python cli.py query '<expression>' <files...>
+#
+# An expression is made of terms, combined with `and` (or just a space), `or`, `not`/`!` and parentheses:
+#   field:value     exact match, e.g. `ret:cocos2d::CCNode*`, `type:"gd::string const&"`
+#   field~regex     regex search, e.g. `name~^on[A-Z]`
+#   word            shorthand: `virtual`, `static`, `callback`, `inline` -> attr:word,
+#                   `function`, `member` -> kind:word, `Class::word` -> class:Class name:word, anything else -> name:word
+# Fields: kind, class, name, ret, arg, type, attr, bind (platform with an offset or inline bind), inline (platform
+# with an inline bind), offset (platform with an offset bind), block (platforms of the platform block the function or
+# member is in, `!block~.` for the ones that aren't in any).
+# Example: all virtual functions returning a node without a win bind: `virtual ret:cocos2d::CCNode* !bind:win`
+#
+# Every field is indexed, and `and` evaluates its most selective term first, then either intersects the
+# other terms or checks them row by row on the remaining candidates, whichever is cheaper.
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+import broma
+
+FIELDS = ["kind", "class", "name", "ret", "arg", "type", "attr", "bind", "inline", "offset", "block"]
+
+class QuerySyntaxError(ValueError):
+    pass
+
+# the way broma.split_variable writes the types of arguments and members: single spaces, pointers next to the type
+def normalize_type(type: str) -> str:
+    type = " ".join(type.split())
+    while " *" in type:
+        type = type.replace(" *", "*")
+
+    return broma.fix_cocos_typename(type)
+
+@dataclass
+class Row:
+    kind: str # "function" or "member"
+    cls: broma.BromaClass | None # None for global functions
+    part: broma.BromaFunction | broma.BromaMember
+    platforms: list[str] | None = None # of the platform block it's in
+
+    def values(self, field: str) -> list[str]:
+        part = self.part
+        if field == "kind":
+            return [self.kind]
+        if field == "block":
+            return self.platforms or []
+        if field == "class":
+            return [self.cls.name] if self.cls is not None else []
+        if field == "name":
+            return [part.name]
+
+        if isinstance(part, broma.BromaMember):
+            if field == "type":
+                return [normalize_type(part.type)]
+            if field == "attr":
+                return part.cpp_attributes
+            return []
+
+        if field == "ret":
+            return [normalize_type(part.ret_type)]
+        if field == "arg":
+            return [normalize_type(x) for x in part.get_arg_types()]
+        if field == "attr":
+            return part.attrs + part.cpp_attrs
+        if field == "bind":
+            return list(part.binds)
+        if field == "inline":
+            return [x for x in part.binds if part.binds[x] is None]
+        if field == "offset":
+            return [x for x in part.binds if part.binds[x] is not None]
+
+        return []
+
+    def describe(self) -> str:
+        only = f" ({', '.join(self.platforms)} only)" if self.platforms else ""
+        if isinstance(self.part, broma.BromaMember):
+            return f"{self.cls.name}::{self.part.name}: {self.part.type}{only}"
+
+        binds = ", ".join(f"{x} {'inline' if y is None else hex(y)}" for x, y in self.part.binds.items())
+        out = f"{self.cls.name}::{self.part.get_signature()}" if self.cls is not None else self.part.get_signature()
+        return (f"{out} = {binds}" if binds else out) + only
+
+class QueryIndex:
+    rows: list[Row]
+    # field -> value -> ids of rows with that value, in ascending order
+    indexes: dict[str, dict[str, list[int]]]
+
+    def __init__(self, files: list[broma.Broma]) -> None:
+        self.rows = []
+        self.indexes = {x: {} for x in FIELDS}
+
+        for file in files:
+            for cls in file.classes:
+                for part, platforms in cls.walk_parts():
+                    if isinstance(part, broma.BromaFunction):
+                        self._add(Row("function", cls, part, platforms))
+                    elif isinstance(part, broma.BromaMember):
+                        self._add(Row("member", cls, part, platforms))
+
+            for func in file.global_functions:
+                self._add(Row("function", None, func))
+
+    def _add(self, row: Row):
+        row_id = len(self.rows)
+        self.rows.append(row)
+
+        for field, index in self.indexes.items():
+            for value in set(row.values(field)):
+                index.setdefault(value, []).append(row_id)
+
+    def postings(self, field: str, value: str) -> list[int]:
+        return self.indexes[field].get(value, [])
+
+    def all_ids(self) -> set[int]:
+        return set(range(len(self.rows)))
+
+    def query(self, expression: str | Node) -> list[Row]:
+        node = parse_query(expression) if isinstance(expression, str) else expression
+        return [self.rows[x] for x in sorted(node.evaluate(self))]
+
+# query AST. `estimate` is the (upper bound of the) number of matching rows, used for planning.
+class Node:
+    def estimate(self, index: QueryIndex) -> int:
+        raise NotImplementedError
+
+    def evaluate(self, index: QueryIndex) -> set[int]:
+        raise NotImplementedError
+
+    def matches(self, index: QueryIndex, row_id: int) -> bool:
+        raise NotImplementedError
+
+    def explain(self, index: QueryIndex, depth: int = 0) -> str:
+        raise NotImplementedError
+
+@dataclass
+class Term(Node):
+    field: str
+    value: str
+    regex: bool = False
+
+    def __post_init__(self):
+        if self.field not in FIELDS:
+            raise QuerySyntaxError(f"unknown field '{self.field}', expected one of: {', '.join(FIELDS)}")
+
+        if self.regex:
+            try:
+                self.pattern = re.compile(self.value)
+            except re.error as e:
+                raise QuerySyntaxError(f"invalid regex '{self.value}': {e}")
+        elif self.field in ("ret", "arg", "type"):
+            self.value = normalize_type(self.value)
+
+    # for regexes, the distinct values of the field are matched instead of the rows
+    def _keys(self, index: QueryIndex) -> list[str]:
+        if not self.regex:
+            return [self.value]
+
+        return [x for x in index.indexes[self.field] if self.pattern.search(x)]
+
+    def estimate(self, index: QueryIndex) -> int:
+        return sum(len(index.postings(self.field, x)) for x in self._keys(index))
+
+    def evaluate(self, index: QueryIndex) -> set[int]:
+        out = set()
+        for key in self._keys(index):
+            out.update(index.postings(self.field, key))
+
+        return out
+
+    def matches(self, index: QueryIndex, row_id: int) -> bool:
+        values = index.rows[row_id].values(self.field)
+        if self.regex:
+            return any(self.pattern.search(x) for x in values)
+
+        return self.value in values
+
+    def explain(self, index: QueryIndex, depth: int = 0) -> str:
+        op = "~" if self.regex else ":"
+        return f"{'  ' * depth}{self.field}{op}{self.value} (~{self.estimate(index)} rows)"
+
+@dataclass
+class Not(Node):
+    child: Node
+
+    def estimate(self, index: QueryIndex) -> int:
+        return len(index.rows) - self.child.estimate(index) if isinstance(self.child, Term) and not self.child.regex else len(index.rows)
+
+    def evaluate(self, index: QueryIndex) -> set[int]:
+        return index.all_ids() - self.child.evaluate(index)
+
+    def matches(self, index: QueryIndex, row_id: int) -> bool:
+        return not self.child.matches(index, row_id)
+
+    def explain(self, index: QueryIndex, depth: int = 0) -> str:
+        return f"{'  ' * depth}not\n{self.child.explain(index, depth + 1)}"
+
+@dataclass
+class Or(Node):
+    children: list[Node]
+
+    def estimate(self, index: QueryIndex) -> int:
+        return min(len(index.rows), sum(x.estimate(index) for x in self.children))
+
+    def evaluate(self, index: QueryIndex) -> set[int]:
+        out = set()
+        for child in self.children:
+            out |= child.evaluate(index)
+
+        return out
+
+    def matches(self, index: QueryIndex, row_id: int) -> bool:
+        return any(x.matches(index, row_id) for x in self.children)
+
+    def explain(self, index: QueryIndex, depth: int = 0) -> str:
+        return "\n".join([f"{'  ' * depth}or"] + [x.explain(index, depth + 1) for x in self.children])
+
+@dataclass
+class And(Node):
+    children: list[Node]
+
+    def plan(self, index: QueryIndex) -> list[tuple[int, Node]]:
+        return sorted(((x.estimate(index), x) for x in self.children), key=lambda x: x[0])
+
+    def estimate(self, index: QueryIndex) -> int:
+        return self.plan(index)[0][0]
+
+    def evaluate(self, index: QueryIndex) -> set[int]:
+        plan = self.plan(index)
+        result = plan[0][1].evaluate(index)
+
+        for estimate, child in plan[1:]:
+            if not result:
+                break
+
+            # building the other side is only worth it when it's about as small as what's left
+            if estimate <= len(result):
+                result &= child.evaluate(index)
+            else:
+                result = {x for x in result if child.matches(index, x)}
+
+        return result
+
+    def matches(self, index: QueryIndex, row_id: int) -> bool:
+        return all(x.matches(index, row_id) for x in self.children)
+
+    def explain(self, index: QueryIndex, depth: int = 0) -> str:
+        return "\n".join([f"{'  ' * depth}and"] + [x.explain(index, depth + 1) for _, x in self.plan(index)])
+
+SHORTHANDS = {
+    **{x: "attr" for x in broma.BromaFunction.KNOWN_ATTRS},
+    "function": "kind",
+    "member": "kind",
+}
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+
+    while pos < len(text):
+        char = text[pos]
+        if char.isspace():
+            pos += 1
+            continue
+
+        if char in "()!":
+            tokens.append(("op", char))
+            pos += 1
+            continue
+
+        # a word, quoted parts of it can contain spaces and parentheses
+        start = pos
+        while pos < len(text) and not text[pos].isspace() and text[pos] not in "()":
+            if text[pos] == '"':
+                end = text.find('"', pos + 1)
+                if end == -1:
+                    raise QuerySyntaxError(f"unterminated string at {pos}")
+                pos = end
+
+            pos += 1
+
+        tokens.append(("word", text[start:pos]))
+
+    return tokens
+
+def _unquote(value: str) -> str:
+    return value.replace('"', '')
+
+def _parse_term(word: str) -> Node:
+    # a single colon, `::` is part of names
+    if match := re.match(r"([a-z]+)(:(?!:)|~)(.*)", word, re.S):
+        return Term(match.group(1), _unquote(match.group(3)), match.group(2) == "~")
+
+    if word in SHORTHANDS:
+        return Term(SHORTHANDS[word], word)
+
+    word = _unquote(word)
+    if "::" in word:
+        class_name, _, name = word.rpartition("::")
+        return And([Term("class", class_name), Term("name", name)])
+
+    return Term("name", word)
+
+def parse_query(text: str) -> Node:
+    tokens = _tokenize(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or() -> Node:
+        nonlocal pos
+        children = [parse_and()]
+        while peek() == ("word", "or"):
+            pos += 1
+            children.append(parse_and())
+
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and() -> Node:
+        nonlocal pos
+        children = [parse_not()]
+        while (tok := peek()) is not None and tok not in (("op", ")"), ("word", "or")):
+            if tok == ("word", "and"):
+                pos += 1
+            children.append(parse_not())
+
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not() -> Node:
+        nonlocal pos
+        tok = peek()
+        if tok in (("op", "!"), ("word", "not")):
+            pos += 1
+            return Not(parse_not())
+
+        return parse_atom()
+
+    def parse_atom() -> Node:
+        nonlocal pos
+        tok = peek()
+        if tok is None:
+            raise QuerySyntaxError("unexpected end of query")
+
+        pos += 1
+        if tok == ("op", "("):
+            node = parse_or()
+            if peek() != ("op", ")"):
+                raise QuerySyntaxError("expected ')'")
+            pos += 1
+            return node
+
+        if tok[0] == "op":
+            raise QuerySyntaxError(f"unexpected '{tok[1]}'")
+
+        return _parse_term(tok[1])
+
+    node = parse_or()
+    if pos != len(tokens):
+        raise QuerySyntaxError(f"unexpected '{tokens[pos][1]}'")
+
+    return node
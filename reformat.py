@@ -1,17 +1,19 @@
 # Parses a broma file, reformats it, and dumps it
-# Run as: python parse-and-dump.py <input> [output]
-# If output is not specified, it will overwrite the input file
+# Run as: python reformat.py <input> [output] [--check]
+# If output is not specified, it will overwrite the input file. With --check nothing is written, exits with 1 if it would change
 
 import broma
+import profiling
 import sys
-from pathlib import Path
+import writer
 
-file = broma.parse(sys.argv[1])
-file.sort_everything()
+profiling.start_from_argv()
+check = writer.check_from_argv()
 
-text = file.dump()
+file = broma.parse(sys.argv[1])
+text = file.dump_formatted()
 
 if len(sys.argv) == 2:
-    Path(sys.argv[1]).write_text(text)
+    writer.finish(sys.argv[1], text, check)
 else:
-    Path(sys.argv[2]).write_text(text)
+    writer.finish(sys.argv[2], text, check)
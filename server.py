@@ -0,0 +1,330 @@
+# Resident server that keeps parsed broma files in memory and answers queries over a unix socket
+# Run as: python cli.py serve <files...> [--socket path]
+#
+# The protocol is JSON-RPC 2.0, one request or response object per line. Methods:
+#   find_class(name)                         -> class summary or null
+#   find_function(name, class?, args?)       -> list of matching functions, `name` can be `Class::func`, without a
+#                                               class global functions are included
+#   symbolicate(platform, address)           -> the function bound at or before `address`, or null
+#   lint_class(name)                         -> list of diagnostics for the class
+#   type_uses(type)                          -> every argument, return type and member using the type
+#   unresolved_types()                       -> type names that aren't a class, builtin or known type -> their uses
+#   files()                                  -> loaded files and their class counts
+# Changed files are picked up by a watcher thread, and only classes whose text changed are parsed again.
+
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import json
+import socket
+import socketserver
+import sys
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import broma
+import lint
+import typeindex
+
+DEFAULT_SOCKET = "/tmp/broma.sock"
+
+@dataclass
+class LoadedFile:
+    path: Path
+    mtime_ns: int
+    file: broma.Broma
+    # platform -> sorted [(address, symbol)], built on first use
+    symbols: dict[str, list[tuple[int, str]]] | None = None
+    linter: lint.Linter | None = None
+
+    def symbol_table(self, platform: str) -> list[tuple[int, str]]:
+        if self.symbols is None:
+            self.symbols = {}
+            for cls in self.file.classes:
+                for part, _ in cls.walk_parts():
+                    if not isinstance(part, broma.BromaFunction):
+                        continue
+
+                    for plat, offset in part.binds.items():
+                        if offset is not None:
+                            self.symbols.setdefault(plat, []).append((offset, f"{cls.name}::{part.name}"))
+
+            for func in self.file.global_functions:
+                for plat, offset in func.binds.items():
+                    if offset is not None:
+                        self.symbols.setdefault(plat, []).append((offset, func.name))
+
+            for table in self.symbols.values():
+                table.sort()
+
+        return self.symbols.get(platform, [])
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+def _function_info(cls: broma.BromaClass | None, func: broma.BromaFunction, path: Path) -> dict:
+    return {
+        "file": str(path),
+        "class": cls.name if cls is not None else None,
+        "name": func.name,
+        "signature": func.get_signature(),
+        "args": func.get_arg_types(),
+        "ret_type": func.ret_type,
+        "attrs": func.attrs,
+        "binds": func.binds,
+    }
+
+@dataclass
+class Workspace:
+    paths: list[Path]
+    files: dict[Path, LoadedFile] = field(default_factory=dict)
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    # shared between reloads, so only classes that changed are checked again
+    lint_cache: lint.LintCache = field(default_factory=lint.LintCache)
+    # updated on every reload, only for the classes that were parsed again
+    types: typeindex.TypeIndex = field(default_factory=typeindex.TypeIndex)
+    # path -> mtime of the version that had a syntax error, so it's only parsed again once it changes
+    failed: dict[Path, int] = field(default_factory=dict)
+
+    # loads new and changed files, returns the paths that were (re)parsed. A file with a syntax error is reported
+    # and keeps its last version that parsed, if any
+    def refresh(self) -> list[Path]:
+        changed = []
+
+        for path in self.paths:
+            try:
+                mtime = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            loaded = self.files.get(path)
+            if loaded is not None and loaded.mtime_ns == mtime or self.failed.get(path) == mtime:
+                continue
+
+            # the parse moves the classes it reuses, which requests may be reading, so it holds the lock until the
+            # new version is in place or the old one has been put back
+            with self.lock:
+                old_lines = [(x, x.start_line) for x in loaded.file.classes] if loaded is not None else []
+                try:
+                    if loaded is None:
+                        file = broma.parse_mapped(path, incremental=True)
+                    else:
+                        file = broma.parse_mapped(path, reuse=loaded.file.class_sources)
+                except broma.BromaSyntaxError as e:
+                    e.path = str(path)
+                    print(e.format(), file=sys.stderr)
+                    self.failed[path] = mtime
+                    for cls, start_line in old_lines:
+                        cls.move_to(start_line)
+                    continue
+
+                self.failed.pop(path, None)
+                self.files[path] = LoadedFile(path, mtime, file)
+                self.types.update(str(path), file)
+
+            changed.append(path)
+
+        return changed
+
+    def watch(self, interval: float, stop: threading.Event):
+        while not stop.wait(interval):
+            self.refresh()
+
+    def _find_class(self, name: str) -> tuple[LoadedFile, broma.BromaClass] | None:
+        for loaded in self.files.values():
+            cls = loaded.file.find_class(name)
+            if cls is not None:
+                return loaded, cls
+
+        return None
+
+    def find_class(self, name: str) -> dict | None:
+        found = self._find_class(name)
+        if found is None:
+            return None
+
+        loaded, cls = found
+        return {
+            "file": str(loaded.path),
+            "name": cls.name,
+            "line": cls.start_line + 1,
+            "bases": cls.bases,
+            "attributes": cls.attributes,
+            # parts of platform blocks have the platforms of the block
+            "functions": [
+                _function_info(cls, x, loaded.path) | ({"platforms": platforms} if platforms else {})
+                for x, platforms in cls.walk_parts() if isinstance(x, broma.BromaFunction)
+            ],
+            "members": [
+                {"type": x.type, "name": x.name} | ({"platforms": platforms} if platforms else {})
+                for x, platforms in cls.walk_parts() if isinstance(x, broma.BromaMember)
+            ],
+        }
+
+    def find_function(self, name: str, class_: str | None = None, args: list[str] | None = None) -> list[dict]:
+        if class_ is None and "::" in name:
+            class_, _, name = name.rpartition("::")
+
+        out = []
+        for loaded in self.files.values():
+            classes = loaded.file.classes
+            if class_ is not None:
+                cls = loaded.file.find_class(class_)
+                classes = [cls] if cls is not None else []
+
+            for cls in classes:
+                for part, _ in cls.walk_parts():
+                    if not isinstance(part, broma.BromaFunction) or part.name != name:
+                        continue
+
+                    if args is None or part.get_arg_types() == args:
+                        out.append(_function_info(cls, part, loaded.path))
+
+            if class_ is None:
+                for func in loaded.file.global_functions.find(name):
+                    if args is None or func.get_arg_types() == args:
+                        out.append(_function_info(None, func, loaded.path))
+
+        return out
+
+    def symbolicate(self, platform: str, address: int | str) -> dict | None:
+        if isinstance(address, str):
+            address = int(address, 0)
+
+        best = None
+        for loaded in self.files.values():
+            table = loaded.symbol_table(platform)
+            idx = bisect.bisect_right(table, (address, "\U0010ffff")) - 1
+            if idx >= 0 and (best is None or table[idx][0] > best[0]):
+                best = table[idx]
+
+        if best is None:
+            return None
+
+        return {"symbol": best[1], "address": best[0], "offset": address - best[0]}
+
+    def lint_class(self, name: str) -> list[dict]:
+        found = self._find_class(name)
+        if found is None:
+            raise RpcError(-32602, f"class not found: {name}")
+
+        loaded, cls = found
+        if loaded.linter is None:
+            loaded.linter = lint.Linter(loaded.file, self.lint_cache)
+
+        return [dataclasses.asdict(x) for x in loaded.linter.lint_class(cls)]
+
+    def type_uses(self, type: str) -> list[dict]:
+        return [dataclasses.asdict(x) for x in self.types.uses(type)]
+
+    def unresolved_types(self) -> dict[str, list[dict]]:
+        return {name: [dataclasses.asdict(x) for x in usages] for name, usages in self.types.unresolved().items()}
+
+    def list_files(self) -> list[dict]:
+        return [{"file": str(x.path), "classes": len(x.file.classes)} for x in self.files.values()]
+
+    def call(self, method: str, params: dict | list) -> object:
+        handlers = {
+            "find_class": self.find_class,
+            "find_function": self.find_function,
+            "symbolicate": self.symbolicate,
+            "lint_class": self.lint_class,
+            "type_uses": self.type_uses,
+            "unresolved_types": self.unresolved_types,
+            "files": self.list_files,
+        }
+
+        if method not in handlers:
+            raise RpcError(-32601, f"method not found: {method}")
+
+        if isinstance(params, dict) and "class" in params:
+            params = dict(params)
+            params["class_"] = params.pop("class")
+
+        with self.lock:
+            try:
+                if isinstance(params, list):
+                    return handlers[method](*params)
+                return handlers[method](**params)
+            except TypeError as e:
+                raise RpcError(-32602, f"invalid params: {e}")
+
+    def handle_message(self, line: str) -> dict | None:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": f"parse error: {e}"}}
+
+        if not isinstance(request, dict):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "invalid request: not an object"}}
+
+        req_id = request.get("id")
+        try:
+            result = self.call(request.get("method", ""), request.get("params", {}))
+        except RpcError as e:
+            response = {"jsonrpc": "2.0", "id": req_id, "error": {"code": e.code, "message": e.message}}
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "id": req_id, "error": {"code": -32603, "message": f"{type(e).__name__}: {e}"}}
+        else:
+            response = {"jsonrpc": "2.0", "id": req_id, "result": result}
+
+        # requests without an id are notifications and get no response
+        return response if "id" in request else None
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        workspace: Workspace = self.server.workspace
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+
+            response = workspace.handle_message(raw.decode("utf-8"))
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+class BromaServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workspace: Workspace) -> None:
+        Path(socket_path).unlink(missing_ok=True)
+        super().__init__(socket_path, _Handler)
+        self.workspace = workspace
+
+def serve(paths: list[Path], socket_path: str = DEFAULT_SOCKET, interval: float = 0.5):
+    workspace = Workspace(paths)
+    workspace.refresh()
+
+    stop = threading.Event()
+    watcher = threading.Thread(target=workspace.watch, args=(interval, stop), daemon=True)
+    watcher.start()
+
+    print(f"Serving {len(workspace.files)} file(s) on {socket_path}")
+    with BromaServer(socket_path, workspace) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            Path(socket_path).unlink(missing_ok=True)
+
+# sends a single request to a running server and returns its result
+def request(method: str, socket_path: str = DEFAULT_SOCKET, **params) -> object:
+    if "class_" in params:
+        params["class"] = params.pop("class_")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}).encode("utf-8") + b"\n")
+        response = json.loads(sock.makefile("rb").readline())
+
+    if "error" in response:
+        raise RpcError(response["error"]["code"], response["error"]["message"])
+
+    return response["result"]
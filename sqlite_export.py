@@ -0,0 +1,201 @@
+# Exports parsed broma files to a SQLite database, so that other tools can query the bindings with SQL
+# Run as: python cli.py export-sqlite <files...> [-o broma.db]
+#
+# Exporting into an existing database only touches the classes whose content hash changed since the last export,
+# the other ones just get their lines moved. Every class of a file is exported in one transaction.
+# Example, all offsets for a platform:
+#   SELECT c.name, f.name, b.offset FROM binds b JOIN functions f ON f.id = b.function_id
+#   LEFT JOIN classes c ON c.id = f.class_id WHERE b.platform = 'win' AND b.offset IS NOT NULL
+
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+import broma
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    attributes TEXT NOT NULL,
+    start_line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bases (
+    class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS functions (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    class_id INTEGER REFERENCES classes(id) ON DELETE CASCADE, -- NULL for global functions
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    ret_type TEXT NOT NULL,
+    attrs TEXT NOT NULL,
+    qualifier TEXT NOT NULL,
+    has_body INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    platforms TEXT NOT NULL -- of the platform block it's in, comma separated, empty outside of blocks
+);
+CREATE TABLE IF NOT EXISTS args (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS binds (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    platform TEXT NOT NULL,
+    offset INTEGER -- NULL for inline binds
+);
+CREATE TABLE IF NOT EXISTS members (
+    class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    platforms TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pads (
+    class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    platform TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    platforms TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS classes_name ON classes(name);
+CREATE INDEX IF NOT EXISTS classes_file_hash ON classes(file_id, hash);
+CREATE INDEX IF NOT EXISTS bases_class ON bases(class_id);
+CREATE INDEX IF NOT EXISTS bases_name ON bases(name);
+CREATE INDEX IF NOT EXISTS functions_class ON functions(class_id);
+CREATE INDEX IF NOT EXISTS functions_file ON functions(file_id);
+CREATE INDEX IF NOT EXISTS functions_name ON functions(name);
+CREATE INDEX IF NOT EXISTS args_function ON args(function_id);
+CREATE INDEX IF NOT EXISTS args_type ON args(type);
+CREATE INDEX IF NOT EXISTS binds_function ON binds(function_id);
+CREATE INDEX IF NOT EXISTS binds_platform_offset ON binds(platform, offset);
+CREATE INDEX IF NOT EXISTS members_class ON members(class_id);
+CREATE INDEX IF NOT EXISTS members_type ON members(type);
+CREATE INDEX IF NOT EXISTS pads_class ON pads(class_id);
+"""
+
+@dataclass
+class ExportStats:
+    inserted: int = 0
+    kept: int = 0
+    removed: int = 0
+
+def connect(path: Path | str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+
+    version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    if version is None:
+        with conn:
+            conn.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    elif int(version[0]) != SCHEMA_VERSION:
+        raise ValueError(f"{path} has schema version {version[0]}, expected {SCHEMA_VERSION}, export to a new database")
+
+    return conn
+
+# collects the rows of new classes and functions, with ids handed out up front so that everything can be inserted with executemany
+class _Rows:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.next_class_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM classes").fetchone()[0]
+        self.next_function_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM functions").fetchone()[0]
+        self.tables: dict[str, list[tuple]] = {x: [] for x in ("classes", "bases", "functions", "args", "binds", "members", "pads")}
+
+    def function(self, file_id: int, class_id: int | None, position: int, func: broma.BromaFunction, platforms: str = ""):
+        func_id = self.next_function_id
+        self.next_function_id += 1
+
+        self.tables["functions"].append((
+            func_id, file_id, class_id, position, func.name, func.get_signature(), func.ret_type,
+            " ".join(func.attrs), func.qualifier, int(bool(func.inlined_body)), func.line, platforms,
+        ))
+        self.tables["args"] += [(func_id, idx, type, name) for idx, (type, name) in enumerate(func.args)]
+        self.tables["binds"] += [(func_id, platform, offset) for platform, offset in func.binds.items()]
+
+    def cls(self, file_id: int, position: int, cls: broma.BromaClass, digest: str):
+        class_id = self.next_class_id
+        self.next_class_id += 1
+
+        self.tables["classes"].append((class_id, file_id, position, cls.name, digest, ", ".join(cls.attributes), cls.start_line, cls.end_line))
+        self.tables["bases"] += [(class_id, idx, name) for idx, name in enumerate(cls.bases)]
+
+        # parts of platform blocks come in the place of their block
+        for idx, (part, block) in enumerate(cls.walk_parts()):
+            platforms = ", ".join(block or [])
+            if isinstance(part, broma.BromaFunction):
+                self.function(file_id, class_id, idx, part, platforms)
+            elif isinstance(part, broma.BromaMember):
+                self.tables["members"].append((class_id, idx, part.type, part.name, part.line, platforms))
+            elif isinstance(part, broma.BromaPad):
+                self.tables["pads"] += [(class_id, idx, platform, size, part.line, platforms) for platform, size in part.platforms.items()]
+
+    def insert(self, conn: sqlite3.Connection):
+        for table, rows in self.tables.items():
+            if rows:
+                placeholders = ", ".join("?" * len(rows[0]))
+                conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+def export_file(conn: sqlite3.Connection, path: Path | str, file: broma.Broma) -> ExportStats:
+    stats = ExportStats()
+
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (str(path),))
+        file_id = conn.execute("SELECT id FROM files WHERE path = ?", (str(path),)).fetchone()[0]
+
+        # hash -> [(id, start line)] of what was exported last time
+        existing: dict[str, list[tuple[int, int]]] = {}
+        for class_id, digest, start_line in conn.execute("SELECT id, hash, start_line FROM classes WHERE file_id = ?", (file_id,)):
+            existing.setdefault(digest, []).append((class_id, start_line))
+
+        rows = _Rows(conn)
+        for position, cls in enumerate(file.classes):
+            digest = cls.content_hash().hex()
+            if existing.get(digest):
+                class_id, old_start = existing[digest].pop()
+                delta = cls.start_line - old_start
+                conn.execute("UPDATE classes SET position = ?, start_line = start_line + ?, end_line = end_line + ? WHERE id = ?", (position, delta, delta, class_id))
+                if delta:
+                    for table in ("functions", "members", "pads"):
+                        conn.execute(f"UPDATE {table} SET line = line + ? WHERE class_id = ? AND line != -1", (delta, class_id))
+                stats.kept += 1
+            else:
+                rows.cls(file_id, position, cls, digest)
+                stats.inserted += 1
+
+        removed = [(class_id,) for ids in existing.values() for class_id, _ in ids]
+        conn.executemany("DELETE FROM classes WHERE id = ?", removed)
+        stats.removed = len(removed)
+
+        # global functions are few, always replace them
+        conn.execute("DELETE FROM functions WHERE file_id = ? AND class_id IS NULL", (file_id,))
+        for position, func in enumerate(file.global_functions):
+            rows.function(file_id, None, position, func)
+
+        rows.insert(conn)
+
+    return stats
+
+def export(paths: list[Path], db_path: Path | str) -> dict[Path, ExportStats]:
+    conn = connect(db_path)
+    try:
+        return {path: export_file(conn, path, broma.parse(path, mapped=True)) for path in paths}
+    finally:
+        conn.close()
@@ -0,0 +1,196 @@
+# Bind coverage and layout statistics of bindings files, and how they change between versions
+# Run as: python cli.py stats <files...> [--against old files...] [--json] [--cache path]
+#     or: python cli.py history stats <store> [versions...] [--json]
+#
+# A function is bound on a platform when it has an address there, and inlined there when it's bound to `inline`.
+# Functions with a body in the bindings are counted apart, and ones with neither binds nor a body are unbound.
+# A class has a complete layout on a platform when none of its pads have a size there, and a complete layout when it
+# has no pads at all. Functions and members in platform blocks are counted like any other.
+#
+# Everything is gathered in one walk over each class and kept per class by content hash (in memory, and in a file with
+# --cache), so the stats of a file where few classes changed only walk those. For a history store the class keys of
+# the versions are used instead, so each version only loads the classes that no version before it had.
+
+from __future__ import annotations
+
+import dataclasses
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import broma
+import history
+
+@dataclass
+class Stats:
+    classes: int = 0
+    functions: int = 0 # including global functions
+    global_functions: int = 0
+    bodies: int = 0 # functions with a body
+    unbound: int = 0 # functions with no binds and no body
+    members: int = 0
+    pads: int = 0
+    complete_layouts: int = 0 # classes without pads
+    bound: Counter[str] = field(default_factory=Counter) # platform -> functions with an address
+    inlined: Counter[str] = field(default_factory=Counter) # platform -> functions bound to `inline`
+    padded: Counter[str] = field(default_factory=Counter) # platform -> classes with a pad there
+
+    def add(self, other: Stats):
+        for x in dataclasses.fields(self):
+            value = getattr(other, x.name)
+            if isinstance(value, Counter):
+                getattr(self, x.name).update(value)
+            else:
+                setattr(self, x.name, getattr(self, x.name) + value)
+
+    # the change from `old` to this, counters keep the platforms that went to 0
+    def delta(self, old: Stats) -> Stats:
+        out = Stats()
+        for x in dataclasses.fields(self):
+            new_value, old_value = getattr(self, x.name), getattr(old, x.name)
+            if isinstance(new_value, Counter):
+                setattr(out, x.name, Counter({k: new_value[k] - old_value[k] for k in new_value.keys() | old_value.keys()}))
+            else:
+                setattr(out, x.name, new_value - old_value)
+        return out
+
+    # in order of first appearance
+    def platforms(self) -> list[str]:
+        return list(dict.fromkeys([*self.bound, *self.inlined, *self.padded]))
+
+    # share of the functions that are bound or inlined on a platform, in percent
+    def coverage(self, platform: str) -> float:
+        return 100 * (self.bound[platform] + self.inlined[platform]) / self.functions if self.functions else 0.0
+
+    def to_json(self) -> dict:
+        return {x.name: dict(sorted(getattr(self, x.name).items())) if x.type.startswith("Counter") else getattr(self, x.name) for x in dataclasses.fields(self)}
+
+    @classmethod
+    def from_json(cls, data: dict) -> Stats:
+        out = cls(**data)
+        for x in dataclasses.fields(out):
+            if x.type.startswith("Counter"):
+                setattr(out, x.name, Counter(getattr(out, x.name)))
+        return out
+
+def _add_function(stats: Stats, func: broma.BromaFunction):
+    stats.functions += 1
+    if func.inlined_body:
+        stats.bodies += 1
+    elif not func.binds:
+        stats.unbound += 1
+
+    for platform, offset in func.binds.items():
+        (stats.inlined if offset is None else stats.bound)[platform] += 1
+
+def class_stats(cls: broma.BromaClass) -> Stats:
+    stats = Stats(classes=1)
+    padded = set()
+    for part, _ in cls.walk_parts():
+        if isinstance(part, broma.BromaFunction):
+            _add_function(stats, part)
+        elif isinstance(part, broma.BromaMember):
+            stats.members += 1
+        elif isinstance(part, broma.BromaPad):
+            stats.pads += 1
+            padded.update(part.platforms)
+
+    stats.padded.update(padded)
+    stats.complete_layouts = int(not stats.pads)
+    return stats
+
+def global_stats(funcs: list[broma.BromaFunction]) -> Stats:
+    stats = Stats(global_functions=len(funcs))
+    for func in funcs:
+        _add_function(stats, func)
+    return stats
+
+# Stats of already counted classes, by content hash
+@dataclass
+class StatsCache:
+    entries: dict[str, dict] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> StatsCache:
+        try:
+            return cls(json.loads(path.read_text()))
+        except (FileNotFoundError, ValueError):
+            return cls()
+
+    def save(self, path: Path):
+        path.write_text(json.dumps(self.entries))
+
+    def get(self, key: bytes, cls: broma.BromaClass) -> Stats:
+        data = self.entries.get(key.hex())
+        if data is None:
+            self.misses += 1
+            stats = class_stats(cls)
+            self.entries[key.hex()] = stats.to_json()
+            return stats
+
+        self.hits += 1
+        return Stats.from_json(data)
+
+# `digests` are id(class) -> content hash, for callers that already know them (e.g. from an incremental parse)
+def file_stats(file: broma.Broma, cache: StatsCache | None = None, digests: dict[int, bytes] | None = None) -> Stats:
+    cache = cache if cache is not None else StatsCache()
+    digests = digests or {}
+    stats = global_stats(file.global_functions)
+    for cls in file.classes:
+        stats.add(cache.get(digests.get(id(cls)) or cls.content_hash(), cls))
+    return stats
+
+def files_stats(files: list[broma.Broma], cache: StatsCache | None = None) -> Stats:
+    stats = Stats()
+    for file in files:
+        stats.add(file_stats(file, cache, {id(cls): key for key, cls in file.class_sources.items()}))
+    return stats
+
+# stats of versions in a history store (all of them by default), by name. A class key is only loaded and counted the
+# first time any version (or an earlier run with the same cache) has it
+def history_stats(store: history.HistoryStore, versions: list[str] | None = None, cache: StatsCache | None = None) -> dict[str, Stats]:
+    cache = cache if cache is not None else StatsCache()
+    out = {}
+    for name in versions if versions is not None else [x.name for x in store.versions()]:
+        keys = [key for _, key in store.class_keys(name)]
+        missing = list(dict.fromkeys(x for x in keys if x.hex() not in cache.entries))
+        loaded = store.load_classes(missing) if missing else {}
+
+        stats = global_stats(store.load_functions(store.global_keys(name)))
+        for key in keys:
+            stats.add(cache.get(key, loaded.get(key)))
+        out[name] = stats
+    return out
+
+def _cell(value: int | float, delta: int | float | None, format: str = "", unit: str = "") -> str:
+    text = f"{value:{format}}{unit}"
+    if delta:
+        text += f" ({delta:+{format}})"
+    return text
+
+def format_table(stats: Stats, old: Stats | None = None) -> str:
+    delta = stats.delta(old) if old is not None else None
+
+    def cell(name: str, platform: str | None = None) -> str:
+        value = getattr(stats, name) if platform is None else getattr(stats, name)[platform]
+        change = None if delta is None else getattr(delta, name) if platform is None else getattr(delta, name)[platform]
+        return _cell(value, change)
+
+    lines = [
+        f"{cell('classes')} classes, {cell('complete_layouts')} with a complete layout, {cell('members')} members, {cell('pads')} pads",
+        f"{cell('functions')} functions ({cell('global_functions')} global), {cell('bodies')} with a body, {cell('unbound')} unbound",
+        "",
+        f"{'platform':<12} {'bound':>16} {'inlined':>16} {'coverage':>18} {'complete layout':>18}",
+    ]
+
+    platforms = stats.platforms() + [x for x in (old.platforms() if old is not None else []) if x not in stats.platforms()]
+    for platform in platforms:
+        coverage = _cell(stats.coverage(platform), None if old is None else round(stats.coverage(platform) - old.coverage(platform), 1), ".1f", "%")
+        complete = stats.classes - stats.padded[platform]
+        complete_delta = None if old is None else complete - (old.classes - old.padded[platform])
+        lines.append(f"{platform:<12} {cell('bound', platform):>16} {cell('inlined', platform):>16} {coverage:>18} {_cell(complete, complete_delta):>18}")
+
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+# Address -> symbol tables per platform, for symbolicating crashes without parsing broma files
+# Run as: python cli.py export-symbols <files...> -o symbols.bsym
+#         python cli.py symbolicate symbols.bsym <platform> <addresses...>
+#
+# Layout, all little endian:
+#   header: magic "BSYM", version (u32), platform count (u32), string count (u32), strings offset (u64)
+#   per platform: name (16 bytes, zero padded), table offset (u64), entry count (u64)
+#   per platform table: entries of (address u64, string index u32), sorted by address
+#   strings: string count + 1 offsets (u32) into the blob that follows them, then the utf-8 blob
+# Everything is fixed width, so the reader maps the file and binary searches the tables in place.
+
+from __future__ import annotations
+
+import bisect
+import mmap
+import struct
+from pathlib import Path
+
+import broma
+
+MAGIC = b"BSYM"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIIQ")
+PLATFORM = struct.Struct("<16sQQ")
+ENTRY = struct.Struct("<QI")
+ADDRESS = struct.Struct("<Q")
+STRING_OFFSET = struct.Struct("<I")
+
+def symbol_name(cls: broma.BromaClass | None, func: broma.BromaFunction) -> str:
+    return f"{cls.name}::{func.name}" if cls is not None else func.name
+
+# platform -> sorted [(address, symbol)] of every function with an offset
+def collect(files: list[broma.Broma]) -> dict[str, list[tuple[int, str]]]:
+    tables = {}
+    for file in files:
+        functions = [(cls, part) for cls in file.classes for part, _ in cls.walk_parts() if isinstance(part, broma.BromaFunction)]
+        functions += [(None, func) for func in file.global_functions]
+
+        for cls, func in functions:
+            for platform, offset in func.binds.items():
+                if offset is not None:
+                    tables.setdefault(platform, []).append((offset, symbol_name(cls, func)))
+
+    for table in tables.values():
+        table.sort()
+
+    return tables
+
+def write(tables: dict[str, list[tuple[int, str]]], path: Path | str):
+    strings: dict[str, int] = {}
+    for table in tables.values():
+        for _, name in table:
+            strings.setdefault(name, len(strings))
+
+    platforms = sorted(tables)
+    offset = HEADER.size + PLATFORM.size * len(platforms)
+
+    directory = b""
+    body = bytearray()
+    for platform in platforms:
+        encoded = platform.encode("utf-8")
+        if len(encoded) > 16:
+            raise ValueError(f"platform name '{platform}' is longer than 16 bytes")
+
+        directory += PLATFORM.pack(encoded, offset + len(body), len(tables[platform]))
+        for address, name in tables[platform]:
+            body += ENTRY.pack(address, strings[name])
+
+    strings_offset = offset + len(body)
+    blob = bytearray()
+    string_offsets = bytearray()
+    for name in strings:
+        string_offsets += STRING_OFFSET.pack(len(blob))
+        blob += name.encode("utf-8")
+    string_offsets += STRING_OFFSET.pack(len(blob))
+
+    header = HEADER.pack(MAGIC, VERSION, len(platforms), len(strings), strings_offset)
+    Path(path).write_bytes(header + directory + body + string_offsets + blob)
+
+def export(files: list[broma.Broma], path: Path | str):
+    write(collect(files), path)
+
+# the addresses of one table as a sequence, for bisect
+class _Addresses:
+    def __init__(self, buffer: mmap.mmap, offset: int, count: int) -> None:
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx: int) -> int:
+        return ADDRESS.unpack_from(self.buffer, self.offset + idx * ENTRY.size)[0]
+
+class SymbolMap:
+    def __init__(self, path: Path | str) -> None:
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, platform_count, self.string_count, self.strings_offset = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a symbol map")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"{path} has version {version}, expected {VERSION}")
+
+        self.blob_offset = self.strings_offset + STRING_OFFSET.size * (self.string_count + 1)
+        self.tables: dict[str, _Addresses] = {}
+        for idx in range(platform_count):
+            name, offset, count = PLATFORM.unpack_from(self.buffer, HEADER.size + idx * PLATFORM.size)
+            self.tables[name.rstrip(b"\0").decode("utf-8")] = _Addresses(self.buffer, offset, count)
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self) -> SymbolMap:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def platforms(self) -> list[str]:
+        return list(self.tables)
+
+    def string(self, idx: int) -> str:
+        start, end = struct.unpack_from("<II", self.buffer, self.strings_offset + idx * STRING_OFFSET.size)
+        return str(self.buffer[self.blob_offset + start:self.blob_offset + end], "utf-8")
+
+    def entry(self, platform: str, idx: int) -> tuple[int, str]:
+        table = self.tables[platform]
+        address, string = ENTRY.unpack_from(self.buffer, table.offset + idx * ENTRY.size)
+        return address, self.string(string)
+
+    # the symbol at or before `address` as (symbol, symbol address, offset from it), None if there is none
+    def lookup(self, platform: str, address: int) -> tuple[str, int, int] | None:
+        table = self.tables.get(platform)
+        if table is None:
+            return None
+
+        idx = bisect.bisect_right(table, address) - 1
+        if idx < 0:
+            return None
+
+        start, name = self.entry(platform, idx)
+        return name, start, address - start
+
+    def __iter__(self):
+        for platform, table in self.tables.items():
+            for idx in range(len(table)):
+                yield platform, *self.entry(platform, idx)
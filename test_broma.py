@@ -0,0 +1,349 @@
+# Regression tests for the parser and the tools built on it
+# Run as: python -m pytest -q
+
+import io
+import os
+import struct
+import threading
+
+import pytest
+
+import binverify
+import broma
+import cpptype
+import history
+import lint
+import lsp
+import offsets
+import profiling
+import query
+import server
+import sqlite_export
+import symbols
+import typeindex
+
+def test_global_function_with_body_on_one_line():
+    file = broma.Broma(
+        "class A {\n"
+        "    void foo() = win 0x10;\n"
+        "}\n"
+        "\n"
+        "void globalFn(int x) = win 0x20;\n"
+        "inline void inl() { return; }\n"
+        "[[link(win)]]\n"
+        "void other() = win 0x30;\n"
+    )
+    assert [x.name for x in file.global_functions] == ["globalFn", "inl", "other"]
+    assert file.global_functions.find("inl")[0].inlined_body == "{ return; }"
+    assert file.global_functions.find("other")[0].cpp_attrs == ["link(win)"]
+
+def test_global_function_with_body_at_end_of_file():
+    file = broma.Broma("class A {\n}\n\nvoid last() { }")
+    assert [x.name for x in file.global_functions] == ["last"]
+    assert "void last() { }" in file.dump()
+
+def test_reparse_of_a_changed_range():
+    text = "class A {\n    void a() = win 0x10;\n}\n\nclass B : A {\n    void b() = win 0x20;\n}\n\nvoid g() = win 0x30;\n"
+    file = broma.Broma(text, incremental=True, recover=True)
+    first_class = file.classes[0]
+
+    start = text.index("void b")
+    new_text = text[:start] + "int m_x;\n    " + text[start:]
+    file = file.reparse(new_text, (start, start, start + len("int m_x;\n    ")))
+    full = broma.Broma(new_text)
+
+    assert file.dump() == full.dump()
+    assert [x.line for x in file.global_functions] == [x.line for x in full.global_functions] == [9]
+    # the class before the change is kept as it is
+    assert file.classes[0] is first_class
+
+def test_reformat_keeps_global_functions():
+    file = broma.Broma("class A {\n    void a() = win 0x10;\n}\n\n[[link(win)]]\nvoid g(int x) = win 0x30;\n")
+    text = file.dump_formatted(jobs=1)
+    assert "[[link(win)]]\nvoid g(int x) = win 0x30;" in text
+    assert [x.name for x in broma.Broma(text).global_functions] == ["g"]
+
+def test_syntax_errors_in_platform_blocks_are_reported():
+    text = "class A {\n    win, mac {\n        void ok() = win 0x20;\n        ()\n    }\n}\n"
+    file = broma.Broma(text, recover=True)
+    assert [x.line for x in file.errors] == [3]
+    assert file.classes[0].errors == file.errors
+
+def test_rebase_rejects_overlapping_ranges():
+    file = broma.Broma("class A {\n    void a() = win 0x150;\n}\n")
+    store = offsets.OffsetStore.from_file(file)
+    with pytest.raises(ValueError):
+        store.rebase("win", [(0x100, 0x200, 0x10), (0x140, 0x300, 0x20)])
+    assert store.rebase("win", [(0x100, 0x200, 0x10), (0x200, 0x300, 0x20)]) == 1
+
+def test_offsets_in_platform_blocks():
+    file = broma.Broma("class A {\n    win {\n        void a() = win 0x150;\n    }\n}\n")
+    store = offsets.OffsetStore.from_file(file)
+    assert store.shift("win", 0x10) == 1
+    store.write_back()
+    assert "void a() = win 0x160;" in file.dump()
+
+def test_history_replaces_a_version_in_its_place(tmp_path):
+    with history.HistoryStore(tmp_path / "history.db") as store:
+        for name in ["1.0", "2.0", "3.0"]:
+            store.add(name, broma.Broma(f"class A {{\n    void v{name[0]}() = win 0x10;\n}}\n"))
+        store.add("2.0", broma.Broma("class A {\n    void changed() = win 0x10;\n}\n"))
+        assert [x.name for x in store.versions()] == ["1.0", "2.0", "3.0"]
+        assert "changed" in store.load("2.0").dump()
+
+def test_invalid_offset_is_a_syntax_error(capsys):
+    file = broma.Broma("class A {\n    void f() = win 0x;\n    void g() = win 0x10;\n}\n", recover=True)
+    assert [(x.line, x.message) for x in file.errors] == [(1, "invalid offset: 0x")]
+    assert [x.name for x in file.classes[0].parts] == ["g"]
+    # the language server talks over stdout
+    assert capsys.readouterr().out == ""
+
+def test_reparse_with_identical_classes():
+    bar = "class Bar {\n    void a() = win 0x10;\n}\n\n"
+    text = bar + bar + "class C {\n    void c() = win 0x20;\n}\n"
+    file = broma.Broma(text, incremental=True, recover=True)
+
+    start = text.index("void c")
+    new_text = text[:start] + "int m_x;\n    " + text[start:]
+    file = file.reparse(new_text, (start, start, start + len("int m_x;\n    ")))
+    assert not file.errors
+    assert file.dump() == broma.Broma(new_text).dump()
+
+    # and again, with the tree from the ranged reparse
+    start = new_text.index("void a")
+    newer_text = new_text[:start] + "int m_y;\n    " + new_text[start:]
+    file = file.reparse(newer_text, (start, start, start + len("int m_y;\n    ")))
+    assert not file.errors
+    assert file.dump() == broma.Broma(newer_text).dump()
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_recover_reports_every_broken_class(incremental):
+    text = (
+        "class A {\n    void a() = win 0x10;\n}\n\n"
+        "clas B {\n    void b() = win 0x20;\n}\n\n"
+        "class C : {\n    void c() = win 0x30;\n}\n\n"
+        "clas D {\n    void d() = win 0x40;\n}\n"
+    )
+    file = broma.Broma(text, incremental=incremental, recover=True)
+    assert [x.name for x in file.classes] == ["A", "C"]
+    assert [(x.line, x.message) for x in file.errors] == [(4, "expected a class"), (12, "expected a class")]
+
+def test_invalid_pad_is_a_syntax_error():
+    file = broma.Broma("class A {\n    PAD = win 0x;\n    PAD = win 0xZZ;\n    int m_x;\n}\n", recover=True)
+    assert [(x.line, x.message) for x in file.errors] == [(1, "invalid pad offset: 0x"), (2, "invalid pad offset: 0xZZ")]
+    assert [x.name for x in file.classes[0].parts] == ["m_x"]
+
+    with pytest.raises(broma.BromaSyntaxError):
+        broma.Broma("class A {\n    PAD = win 0x;\n}\n")
+
+def test_unclosed_attributes_and_signatures_are_errors():
+    file = broma.Broma(
+        "class A {\n"
+        "    [[depr\n"
+        "    void a() = win 0x10;\n"
+        "    void b(int x,\n"
+        "    void c() = win 0x20;\n"
+        "    void d() = win 0x30;\n"
+        "}\n",
+        recover=True,
+    )
+    assert [(x.line, x.message) for x in file.errors] == [(1, "attributes were never closed"), (3, "function signature was never closed")]
+    assert [x.name for x in file.classes[0].parts if isinstance(x, broma.BromaFunction)] == ["a", "c", "d"]
+
+def test_server_keeps_the_last_good_version(tmp_path, capsys):
+    path = tmp_path / "a.bro"
+    path.write_text("class A {\n    win {\n        void f() = win 0x10;\n    }\n}\n")
+    workspace = server.Workspace([path])
+    workspace.refresh()
+    assert [x["name"] for x in workspace.find_function("A::f")] == ["f"]
+
+    path.write_text("clas A {\n}\n")
+    os.utime(path, ns=(1, 1))
+    assert workspace.refresh() == []
+    assert "expected a class" in capsys.readouterr().err
+    assert workspace.find_class("A") is not None
+
+    path.write_text("class B {\n}\n")
+    os.utime(path, ns=(2, 2))
+    assert workspace.refresh() == [path]
+    assert workspace.find_class("B") is not None
+
+    assert workspace.handle_message("[]")["error"]["code"] == -32600
+
+def test_server_parses_under_the_lock(tmp_path, monkeypatch):
+    path = tmp_path / "a.bro"
+    path.write_text("class A {\n    void f() = win 0x10;\n}\n\nvoid g() = win 0x40;\n")
+    workspace = server.Workspace([path])
+    parse_mapped = broma.parse_mapped
+    held = []
+
+    def parse(*args, **kwargs):
+        thread = threading.Thread(target=lambda: held.append(not workspace.lock.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+        return parse_mapped(*args, **kwargs)
+
+    monkeypatch.setattr(broma, "parse_mapped", parse)
+    workspace.refresh()
+    assert held == [True]
+    assert workspace.symbolicate("win", 0x44) == {"symbol": "g", "address": 0x40, "offset": 4}
+    assert workspace.symbolicate("win", 0x14)["symbol"] == "A::f"
+
+def test_symbols_in_platform_blocks():
+    file = broma.Broma("class A {\n    void a() = win 0x100;\n    win {\n        void b() = win 0x200;\n    }\n}\n")
+    assert symbols.collect([file]) == {"win": [(0x100, "A::a"), (0x200, "A::b")]}
+
+def test_platform_blocks_are_seen_by_every_consumer(tmp_path):
+    text = (
+        "class A {\n"
+        "    void foo() = win 0x10, mac 0x20;\n"
+        "    win {\n"
+        "        void bar() = win 0x10;\n"
+        "        void baz() {\n"
+        "        return;\n"
+        "        }\n"
+        "    }\n"
+        "}\n"
+        "\n"
+        "void g() = win 0x40;\n"
+    )
+    file = broma.Broma(text)
+    messages = [x.message for x in lint.lint_file(file)]
+    assert any("same win bind" in x for x in messages)
+    assert any("A::bar is not bound on mac" in x for x in messages)
+
+    sqlite_export.export_file(conn := sqlite_export.connect(tmp_path / "a.db"), "a.bro", file)
+    assert conn.execute("SELECT name, platforms FROM functions WHERE class_id IS NOT NULL ORDER BY position").fetchall() == \
+        [("foo", ""), ("bar", "win"), ("baz", "win")]
+    conn.close()
+
+    file.clear_offsets()
+    cleared = text.replace(" = win 0x10, mac 0x20", "").replace(" = win 0x10", "").replace(" = win 0x40", "")
+    assert file.dump() == broma.Broma(cleared).dump()
+
+def test_type_index_lines_follow_moved_classes():
+    text = "class A {\n    CCNode* m_node;\n}\n\nclass B {\n    void f(CCNode* x) = win 0x10;\n}\n"
+    file = broma.Broma(text, incremental=True, recover=True)
+    index = typeindex.TypeIndex({"a.bro": file})
+    assert [x.line for x in index.uses("CCNode")] == [1, 5]
+
+    new_text = "class Z {\n}\n\n" + text
+    file = file.reparse(new_text, (0, 0, len("class Z {\n}\n\n")))
+    assert index.update("a.bro", file) == 1
+    assert [x.line for x in index.uses("CCNode")] == [4, 8]
+    assert [x.line for x in index.unresolved()["CCNode"]] == [4, 8]
+
+# x86_64 code for verify-binds: functions at 0x00, 0x10 and 0x30, a push at 0x28 right after a `mov rdi, rax` and the
+# middle of an instruction at 0x31. Only 0x30 needs the binary to list it as a function start
+X86_CODE = (
+    b"\x55\x48\x89\xe5\x5d\xc3".ljust(0x10, b"\xcc") + b"\x55\xc3".ljust(0x10, b"\xcc")
+    + b"\x0f\x1f\x44\x00\x00\x48\x89\xc7\x55\xc3".ljust(0x10, b"\xcc") + b"\xb8\x01\x00\x00\x00\xc3".ljust(0x10, b"\xcc")
+)
+
+def _blob(size: int, parts: dict[int, bytes]) -> bytes:
+    out = bytearray(size)
+    for offset, part in parts.items():
+        out[offset:offset + len(part)] = part
+    return bytes(out)
+
+def _elf_fixture(starts_from: str) -> tuple[bytes, int]:
+    cie = struct.pack("<IB", 0, 1) + b"zR\0" + bytes([1, 0x78, 16, 1, 0x1b]) + b"\0" * 2
+    fde_pos = 0x2000 + 4 + len(cie)
+    fde = struct.pack("<IiIB", 4 + len(cie) + 4, 0x1030 - (fde_pos + 8), 6, 0) + b"\0" * 3
+    eh_frame = struct.pack("<I", len(cie)) + cie + struct.pack("<I", len(fde)) + fde + b"\0" * 4
+    symtab = bytes(24) + struct.pack("<IBBHQQ", 0, 0x12, 0, 1, 0x1030, 6)
+    names = b"\0.text\0.eh_frame\0.symtab\0.shstrtab\0"
+    sections = [
+        bytes(64),
+        struct.pack("<IIQQQQIIQQ", 1, 1, 0x6, 0x1000, 0x100, len(X86_CODE), 0, 0, 16, 0),
+        struct.pack("<IIQQQQIIQQ", 7, 1, 0x2, 0x2000, 0x200, len(eh_frame) if starts_from == "eh_frame" else 0, 0, 0, 8, 0),
+        struct.pack("<IIQQQQIIQQ", 17, 2, 0, 0, 0x300, len(symtab) if starts_from == "symtab" else 0, 0, 1, 8, 24),
+        struct.pack("<IIQQQQIIQQ", 25, 3, 0, 0, 0x400, len(names), 0, 0, 1, 0),
+    ]
+    header = b"\x7fELF\x02\x01\x01".ljust(16, b"\0") + struct.pack("<HHIQQQIHHHHHH", 3, 0x3e, 1, 0, 0, 0x500, 0, 64, 0, 0, 64, len(sections), 4)
+    return _blob(0x700, {0: header, 0x100: X86_CODE, 0x200: eh_frame, 0x300: symtab, 0x400: names, 0x500: b"".join(sections)}), 0x1000
+
+def _pe_fixture() -> tuple[bytes, int]:
+    optional = bytearray(240)
+    struct.pack_into("<H", optional, 0, 0x20b)
+    struct.pack_into("<I", optional, 108, 16)
+    struct.pack_into("<II", optional, 112 + 3 * 8, 0x2000, 24)
+    sections = [
+        struct.pack("<8sIIIIIIHHI", b".text", len(X86_CODE), 0x1000, len(X86_CODE), 0x400, 0, 0, 0, 0, 0x60000020),
+        struct.pack("<8sIIIIIIHHI", b".pdata", 24, 0x2000, 24, 0x600, 0, 0, 0, 0, 0x40000040),
+        struct.pack("<8sIIIIIIHHI", b".rdata", 0x20, 0x3000, 0x20, 0x800, 0, 0, 0, 0, 0x40000040),
+    ]
+    # the entry for 0x31 is chained, so it isn't a function start
+    pdata = struct.pack("<IIIIII", 0x1030, 0x1036, 0x3000, 0x1031, 0x1036, 0x3010)
+    header = b"PE\0\0" + struct.pack("<HHIIIHH", 0x8664, len(sections), 0, 0, 0, len(optional), 0) + optional + b"".join(sections)
+    return _blob(0x900, {0: b"MZ", 0x3c: struct.pack("<I", 0x40), 0x40: header, 0x400: X86_CODE, 0x600: pdata, 0x800: b"\x01", 0x810: b"\x21"}), 0x1000
+
+def _macho_fixture() -> tuple[bytes, int]:
+    segment = struct.pack("<II16sQQQQiiII", 0x19, 72 + 80, b"__TEXT", 0x100000000, 0x2000, 0, 0x2000, 5, 5, 1, 0)
+    segment += struct.pack("<16s16sQQIIIIIIII", b"__text", b"__TEXT", 0x100001000, len(X86_CODE), 0x1000, 4, 0, 0, 0x80000400, 0, 0, 0)
+    function_starts = struct.pack("<IIII", 0x26, 16, 0x1800, 8)
+    header = struct.pack("<IiiIIIII", 0xfeedfacf, 0x01000007, 3, 2, 2, len(segment) + len(function_starts), 0, 0)
+    return _blob(0x2000, {0: header + segment + function_starts, 0x1000: X86_CODE, 0x1800: b"\xb0\x20"}), 0x1000
+
+@pytest.mark.parametrize("platform, build", [
+    ("android64", lambda: _elf_fixture("symtab")),
+    ("android64", lambda: _elf_fixture("eh_frame")),
+    ("win", _pe_fixture),
+    ("mac", _macho_fixture),
+], ids=["elf-symtab", "elf-eh_frame", "pe", "macho"])
+def test_verify_binds_against_function_starts(tmp_path, platform, build):
+    data, base = build()
+    (tmp_path / "binary").write_bytes(data)
+    binds = [(f"f{x:x}", base + x, -1) for x in (0x00, 0x10, 0x28, 0x30, 0x31)]
+    assert [x.offset - base for x in binverify.verify_platform(platform, tmp_path / "binary", binds)] == [0x28, 0x31]
+
+def test_lsp_survives_a_failing_notification():
+    out = io.BytesIO()
+    server = lsp.LanguageServer(io.BytesIO(), out)
+    # a didOpen without its text fails in the handler
+    server.handle({"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///a.bro"}}})
+    assert b'"method":"window/logMessage"' in out.getvalue()
+    assert server.running
+
+    text = "class A {\n    PAD = win 0x;\n}\n"
+    server.handle({"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///b.bro", "text": text}}})
+    assert [x["message"] for x in server.documents["file:///b.bro"].syntax_errors] == ["invalid pad offset: 0x"]
+
+def test_lint_classes_with_the_same_name():
+    first = broma.Broma("class A {\n    void f() = win 0x10;\n    void g() = win 0x10;\n}\n")
+    second = broma.Broma("class A {\n    void f() = win 0x10;\n    void g() = win 0x20;\n}\n")
+    diagnostics = lint.lint_file(broma.merge([first, second]))
+    assert [x.rule for x in diagnostics] == ["duplicate-binds"]
+
+def test_query_global_functions_and_pointer_return_types():
+    file = broma.Broma("class A {\n    CCNode * node() = win 0x10;\n    void take(CCNode * x) = win 0x20;\n}\n\nCCNode* globalNode() = win 0x30;\n")
+    index = query.QueryIndex([file])
+    assert [x.describe() for x in index.query("ret:CCNode*")] == ["A::CCNode * node() = win 0x10", "CCNode* globalNode() = win 0x30"]
+    assert [x.part.name for x in index.query('ret:"CCNode *" or arg:"CCNode *"')] == ["node", "take", "globalNode"]
+    assert [x.part.name for x in index.query("!class~.")] == ["globalNode"]
+
+@pytest.mark.parametrize("declaration, type, name", [
+    ("gd::vector<int>::iterator it", "gd::vector<int>::iterator", "it"),
+    ("gd::map<int, Foo*>::const_iterator const& it", "gd::map<int, Foo*>::const_iterator const&", "it"),
+    ("int (&arr)[4]", "int (&)[4]", "arr"),
+    ("uint8_t m_data[4]", "uint8_t[4]", "m_data"),
+    ("Foo *x", "Foo*", "x"),
+])
+def test_split_variable(declaration, type, name):
+    assert broma.split_variable(declaration) == (type, name)
+    assert broma.split_variable(cpptype.join_declaration(type, name)) == (type, name)
+
+def test_nested_names_and_array_references_keep_their_names():
+    file = broma.Broma("class A {\n    gd::vector<int>::iterator m_it;\n    void f(int (&arr)[4], gd::vector<int>::iterator it) = win 0x10;\n}\n")
+    member, func = file.classes[0].parts
+    assert (member.type, member.name) == ("gd::vector<int>::iterator", "m_it")
+    assert [name for _, name in func.args] == ["arr", "it"]
+    assert broma.Broma(file.dump()).dump() == file.dump()
+    assert "void f(int (&arr)[4], gd::vector<int>::iterator it) = win 0x10;" in file.dump()
+
+def test_unknown_profile_option_is_a_usage_error(capsys):
+    with pytest.raises(SystemExit) as e:
+        profiling.start_from_argv(["dump", "--profile=bogus", "a.bro"])
+    assert e.value.code == 2
+    assert "unknown profile option 'bogus'" in capsys.readouterr().err
+    assert not profiling.is_enabled()
@@ -0,0 +1,200 @@
+# Change timelines of every class, function and member across the versions of a history store (see history.py),
+# for questions like "in which version did PlayLayer::resetLevel's win offset change" or "when did this member appear"
+# Run as: python cli.py history log <store> <symbol> [--field win] [--at version]
+#
+# Symbols are `Class`, `Class::function(arg types)`, `Class::m_member` and `function(arg types)` for global functions.
+# Tracked fields are "declaration" for classes, "signature", "body" and one per bound platform for functions, and
+# "type" for members. A timeline holds the versions where a field changed and its new value, NULL once it's gone.
+#
+# Timelines are kept in the history database and updated incrementally: only versions added since the last update are
+# processed, and of those only the classes whose key differs from the previous version are decoded and compared.
+# The value of a field at some version is found by bisecting the versions it changed in.
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+from dataclasses import dataclass
+
+import broma
+import history
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timeline_versions (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    digest BLOB NOT NULL -- of the class and global keys of the version, to notice when it was replaced
+);
+CREATE TABLE IF NOT EXISTS timeline (
+    symbol TEXT NOT NULL,
+    field TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT, -- NULL when the symbol (or field) is gone from this version on
+    PRIMARY KEY (symbol, field, position)
+) WITHOUT ROWID;
+"""
+
+def function_symbol(cls_name: str | None, func: broma.BromaFunction) -> str:
+    name = f"{func.name}({', '.join(type for type, _ in func.args)})"
+    return f"{cls_name}::{name}" if cls_name else name
+
+def function_fields(func: broma.BromaFunction) -> dict[str, str]:
+    out = {"signature": func.get_signature()}
+    if func.inlined_body:
+        out["body"] = hashlib.blake2b(func.inlined_body.encode(), digest_size=8).hexdigest()
+    for platform, offset in func.binds.items():
+        out[platform] = "inline" if offset is None else hex(offset)
+    return out
+
+# symbol -> field -> value for a class and everything in it. Duplicates keep the first one.
+def class_fields(cls: broma.BromaClass) -> dict[str, dict[str, str]]:
+    declaration = f"class {cls.name}"
+    if cls.bases:
+        declaration += f" : {', '.join(cls.bases)}"
+    if cls.attributes:
+        declaration = f"[[{', '.join(cls.attributes)}]] {declaration}"
+
+    out = {cls.name: {"declaration": declaration}}
+    for part, _ in cls.walk_parts():
+        if isinstance(part, broma.BromaFunction):
+            out.setdefault(function_symbol(cls.name, part), function_fields(part))
+        elif isinstance(part, broma.BromaMember):
+            out.setdefault(f"{cls.name}::{part.name}", {"type": part.type})
+
+    return out
+
+@dataclass
+class Change:
+    version: str
+    symbol: str
+    field: str
+    old: str | None
+    new: str | None
+
+    def format(self) -> str:
+        if self.old is None:
+            return f"{self.version}: {self.symbol} {self.field} added: {self.new}"
+        if self.new is None:
+            return f"{self.version}: {self.symbol} {self.field} removed (was {self.old})"
+        return f"{self.version}: {self.symbol} {self.field} {self.old} -> {self.new}"
+
+class Timeline:
+    def __init__(self, store: history.HistoryStore) -> None:
+        self.store = store
+        self.conn = store.conn
+        self.conn.executescript(SCHEMA)
+
+    def _digest(self, version: str) -> bytes:
+        keys = b"".join(key for _, key in self.store.class_keys(version)) + b"|" + b"".join(self.store.global_keys(version))
+        return hashlib.blake2b(keys, digest_size=16).digest()
+
+    def processed(self) -> list[str]:
+        return [x for x, in self.conn.execute("SELECT name FROM timeline_versions ORDER BY position")]
+
+    def _changes(self, position: int, old: dict[str, dict[str, str]], new: dict[str, dict[str, str]]) -> list[tuple]:
+        rows = []
+        for symbol in old.keys() | new.keys():
+            old_fields, new_fields = old.get(symbol, {}), new.get(symbol, {})
+            for field in old_fields.keys() | new_fields.keys():
+                if old_fields.get(field) != new_fields.get(field):
+                    rows.append((symbol, field, position, new_fields.get(field)))
+        return rows
+
+    # processes the versions added since the last update, returns how many there were. Starts over when versions
+    # were added, removed or replaced in the middle of the history.
+    def update(self) -> int:
+        versions = [x.name for x in self.store.versions()]
+        done = self.conn.execute("SELECT name, digest FROM timeline_versions ORDER BY position").fetchall()
+
+        if [name for name, _ in done] != versions[:len(done)] or any(self._digest(name) != digest for name, digest in done):
+            with self.conn:
+                self.conn.execute("DELETE FROM timeline")
+                self.conn.execute("DELETE FROM timeline_versions")
+            done = []
+
+        previous_classes: dict[str, bytes] = {}
+        previous_globals: list[bytes] = []
+        if done:
+            previous_classes = self._first_keys(self.store.class_keys(done[-1][0]))
+            previous_globals = self.store.global_keys(done[-1][0])
+
+        for position in range(len(done), len(versions)):
+            name = versions[position]
+            classes = self._first_keys(self.store.class_keys(name))
+            globals = self.store.global_keys(name)
+
+            # a class with the same key as in the previous version didn't change at all
+            changed = [x for x in classes.keys() | previous_classes.keys() if classes.get(x) != previous_classes.get(x)]
+            loaded = self.store.load_classes(
+                [classes[x] for x in changed if x in classes] + [previous_classes[x] for x in changed if x in previous_classes]
+            )
+
+            rows = []
+            for cls_name in changed:
+                old = class_fields(loaded[previous_classes[cls_name]]) if cls_name in previous_classes else {}
+                new = class_fields(loaded[classes[cls_name]]) if cls_name in classes else {}
+                rows += self._changes(position, old, new)
+
+            if globals != previous_globals:
+                old, new = {}, {}
+                for fields, keys in ((old, previous_globals), (new, globals)):
+                    for func in self.store.load_functions(keys):
+                        fields.setdefault(function_symbol(None, func), function_fields(func))
+                rows += self._changes(position, old, new)
+
+            with self.conn:
+                self.conn.executemany("INSERT INTO timeline VALUES (?, ?, ?, ?)", rows)
+                self.conn.execute("INSERT INTO timeline_versions VALUES (?, ?, ?)", (position, name, self._digest(name)))
+
+            previous_classes, previous_globals = classes, globals
+
+        return len(versions) - len(done)
+
+    @staticmethod
+    def _first_keys(rows: list[tuple[str, bytes]]) -> dict[str, bytes]:
+        out = {}
+        for name, key in rows:
+            out.setdefault(name, key)
+        return out
+
+    # the symbols matching `symbol`: itself, or every overload when it's a function name without arguments
+    def symbols(self, symbol: str) -> list[str]:
+        return [x for x, in self.conn.execute(
+            # '(' and ')' are next to each other, so this is a range over the overloads
+            "SELECT DISTINCT symbol FROM timeline WHERE symbol = ? OR (symbol > ? AND symbol < ?) ORDER BY symbol",
+            (symbol, symbol + "(", symbol + ")"),
+        )]
+
+    # every change of a symbol (and its overloads), by version
+    def changes(self, symbol: str, field: str | None = None) -> list[Change]:
+        names = self.processed()
+        out = []
+        for name in self.symbols(symbol):
+            query = "SELECT field, position, value FROM timeline WHERE symbol = ?"
+            args = (name,)
+            if field is not None:
+                query += " AND field = ?"
+                args += (field,)
+
+            previous: dict[str, str | None] = {}
+            for row_field, position, value in self.conn.execute(query + " ORDER BY field, position", args):
+                out.append(Change(names[position], name, row_field, previous.get(row_field), value))
+                previous[row_field] = value
+
+        order = {name: idx for idx, name in enumerate(names)}
+        out.sort(key=lambda x: (order[x.version], x.symbol, x.field))
+        return out
+
+    # the value of a field at a version, and the version that set it. (None, None) if it never had one until then.
+    def value_at(self, symbol: str, field: str, version: str) -> tuple[str | None, str | None]:
+        names = self.processed()
+        if version not in names:
+            raise KeyError(f"no version named '{version}'")
+
+        rows = self.conn.execute("SELECT position, value FROM timeline WHERE symbol = ? AND field = ? ORDER BY position", (symbol, field)).fetchall()
+        idx = bisect.bisect_right([position for position, _ in rows], names.index(version)) - 1
+        if idx < 0:
+            return None, None
+
+        position, value = rows[idx]
+        return value, names[position]
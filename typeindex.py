@@ -0,0 +1,208 @@
+# Reverse index from type names to everywhere they are used: function arguments, return types and members
+# Run as: python cli.py uses <type> <files...> [--exact] [--json]
+#     or: python cli.py unresolved-types <files...> [--known name]
+#
+# Every type is parsed (see cpptype.py) and broken down into the names in it, without qualifiers, pointers and
+# references, so `gd::vector<GJGameLevel*> const&` is a use of both `gd::vector` and `GJGameLevel`. Names are looked
+# up the way C++ would from inside the class that uses them, `CCNode` in `cocos2d::CCLayer` is `cocos2d::CCNode` if
+# there's such a class. A name is unresolved when it isn't a class in any of the indexed files, a builtin or in KNOWN_TYPES.
+#
+# The index is built in one pass and kept per class. Updating it with a new parse of a file only indexes the classes
+# that aren't in the old parse, so after an incremental reparse (see `Broma.reparse`) only changed classes are visited.
+# Kept classes may have moved (see `BromaClass.move_to`), so the index stores lines relative to the start of the class
+# and the usages it returns are rebased on where the class is now.
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import Iterable
+
+import broma
+import cpptype
+from query import normalize_type
+
+# types that come from outside the bindings, and aren't reported as unresolved
+KNOWN_TYPES = {
+    "size_t", "ptrdiff_t", "intptr_t", "uintptr_t", "int8_t", "int16_t", "int32_t", "int64_t",
+    "uint8_t", "uint16_t", "uint32_t", "uint64_t", "TodoReturn",
+    "gd::string", "gd::vector", "gd::map", "gd::set", "gd::unordered_map", "gd::unordered_set", "gd::pair",
+    "gd::list", "gd::deque", "std::string", "std::vector", "std::map", "std::set", "std::unordered_map",
+    "std::unordered_set", "std::pair", "std::array", "std::function", "std::string_view",
+}
+
+_WORD = re.compile(r"[A-Za-z_]\w*(?:\s*::\s*[A-Za-z_]\w*)*")
+
+# the names used in a type, in order: `gd::map<int, GJGameLevel*> const&` -> ["gd::map", "int", "GJGameLevel"]
+def type_names(type: str) -> list[str]:
+    try:
+        return list(cpptype.parse_type(type).names())
+    except cpptype.CppTypeError:
+        pass
+
+    # not a type cpptype understands, take every word that isn't a keyword
+    words = ("".join(x.group().split()) for x in _WORD.finditer(type))
+    return [x for x in words if x not in cpptype.CV and x not in cpptype.ELABORATIONS]
+
+def is_builtin(name: str) -> bool:
+    return all(x in cpptype.BUILTINS for x in name.split(" "))
+
+# whether two spellings are the same type, `const Foo&` is `Foo const&`
+def same_type(a: str, b: str) -> bool:
+    try:
+        return cpptype.parse_type(a) == cpptype.parse_type(b)
+    except cpptype.CppTypeError:
+        return normalize_type(a) == normalize_type(b)
+
+@dataclass
+class Usage:
+    name: str # the type name as written, e.g. "CCNode"
+    type: str # the whole type it's in, e.g. "gd::vector<CCNode*> const&"
+    kind: str # "arg", "ret" or "member"
+    cls: str | None # class it's in, None for global functions
+    symbol: str # function or member name
+    line: int = -1 # 0-based
+    arg: int = -1 # argument index for "arg"
+    platforms: list[str] | None = None # of the platform block it's in
+
+    def describe(self) -> str:
+        symbol = f"{self.cls}::{self.symbol}" if self.cls else self.symbol
+        only = f" ({', '.join(self.platforms)} only)" if self.platforms else ""
+        if self.kind == "arg":
+            return f"{symbol} argument {self.arg + 1}: {self.type}{only}"
+        if self.kind == "ret":
+            return f"{symbol} returns {self.type}{only}"
+        return f"{symbol}: {self.type}{only}"
+
+def _usages(type: str, kind: str, cls: str | None, symbol: str, line: int, arg: int = -1, platforms: list[str] | None = None) -> list[Usage]:
+    type = normalize_type(type)
+    return [Usage(x, type, kind, cls, symbol, line, arg, platforms) for x in dict.fromkeys(type_names(type))]
+
+def function_usages(func: broma.BromaFunction, cls: str | None = None, platforms: list[str] | None = None) -> list[Usage]:
+    out = _usages(func.ret_type, "ret", cls, func.name, func.line, platforms=platforms) if func.ret_type else []
+    for idx, type in enumerate(func.get_arg_types()):
+        out += _usages(type, "arg", cls, func.name, func.line, idx, platforms)
+    return out
+
+# the usages in a class, including the ones in its platform blocks
+def class_usages(cls: broma.BromaClass) -> list[Usage]:
+    out = []
+    for part, platforms in cls.walk_parts():
+        if isinstance(part, broma.BromaFunction):
+            out += function_usages(part, cls.name, platforms)
+        elif isinstance(part, broma.BromaMember):
+            out += _usages(part.type, "member", cls.name, part.name, part.line, platforms=platforms)
+    return out
+
+class TypeIndex:
+    def __init__(self, files: dict[str, broma.Broma] | None = None, known: Iterable[str] = ()) -> None:
+        self.known = KNOWN_TYPES | set(known)
+        # file -> id(class) -> (class, its usages with lines relative to the class). The class is kept so its id
+        # can't be reused
+        self._classes: dict[str, dict[int, tuple[broma.BromaClass, list[Usage]]]] = {}
+        self._globals: dict[str, list[Usage]] = {}
+        self._class_names: Counter[str] = Counter()
+        # last component of a name -> (file, id(class) or None for globals) -> usages of names ending with it
+        self._postings: dict[str, dict[tuple[str, int | None], list[Usage]]] = {}
+
+        for name, file in (files or {}).items():
+            self.update(name, file)
+
+    def _add(self, key: tuple[str, int | None], usages: list[Usage]):
+        for usage in usages:
+            self._postings.setdefault(usage.name.rpartition("::")[2], {}).setdefault(key, []).append(usage)
+
+    def _remove(self, key: tuple[str, int | None], usages: list[Usage]):
+        for usage in usages:
+            posting = self._postings.get(usage.name.rpartition("::")[2])
+            if posting is not None and posting.pop(key, None) is not None and not posting:
+                del self._postings[usage.name.rpartition("::")[2]]
+
+    # indexes a new parse of the file called `name`, returns how many classes had to be indexed
+    def update(self, name: str, file: broma.Broma) -> int:
+        old = self._classes.pop(name, {})
+        new = {}
+        indexed = 0
+        for cls in file.classes:
+            entry = old.pop(id(cls), None)
+            if entry is None or entry[0] is not cls:
+                usages = class_usages(cls)
+                for usage in usages:
+                    if usage.line != -1:
+                        usage.line -= cls.start_line
+                entry = (cls, usages)
+                self._add((name, id(cls)), entry[1])
+                self._class_names[cls.name] += 1
+                indexed += 1
+            new[id(cls)] = entry
+
+        self._drop(name, old)
+        self._classes[name] = new
+
+        # there are few global functions, they are indexed again every time
+        self._remove((name, None), self._globals.pop(name, []))
+        self._globals[name] = [x for func in file.global_functions for x in function_usages(func)]
+        self._add((name, None), self._globals[name])
+        return indexed
+
+    def _drop(self, name: str, classes: dict[int, tuple[broma.BromaClass, list[Usage]]]):
+        for cls_id, (cls, usages) in classes.items():
+            self._remove((name, cls_id), usages)
+            self._class_names[cls.name] -= 1
+            if not self._class_names[cls.name]:
+                del self._class_names[cls.name]
+
+    def remove(self, name: str):
+        self._drop(name, self._classes.pop(name, {}))
+        self._remove((name, None), self._globals.pop(name, []))
+
+    # the usages under a posting key, with their lines in the file as it is now
+    def _rebased(self, key: tuple[str, int | None], usages: list[Usage]) -> list[Usage]:
+        if key[1] is None:
+            return usages
+        start = self._classes[key[0]][key[1]][0].start_line
+        return [replace(x, line=x.line + start) if x.line != -1 else x for x in usages]
+
+    def is_class(self, name: str) -> bool:
+        return name in self._class_names
+
+    # what a name used inside `cls` refers to: the class in the innermost enclosing scope that has it, or the name
+    # itself when it's known or builtin. None if it doesn't resolve to anything.
+    def resolve(self, name: str, cls: str | None = None) -> str | None:
+        if cls:
+            scopes = cls.split("::")
+            for idx in range(len(scopes), 0, -1):
+                candidate = "::".join(scopes[:idx]) + "::" + name
+                if candidate in self._class_names:
+                    return candidate
+
+        if name in self._class_names or name in self.known or is_builtin(name):
+            return name
+        return None
+
+    # every usage of a type, by its fully qualified name (or as it's written, for unresolved ones). Qualifiers,
+    # pointers and references are ignored, so `GJGameLevel*` is the same as `GJGameLevel`, unless `exact` is set
+    def uses(self, type: str, exact: bool = False) -> list[Usage]:
+        names = type_names(type)
+        if not names:
+            return []
+
+        target = self.resolve(names[0]) or names[0]
+        out = []
+        for key, usages in self._postings.get(target.rpartition("::")[2], {}).items():
+            out += [x for x in self._rebased(key, usages) if (x.name == target or target.endswith("::" + x.name)) and (self.resolve(x.name, x.cls) or x.name) == target]
+        if exact:
+            out = [x for x in out if same_type(x.type, type)]
+        out.sort(key=lambda x: (x.cls or "", x.line, x.arg))
+        return out
+
+    # names that don't resolve to a class, builtin or known type, with where they are used
+    def unresolved(self) -> dict[str, list[Usage]]:
+        out: dict[str, list[Usage]] = {}
+        for posting in self._postings.values():
+            for key, usages in posting.items():
+                for usage in self._rebased(key, usages):
+                    if self.resolve(usage.name, usage.cls) is None:
+                        out.setdefault(usage.name, []).append(usage)
+        return dict(sorted(out.items()))
@@ -1,10 +1,13 @@
 # Merges two broma files i think
 # NOTE: unfinished, dont use it
 import broma
+import profiling
 import sys
 import copy
 from pathlib import Path
 
+profiling.start_from_argv()
+
 if len(sys.argv) != 4:
     print(f"Usage: {sys.argv[0]} <old_broma> <new_broma> <output>")
     exit(0)
@@ -1,8 +1,14 @@
+import re
+
 try:
     import colored
 except ImportError:
     colored = None
 
+# removes ansi color codes added by `color`
+def strip_colors(text: str) -> str:
+    return re.sub(r"\x1b\[[0-9;]*m", "", text)
+
 class color:
     if colored:
         def green(text: str) -> str:
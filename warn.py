@@ -1,69 +1,58 @@
 # Parses broma files and shows warnings
-# Run as: python warn.py <files...>
-# aaa mongus this does not work yet
+# Run as: python warn.py [--cache file] [--per-file [-j jobs]] <files...>
+# The checks themselves live in lint.py. All files are checked as one merged file, unless --per-file is given.
 
+import argparse
 import broma
+import lint
+import profiling
 import sys
 from pathlib import Path
+from typing import Iterable
 import utils
 
-bromas = []
-
-first_file = Path(sys.argv[1])
-if first_file.exists() and first_file.is_dir():
-    for file in first_file.iterdir():
-        bromas.append(broma.parse(file))
-else:
-    for file in sys.argv[1:]:
-        bromas.append(broma.parse(file))
-
-merged = broma.merge(bromas)
-
-def warn(text: str) -> str:
-    print(utils.color.yellow('! WARN: ' + text))
-
-def minor_warn(text: str) -> str:
-    print(utils.color.yellow('NOTE: ' + text))
-
-def get_all_overloads(file: broma.Broma, cls: broma.BromaClass) -> dict[str, list[broma.BromaFunction]]:
-    overloads = {}
-
-    for basestr in cls.bases:
-        base = file.find_class(basestr)
-        if not base:
-            continue
-
-        for name, funcs in get_all_overloads(file, base).items():
-            if name not in overloads:
-                overloads[name] = []
-
-            overloads[name].extend(funcs)
-
-    for part in cls.parts:
-        if not isinstance(part, broma.BromaFunction):
-            continue
-
-        overloads.get(part.name, []).append(part)
-
-    return overloads
-
-
-for cls in merged.classes:
-    overloads = get_all_overloads(merged, cls)
-
-    for name, funcs in overloads.items():
-        if len(funcs) > 1:
-            has_virtual = False
-            has_non_virtual = False
-
-            for func in funcs:
-                if 'virtual' in func.attrs:
-                    has_virtual = True
-                else:
-                    has_non_virtual = True
-
-            if has_virtual and has_non_virtual:
-                warn(f"{cls.name}::{func} has overloads both virtual and non-virtual overloads")
-                warn("This can cause to incorrect vtable generation, check the vtable manually")
-
-# write it to a file
+def format_diagnostic(diagnostic: lint.Diagnostic) -> str:
+    if diagnostic.severity == "note":
+        return utils.color.yellow('NOTE: ' + diagnostic.format())
+
+    return utils.color.yellow('! WARN: ' + diagnostic.format())
+
+# returns the formatted warnings for a parsed file
+# `known` are classes defined in other files, see `lint.LintContext`
+def collect_warnings(file: broma.Broma, cache: lint.LintCache | None = None, known: Iterable[str] = ()) -> list[str]:
+    return [format_diagnostic(x) for x in lint.lint_file(file, cache, known)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints suspicious things that are detected in broma files",
+                                     epilog="--profile[=options] prints where the time went, see profiling.py")
+    parser.add_argument("files", nargs="+", help="files or directories")
+    parser.add_argument("--cache", type=Path, help="file to keep results in, only changed classes are checked again")
+    parser.add_argument("--per-file", action="store_true", help="check every file on its own, in parallel. Bases are still "
+                        "looked up in all files, but overloads are only found in the same file")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="number of worker processes with --per-file (default: one per cpu)")
+    args = parser.parse_args(profiling.start_from_argv())
+    if profiling.is_enabled():
+        # worker processes are not instrumented
+        args.jobs = 1
+
+    paths = []
+    for file in args.files:
+        path = Path(file)
+        paths += sorted(path.iterdir()) if path.is_dir() else [path]
+
+    cache = lint.LintCache.load(args.cache) if args.cache else lint.LintCache()
+
+    if args.per_file:
+        results = lint.lint_paths(paths, cache, args.jobs)
+    else:
+        results = {Path("<merged>"): lint.lint_file(broma.merge([broma.parse(x, mapped=True) for x in paths]), cache)}
+
+    for path, diagnostics in results.items():
+        for diagnostic in diagnostics:
+            print(f"{path}: {format_diagnostic(diagnostic)}" if args.per_file else format_diagnostic(diagnostic))
+
+    if args.cache:
+        cache.save(args.cache)
+
+if __name__ == "__main__":
+    main()
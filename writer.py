@@ -0,0 +1,75 @@
+# Writing the output of the tools that rewrite files
+#
+# A file is only written when its content changes, so unchanged files keep their mtime and don't trigger rebuilds
+# downstream. Writes go to a temporary file next to the destination that is then renamed over it, so a file is never
+# left half written. With `check`, nothing is written and the result only says whether the file would change,
+# for `--check` in CI.
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# the bytes `Path.write_text` would have written
+def encode(text: str) -> bytes:
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode("utf-8")
+
+def is_unchanged(path: Path, data: bytes) -> bool:
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except FileNotFoundError:
+        return False
+
+# the permissions a new file gets from `open`, mkstemp always uses 0600
+def _default_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def write_atomic(path: Path, data: bytes):
+    fd, temp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        # keep the permissions of the file being replaced
+        if path.exists():
+            os.chmod(temp, path.stat().st_mode & 0o7777)
+        else:
+            os.chmod(temp, _default_mode())
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+# writes `text` to `path` unless it's already there. Returns whether the file changed (or would change, with `check`)
+def write_output(path: Path | str, text: str, check: bool = False) -> bool:
+    path = Path(path)
+    data = encode(text)
+    if is_unchanged(path, data):
+        return False
+
+    if not check:
+        write_atomic(path, data)
+    return True
+
+# for the single file scripts: takes `--check` out of the arguments
+def check_from_argv() -> bool:
+    if "--check" not in sys.argv:
+        return False
+
+    sys.argv.remove("--check")
+    return True
+
+# for the single file scripts: writes, or in check mode reports and exits with 1 if the file would change
+def finish(path: Path | str, text: str, check: bool):
+    changed = write_output(path, text, check)
+    if check and changed:
+        print(f"{path} would change")
+        sys.exit(1)